@@ -0,0 +1,78 @@
+"""Compare event callback dispatch: a task per callback against CallbackExecutor.
+
+Fires a burst of events across many sessions, alternating 'pause' and 'resume'
+for each, to a handler awaiting a random few milliseconds like one doing a request.
+Measures the peak number of tasks alive, how many events ran out of order within
+their session, how long the burst took to drain and how long events waited before
+their handler started (measured, not read off the executor's histogram), printing
+results as JSON. The executor runs once per --workers value.
+
+Bounding and ordering have a cost in throughput: a task per callback runs every
+handler at once, the executor runs --workers at a time, one event of a session
+after the other. A burst drains in about events x handler time / workers, at best.
+
+    python -m benchmarks.callbacks --sessions 500 --events 20 --workers 32 --workers 256
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from typing import Callable, Dict, List
+
+from pytgcalls.callback_executor import CallbackExecutor
+
+from .load import latencies
+
+async def burst(sessions:int, events:int, dispatch:Callable[[str, dict], None], handled:Dict[str, List[int]]) -> dict:
+    peak = 0
+    start = time.perf_counter()
+    for seq in range(events): # all at once, like packets read in one go
+        for i in range(sessions):
+            dispatch(f'chat-{i}', {'event': 'pause' if seq % 2 else 'resume', 'seq': seq, 'sent': start})
+    while sum(map(len, handled.values())) < sessions * events:
+        peak = max(peak, len(asyncio.all_tasks()))
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    reordered = sum(
+        sum(1 for a, b in zip(seqs, seqs[1:]) if b < a) for seqs in handled.values()
+    )
+    return {'peak_tasks': peak, 'reordered': reordered, 'drain_ms': elapsed * 1000}
+
+async def run(mode:str, sessions:int, events:int, workers:int) -> dict:
+    handled : Dict[str, List[int]] = { f'chat-{i}': [] for i in range(sessions) }
+    delays : List[float] = []
+
+    async def handler(packet:dict) -> None:
+        delays.append(time.perf_counter() - packet['sent'])
+        await asyncio.sleep(random.uniform(0, 0.005))
+        handled[packet['sid']].append(packet['seq'])
+
+    if mode == 'tasks':
+        def dispatch(sid:str, packet:dict) -> None:
+            asyncio.get_event_loop().create_task(handler({**packet, 'sid': sid}))
+    else:
+        executor = CallbackExecutor(workers)
+        def dispatch(sid:str, packet:dict) -> None:
+            executor.submit(sid, packet['event'], [handler], {**packet, 'sid': sid})
+
+    result = await burst(sessions, events, dispatch, handled)
+    result['queue_delay'] = latencies(delays)
+    if mode == 'executor':
+        result['workers'] = workers
+    return {'mode': mode, 'sessions': sessions, 'events': events, **result}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=500)
+    parser.add_argument('--events', type=int, default=20, help="events per session")
+    parser.add_argument('--workers', type=int, action='append', help="executor workers, 32 by default")
+    args = parser.parse_args()
+    results = [ asyncio.run(run('tasks', args.sessions, args.events, 0)) ]
+    for workers in args.workers or [32]:
+        results.append(asyncio.run(run('executor', args.sessions, args.events, workers)))
+    print(json.dumps({'benchmark': 'callbacks', 'results': results}, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Measure call placement across accounts, and moving calls off a rate limited one.
+
+Joins --calls calls through a Cluster of --accounts fake clients, each account a
+member of a random share (--membership) of the chats, against the fake core.
+Reports how long the joins took and how calls spread over the accounts. Then the
+busiest account gets a FLOOD_WAIT on a volume change and its calls move to the
+others: reports how long that took, how many moved and how many stayed.
+Prints results as JSON.
+
+    python -m benchmarks.cluster --accounts 4 --calls 200 --membership 0.5
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+from pytgcalls.js_core import INSTANCE as JSC
+from pytgcalls.cluster import Cluster
+
+from .fakes import FakeClient, core_command
+from .load import chat_ids
+
+async def run(args:argparse.Namespace) -> dict:
+    JSC.set_command(core_command(join_ms=args.join_ms))
+    rand = random.Random(args.seed)
+    chats = chat_ids(args.calls)
+    members = [ set() for _ in range(args.accounts) ]
+    for chat_id in chats: # at least one member each
+        for i in {rand.randrange(args.accounts)} | { i for i in range(args.accounts) if rand.random() < args.membership }:
+            members[i].add(chat_id)
+    clients = [ FakeClient(args.rpc_ms, user_id=i + 1, chats=members[i]) for i in range(args.accounts) ]
+    cluster = Cluster(clients, max_calls=args.max_calls, move_after=30, workers=args.workers)
+    with tempfile.NamedTemporaryFile(suffix='.raw') as source:
+        source.write(bytes(48000 * 2 * 60))
+        source.flush()
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(cluster.join_group_call(chat_id, source.name) for chat_id in chats), return_exceptions=True,
+        )
+        join_ms = (time.perf_counter() - start) * 1000
+        placed = [ len(account.calls) for account in cluster.accounts ]
+
+        busiest = max(cluster.accounts, key=lambda account: len(account.calls))
+        before = len(busiest.calls)
+        clients[busiest.index].floods['EditGroupCallParticipant'] = 300
+        volume = cluster.set_volume(next(iter(busiest.calls)), 50) # waits for the flood wait, never awaited
+        while not busiest.evacuating:
+            await asyncio.sleep(0.001)
+        while busiest.evacuating:
+            await asyncio.sleep(0.001)
+        move_ms = (time.monotonic() - busiest.limiter.floods[-1][0]) * 1000
+        volume.cancel()
+        stayed = len(busiest.calls)
+        await asyncio.gather(*(cluster.leave_group_call(chat_id) for chat_id in list(cluster.calls)), return_exceptions=True)
+    return {
+        'accounts': args.accounts,
+        'calls': args.calls,
+        'joined': sum(not isinstance(r, BaseException) for r in results),
+        'failed': sum(isinstance(r, BaseException) for r in results),
+        'join_all_ms': join_ms,
+        'calls_per_account': placed,
+        'flooded_account_calls': before,
+        'moved': before - stayed,
+        'stayed': stayed,
+        'move_ms': move_ms,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--accounts', type=int, default=4)
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--membership', type=float, default=0.5, help="share of the chats each account is in")
+    parser.add_argument('--max-calls', type=int, default=None, help="calls per account")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="fake cores")
+    parser.add_argument('--join-ms', type=float, default=50.0, help="time the fake core takes to connect")
+    parser.add_argument('--rpc-ms', type=float, default=20.0, help="time the fake clients take per request")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps({'benchmark': 'cluster', 'results': [asyncio.run(run(args))]}, indent=2))
+
+if __name__ == '__main__':
+    main()
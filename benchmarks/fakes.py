@@ -0,0 +1,295 @@
+"""Stand-ins for the NodeJS core and for pyrogram, so that load tests run offline.
+
+The fake core speaks the stdio protocol of the real one: it acks every command
+after --ack-ms, asks Python to join for join_call like a real join (then takes
+--join-ms to connect), sends the worker wide status every second, emits bursts
+of --burst events to every joined session each --burst-every-ms and exits with
+an error after --crash-after commands. Point JSCore at it with core_command().
+Run on its own it waits for packets on stdin, mostly useful to try options:
+
+    python -m benchmarks.fakes --ack-ms 1 --join-ms 50 --burst 10
+
+FakeClient answers the requests calls make without any network, after rpc_ms,
+and dispatches raw updates to its handlers like a connected client does.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from pyrogram import ContinuePropagation
+from pyrogram.errors import FloodWait, UserNotParticipant
+from pyrogram.raw.functions.channels import GetFullChannel
+from pyrogram.raw.functions.phone import JoinGroupCall, LeaveGroupCall, EditGroupCallParticipant
+from pyrogram.raw.types import (
+    DataJSON, GroupCall, InputGroupCall, InputPeerChannel, InputPeerUser, UpdateGroupCall, UpdateGroupCallConnection,
+)
+
+from pytgcalls.codec import get_codec
+from pytgcalls.dispatcher import MAX_CHANNEL_ID
+
+STATUS_INTERVAL = 1.0
+
+# what the server answers JoinGroupCall with, a real core builds its remote description from it: ice-pwd needs 22
+# characters at least and DTLS a fingerprint. Nothing answers on the candidate
+TRANSPORT = {
+    'ufrag': 'fk3Z', 'pwd': 'q8Xv2Lr6TnW0sYc4Pj9Md1Ke',
+    'fingerprints': [{'hash': 'sha-256', 'setup': 'passive', 'fingerprint': ':'.join(['5A'] * 32)}],
+    'candidates': [{
+        'generation': '0', 'component': '1', 'protocol': 'udp', 'port': '9', 'ip': '127.0.0.1',
+        'foundation': '1', 'id': '1', 'priority': '2130706431', 'type': 'host', 'network': '1',
+    }],
+}
+
+def core_command(
+    ack_ms:float = 0.0,
+    join_ms:float = 0.0,
+    burst:int = 0,
+    burst_every_ms:float = 1000.0,
+    event:str = 'underrun',
+    crash_after:int = 0,
+) -> List[str]:
+    """Command line running the fake core, for JSCore.set_command or NodeWorker(command=...)"""
+    return [
+        sys.executable, '-m', 'benchmarks.fakes',
+        f'--ack-ms={ack_ms}', f'--join-ms={join_ms}', f'--burst={burst}', f'--burst-every-ms={burst_every_ms}',
+        f'--event={event}', f'--crash-after={crash_after}',
+    ]
+
+class FakeCore:
+    """The protocol side of the NodeJS core, without any audio"""
+    def __init__(self, args:argparse.Namespace):
+        self.args = args
+        self.codec = get_codec(args.codec)
+        self.joined : Dict[str, float] = {} # sessions in a call, and when playback started
+        self.paused : Dict[str, float] = {} # position of paused sessions
+        self.commands : int = 0
+        self.packet_count : int = 0
+        self.requests : Dict[int, asyncio.Future] = {}
+        self._outbox : List[bytes] = []
+
+    def send(self, packet:dict) -> None:
+        """Everything sent during the same loop iteration goes out in one write, like the real core"""
+        if not self._outbox:
+            asyncio.get_event_loop().call_soon(self._flush)
+        self._outbox.append(self.codec.encode(packet))
+
+    def _flush(self) -> None:
+        buf, self._outbox = b''.join(self._outbox), []
+        sys.stdout.buffer.write(buf)
+        sys.stdout.buffer.flush()
+
+    def ack(self, command:dict, **data:Any) -> None:
+        self.send({'result': 'OK', **data, '_': 'ack', 'sid': command['sid'], 'pid': command['pid']})
+
+    def status(self, sid:str, status:str, **data:Any) -> None:
+        self.send({**data, '_': 'status', 'sid': sid, 'pid': self._pid(), 'status': status})
+
+    def event(self, sid:str, event:str, **data:Any) -> None:
+        self.send({**data, '_': 'event', 'sid': sid, 'pid': self._pid(), 'event': event})
+
+    async def request(self, sid:str, request:str, data:dict) -> dict:
+        pid = self._pid()
+        self.requests[pid] = asyncio.get_event_loop().create_future()
+        self.send({'_': 'request', 'sid': sid, 'pid': pid, 'request': request, 'data': data})
+        try:
+            return await self.requests[pid]
+        finally:
+            self.requests.pop(pid, None)
+
+    def _pid(self) -> int:
+        self.packet_count += 1
+        return self.packet_count
+
+    def position(self, sid:str) -> float:
+        if sid in self.paused:
+            return self.paused[sid]
+        return time.monotonic() - self.joined[sid]
+
+    async def run(self) -> None:
+        loop = asyncio.get_event_loop()
+        reader = asyncio.StreamReader(limit=1 << 24)
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        loop.create_task(self._report())
+        if self.args.burst:
+            loop.create_task(self._bursts())
+        while True:
+            packet = await self.codec.read(reader)
+            if packet is None:
+                return
+            if packet.get('_') == 'response':
+                future = self.requests.get(packet['pid'])
+                if future and not future.done():
+                    future.set_result(packet)
+                continue
+            self.commands += 1
+            if self.args.crash_after and self.commands > self.args.crash_after:
+                self._flush()
+                os._exit(1)
+            if packet.get('action') == 'join_call' or self.args.ack_ms:
+                loop.create_task(self._handle(packet))
+            else: # acked right away, in order
+                self._command(packet)
+
+    async def _handle(self, packet:dict) -> None:
+        if packet.get('action') == 'join_call':
+            return await self._join(packet)
+        await asyncio.sleep(self.args.ack_ms / 1000)
+        self._command(packet)
+
+    async def _join(self, packet:dict) -> None:
+        sid = packet['sid']
+        if sid in self.joined:
+            return self.ack(packet, result='ALREADY_JOINED')
+        self.status(sid, 'joining')
+        start = time.monotonic()
+        response = await self.request(sid, 'join_call', {
+            'ufrag': 'fake', 'pwd': 'fake', 'hash': 'sha-256', 'setup': 'active',
+            'fingerprint': 'fake', 'source': len(self.joined) + 1, 'invite_hash': packet.get('invite_hash'),
+        })
+        request_ms = (time.monotonic() - start) * 1000
+        await asyncio.sleep(self.args.join_ms / 1000)
+        timings = {'pooled': False, 'offer_ms': 0, 'request_ms': request_ms, 'connect_ms': self.args.join_ms}
+        if 'error' in response:
+            self.status(sid, 'error')
+            return self.ack(packet, result='JOIN_ERROR', timings=timings)
+        self.joined[sid] = time.monotonic() - packet.get('start', 0)
+        self.status(sid, 'playing')
+        self.ack(packet, result='JOINED_VOICE_CHAT', timings=timings)
+
+    def _command(self, packet:dict) -> None:
+        sid, action = packet['sid'], packet.get('action')
+        if sid in self.joined:
+            if action == 'leave_call':
+                del self.joined[sid]
+                self.paused.pop(sid, None)
+                self.status(sid, 'left')
+            elif action == 'pause' and sid not in self.paused:
+                self.paused[sid] = self.position(sid)
+                self.status(sid, 'paused')
+            elif action == 'resume' and sid in self.paused:
+                self.joined[sid] = time.monotonic() - self.paused.pop(sid)
+                self.status(sid, 'playing')
+            elif action == 'change_stream':
+                self.joined[sid] = time.monotonic() - packet.get('start', 0)
+        if action == 'broadcast':
+            return self.ack(packet, result='BROADCASTING')
+        if action == 'stats':
+            return self.ack(packet, cache_bytes=0, cache_fill=0)
+        if action == 'skip':
+            return self.ack(packet, result='NOTHING_QUEUED')
+        self.ack(packet)
+
+    async def _report(self) -> None:
+        while True:
+            await asyncio.sleep(STATUS_INTERVAL)
+            self.status('', 'running',
+                scheduler={'streams': len(self.joined), 'late_frames': 0, 'skipped_frames': 0, 'jitter_ms': 0},
+                positions={ sid: [self.position(sid), sid not in self.paused] for sid in self.joined },
+                metrics={ sid: {'buffer_ms': 200, 'frames_sent': 0, 'late_frames': 0, 'underruns': 0,
+                    'starved_frames': 0, 'since_last_frame_ms': 0, 'join_ms': self.args.join_ms} for sid in self.joined },
+            )
+
+    async def _bursts(self) -> None:
+        while True:
+            await asyncio.sleep(self.args.burst_every_ms / 1000)
+            for sid in list(self.joined):
+                for _ in range(self.args.burst):
+                    self.event(sid, self.args.event)
+
+class FakeClient:
+    """Stand-in pyrogram.Client for GroupCall, PyTgCalls, Cluster and the UpdateDispatcher: every chat has an active
+    voice chat, and the account is a member of chats (of all of them if None). Requests take rpc_ms and are counted
+    by name in self.requests, the next one named in self.floods raises a FLOOD_WAIT of that many seconds"""
+    def __init__(self, rpc_ms:float = 0.0, user_id:int = 1, chats:Optional[Set[int]] = None):
+        self.rpc_ms : float = rpc_ms
+        self.user_id : int = user_id
+        self.chats : Optional[Set[int]] = chats
+        self.handlers : List[Callable] = []
+        self.requests : Dict[str, int] = {}
+        self.floods : Dict[str, int] = {}
+
+    def on_raw_update(self, group:int = 0) -> Callable:
+        def decorator(fun:Callable) -> Callable:
+            self.handlers.append(fun)
+            return fun
+        return decorator
+
+    async def get_me(self) -> SimpleNamespace:
+        return SimpleNamespace(id=self.user_id)
+
+    async def get_chat_member(self, chat_id:int, user_id:Any) -> SimpleNamespace:
+        await self._request('GetParticipant')
+        if self.chats is not None and chat_id not in self.chats:
+            raise UserNotParticipant()
+        return SimpleNamespace(user=SimpleNamespace(id=self.user_id), status='member')
+
+    async def resolve_peer(self, peer_id:int) -> Any:
+        if peer_id < MAX_CHANNEL_ID:
+            return InputPeerChannel(channel_id=MAX_CHANNEL_ID - peer_id, access_hash=0)
+        return InputPeerUser(user_id=peer_id, access_hash=0)
+
+    def input_call(self, channel_id:int) -> InputGroupCall:
+        return InputGroupCall(id=channel_id, access_hash=0)
+
+    async def _request(self, name:str) -> None:
+        self.requests[name] = self.requests.get(name, 0) + 1
+        if self.rpc_ms:
+            await asyncio.sleep(self.rpc_ms / 1000)
+        if name in self.floods:
+            raise FloodWait(self.floods.pop(name))
+
+    async def send(self, request:Any) -> Any:
+        name = type(request).__name__
+        await self._request(name)
+        if isinstance(request, GetFullChannel):
+            return SimpleNamespace(full_chat=SimpleNamespace(call=self.input_call(request.channel.channel_id)))
+        if isinstance(request, JoinGroupCall):
+            connection = UpdateGroupCallConnection(params=DataJSON(data=json.dumps({'transport': TRANSPORT})))
+            return SimpleNamespace(updates=[connection], users=[], chats=[])
+        if isinstance(request, (LeaveGroupCall, EditGroupCallParticipant)):
+            return SimpleNamespace(updates=[], users=[], chats=[])
+        raise NotImplementedError(f"FakeClient can't answer {name}")
+
+    async def handle_updates(self, updates:Any) -> None:
+        for update in updates.updates:
+            await self.emit(update)
+
+    async def emit(self, update:Any, users:Optional[dict] = None, chats:Optional[dict] = None) -> None:
+        """Dispatch a raw update to every handler, like one received from the server"""
+        for handler in self.handlers:
+            try:
+                await handler(self, update, users or {}, chats or {})
+            except ContinuePropagation:
+                pass
+
+    def group_call_update(self, chat_id:int, version:int = 1) -> UpdateGroupCall:
+        """A participant change in the voice chat of chat_id, its access hash is the version"""
+        channel_id = MAX_CHANNEL_ID - chat_id
+        return UpdateGroupCall(
+            chat_id=channel_id,
+            call=GroupCall(id=channel_id, access_hash=version, participants_count=1, unmuted_video_limit=0, version=version),
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ack-ms', type=float, default=0.0, help="time taken to ack a command")
+    parser.add_argument('--join-ms', type=float, default=0.0, help="time taken to connect once Python joined")
+    parser.add_argument('--burst', type=int, default=0, help="events sent to every session per burst")
+    parser.add_argument('--burst-every-ms', type=float, default=1000.0)
+    parser.add_argument('--event', default='underrun', help="event the bursts are made of")
+    parser.add_argument('--crash-after', type=int, default=0, help="exit after that many commands, 0 never")
+    parser.add_argument('--codec', default='json')
+    parser.add_argument('--prewarm', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    signal.signal(signal.SIGINT, signal.SIG_DFL) # workers are stopped with SIGINT
+    asyncio.run(FakeCore(args).run())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Measure the silence between two consecutive tracks of one stream.
+
+Plays two raw PCM tracks back to back through a NodeJS Stream with a fake
+audio source, either queued with enqueue() like PyTgCalls.enqueue() does, or
+swapped in with setReadable() once the first one finishes, like calling
+change_stream() from an ended_stream handler did. Every track holds a single
+sample value, so each frame delivered is known to come from the first track,
+the second one, or both. Reports the gap between the last frame of the first
+track and the first frame of the second one, printing results as JSON.
+Needs the compiled core: run `npm run build` first.
+
+    python -m benchmarks.gapless --seconds 2 --runs 5
+"""
+import os
+import json
+import asyncio
+import argparse
+import tempfile
+
+from typing import List
+
+from .ipc_codec import percentile
+
+DIST = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pytgcalls', 'dist')
+BYTES_PER_SEC = 48000 * 2 # 48kHz 16 bit mono
+
+PLAYER = """
+const { Stream } = require(process.argv[1]);
+const [first, second, mode] = process.argv.slice(2);
+let lastFirst = 0, firstSecond = 0, mixed = 0;
+const audioSource = {
+    createTrack() {},
+    onData({ samples }) {
+        const now = Number(process.hrtime.bigint()) / 1e6;
+        if (samples[0] === 1000 && samples[samples.length - 1] === 1000) {
+            lastFirst = now;
+        } else if (samples[0] === 2000) {
+            firstSecond = firstSecond || now;
+        } else {
+            mixed += 1;
+        }
+    },
+};
+const stream = new Stream(first, 16, 48000, 1, 0, 10, 0, audioSource);
+if (mode === 'enqueue') {
+    stream.enqueue(second, 'second');
+} else {
+    stream.once('finish', () => stream.setReadable(second, 'second'));
+}
+stream.on('finish', () => {
+    if (!firstSecond) {
+        return;
+    }
+    process.stdout.write(JSON.stringify({ gap: firstSecond - lastFirst, mixed }) + '\\n', () => process.exit(0));
+});
+"""
+
+def write_track(value:int, seconds:float) -> str:
+    fd, path = tempfile.mkstemp(prefix='pytgcalls-bench-', suffix='.pcm')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(value.to_bytes(2, 'little', signed=True) * int(BYTES_PER_SEC * seconds / 2))
+    return path
+
+async def play(first:str, second:str, mode:str) -> dict:
+    proc = await asyncio.create_subprocess_exec(
+        'node', '-e', PLAYER, os.path.join(DIST, 'stream.js'), first, second, mode,
+        stdout=asyncio.subprocess.PIPE,
+    )
+    try:
+        line = await asyncio.wait_for(proc.stdout.readline(), 60)
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+        await proc.wait()
+    return json.loads(line)
+
+async def run(seconds:float, runs:int, mode:str) -> dict:
+    # a partial last frame would mix both tracks in the enqueue case, keep the first track frame aligned
+    first = write_track(1000, round(seconds * 100) / 100)
+    second = write_track(2000, seconds)
+    gaps : List[float] = []
+    mixed = 0
+    try:
+        for _ in range(runs):
+            res = await play(first, second, mode)
+            # consecutive frames are 10ms apart, anything above that was silence
+            gaps.append(max(0.0, res['gap'] - 10))
+            mixed += res['mixed']
+    finally:
+        os.unlink(first)
+        os.unlink(second)
+    return {
+        'mode': mode,
+        'seconds': seconds,
+        'runs': runs,
+        'gap_p50_ms': percentile(gaps, 0.50),
+        'gap_max_ms': max(gaps),
+        'mixed_frames': mixed,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=2.0, help="length of each track")
+    parser.add_argument('--runs', type=int, default=5, help="plays per mode")
+    parser.add_argument('--mode', choices=('enqueue', 'change_stream', 'both'), default='both')
+    args = parser.parse_args()
+    if not os.path.isfile(os.path.join(DIST, 'stream.js')):
+        parser.exit(1, "The compiled core is missing, run `npm run build` first\n")
+    modes = ('enqueue', 'change_stream') if args.mode == 'both' else (args.mode,)
+    results = [ asyncio.run(run(args.seconds, args.runs, mode)) for mode in modes ]
+    print(json.dumps({'benchmark': 'gapless', 'results': results}, indent=2))
+
+if __name__ == '__main__':
+    main()
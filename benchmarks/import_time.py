@@ -0,0 +1,73 @@
+"""Measure how long a cold `import pytgcalls` takes.
+
+Imports the package in a fresh interpreter --runs times, timing the whole
+interpreter and the import itself as reported by `python -X importtime`, and
+counts the processes spawned while importing (through audit hooks), which must
+stay at 0. Lists the slowest modules imported, by cumulative time, and prints
+results as JSON.
+
+    python -m benchmarks.import_time --runs 10 --top 10
+"""
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+from typing import Dict, List, Tuple
+
+from .ipc_codec import percentile
+
+# counts every process the import starts, printed last on stdout
+PROBE = """
+import sys
+spawned = []
+sys.addaudithook(lambda event, args: event in ('subprocess.Popen', 'os.posix_spawn', 'os.fork', 'os.exec') and spawned.append(event))
+import {module}
+print(len(spawned))
+"""
+
+def import_times(stderr:str) -> Dict[str, Tuple[int, int]]:
+    """-X importtime lines as self and cumulative microseconds by module"""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        times[module.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+def run(module:str) -> dict:
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE.format(module=module)],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True,
+    )
+    return {
+        'wall': time.perf_counter() - start,
+        'spawned': int(proc.stdout.split()[-1]),
+        'modules': import_times(proc.stderr),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='pytgcalls')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=10, help="slowest modules listed")
+    args = parser.parse_args()
+    runs = [ run(args.module) for _ in range(args.runs) ]
+    imports : List[float] = [ r['modules'][args.module][1] / 1e6 for r in runs ]
+    walls : List[float] = [ r['wall'] for r in runs ]
+    slowest = sorted(runs[-1]['modules'].items(), key=lambda m: m[1][1], reverse=True)[:args.top]
+    print(json.dumps({'benchmark': 'import_time', 'results': [{
+        'module': args.module,
+        'runs': args.runs,
+        'import_p50_ms': percentile(imports, 0.50) * 1000,
+        'import_max_ms': max(imports) * 1000,
+        'interpreter_p50_ms': percentile(walls, 0.50) * 1000,
+        'processes_spawned': max(r['spawned'] for r in runs),
+        'slowest_modules_ms': { name: cumulative / 1000 for name, (_, cumulative) in slowest },
+    }]}, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Compare the stdio wire formats between Python and the core.
+
+Spawns an echo peer speaking the selected codec and measures packets/sec and
+round trip latency percentiles for each mode, printing results as JSON.
+
+    python -m benchmarks.ipc_codec --packets 50000 --window 64
+"""
+import sys
+import json
+import time
+import signal
+import struct
+import asyncio
+import argparse
+
+from typing import List
+
+from pytgcalls.codec import CODECS, get_codec
+from pytgcalls.helpers import DependancyException
+from pytgcalls.node_worker import NodeWorker
+
+def echo_peer(codec:str) -> None:
+    """Minimal stand-in core: acks every packet it receives"""
+    signal.signal(signal.SIGINT, signal.SIG_DFL) # workers are stopped with SIGINT
+    stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+    enc = get_codec(codec)
+    if codec == 'json':
+        for line in stdin:
+            packet = json.loads(line)
+            stdout.write(enc.encode({'_': 'ack', 'sid': packet['sid'], 'pid': packet['pid']}))
+            stdout.flush()
+        return
+    import msgpack
+    header = struct.Struct('>I')
+    while True:
+        head = stdin.read(header.size)
+        if len(head) < header.size:
+            return
+        packet = msgpack.unpackb(stdin.read(header.unpack(head)[0]), raw=False)
+        stdout.write(enc.encode({'_': 'ack', 'sid': packet['sid'], 'pid': packet['pid']}))
+        stdout.flush()
+
+def percentile(samples:List[float], p:float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+async def run(codec:str, packets:int, window:int) -> dict:
+    worker = NodeWorker(0, get_codec(codec), [sys.executable, '-m', 'benchmarks.ipc_codec', '--peer'])
+    await worker.init('bench')
+    rtts : List[float] = []
+    slots = asyncio.Semaphore(window)
+
+    async def one(i:int) -> None:
+        async with slots:
+            start = time.perf_counter()
+            await worker.send('bench', {'action': 'pause', 'chat_id': -1001234567890 - i})
+            rtts.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(packets)))
+    elapsed = time.perf_counter() - start
+    await worker.clear('bench')
+    return {
+        'codec': codec,
+        'packets': packets,
+        'window': window,
+        'packets_per_sec': packets / elapsed,
+        'rtt_p50_ms': percentile(rtts, 0.50) * 1000,
+        'rtt_p99_ms': percentile(rtts, 0.99) * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--packets', type=int, default=20000)
+    parser.add_argument('--window', type=int, default=64, help="max packets in flight")
+    parser.add_argument('--codec', choices=list(CODECS), action='append', help="defaults to every codec")
+    parser.add_argument('--peer', action='store_true', help=argparse.SUPPRESS)
+    args, _ = parser.parse_known_args()
+    if args.peer: # the worker appends --codec=<name> to the command line
+        return echo_peer(args.codec[0])
+    codecs = args.codec or list(CODECS)
+    for codec in list(codecs):
+        try:
+            get_codec(codec)
+        except DependancyException as e: # msgpack is an optional extra
+            if args.codec:
+                parser.exit(1, f"{e}\n")
+            print(f"Skipping {codec}: {e}", file=sys.stderr)
+            codecs.remove(codec)
+    results = [ asyncio.run(run(codec, args.packets, args.window)) for codec in codecs ]
+    print(json.dumps({'benchmark': 'ipc_codec', 'results': results}, indent=2))
+
+if __name__ == '__main__':
+    main()
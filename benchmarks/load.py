@@ -0,0 +1,264 @@
+"""Load test PyTgCalls end to end, offline, against the fake core and client.
+
+Every call goes through PyTgCalls, GroupCall and the worker pool like in a bot,
+only the NodeJS core and pyrogram are replaced by the stand-ins of
+benchmarks.fakes. Scenarios:
+
+  joins     --calls joins at once: joins/sec and join latency percentiles,
+            then how long leaving them all takes
+  commands  --calls calls each sending pause/resume back to back for
+            --seconds: commands/sec and latency percentiles
+  dispatch  --updates raw updates through the UpdateDispatcher of a client
+            with --calls calls, a third routed to a call, a third for chats
+            without one and a third of a type nobody handles: updates/sec
+  memory    --calls calls sending --rate commands/sec each for --seconds,
+            with a raw update per call every second and the event bursts
+            of the core (--burst): RSS and live objects sampled every
+            second, and their growth rates
+
+Prints results as JSON, with the Python version, platform and CPU count to
+compare runs against.
+
+    python -m benchmarks.load --scenario joins --calls 1000 --join-ms 50
+    python -m benchmarks.load --scenario memory --calls 100 --seconds 600
+"""
+import gc
+import os
+import json
+import time
+import asyncio
+import argparse
+import logging
+import platform
+import resource
+import tempfile
+
+from typing import Dict, List
+
+from pyrogram.raw.types import DataJSON, UpdateGroupCallConnection
+
+from pytgcalls.js_core import INSTANCE as JSC
+from pytgcalls.pytgcalls import PyTgCalls
+from pytgcalls.groupcall import GroupCall
+
+from .fakes import FakeClient, core_command
+from .ipc_codec import percentile
+
+def chat_ids(calls:int) -> List[int]:
+    return [ -1001000000000 - i for i in range(calls) ]
+
+def rss_mb() -> float:
+    """Current resident set size, the peak one where /proc is missing"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1 << 20)
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def slope(samples:List[List[float]]) -> float:
+    """Least squares slope of [x, y] samples"""
+    n = len(samples)
+    if n < 2:
+        return 0.0
+    mx = sum(x for x, _ in samples) / n
+    my = sum(y for _, y in samples) / n
+    var = sum((x - mx) ** 2 for x, _ in samples)
+    return sum((x - mx) * (y - my) for x, y in samples) / var if var else 0.0
+
+def latencies(samples:List[float]) -> dict:
+    if not samples:
+        return {'p50_ms': None, 'p99_ms': None, 'max_ms': None}
+    return {
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+        'max_ms': max(samples) * 1000,
+    }
+
+async def join_all(tgcalls:PyTgCalls, chats:List[int], source:str) -> dict:
+    loop = asyncio.get_event_loop()
+    times : List[float] = []
+
+    def timed(start:float):
+        def done(task:asyncio.Task) -> None:
+            if not task.cancelled() and not task.exception():
+                times.append(loop.time() - start)
+        return done
+
+    start = loop.time()
+    tasks = []
+    for chat_id in chats:
+        task = tgcalls.join_group_call(chat_id, source)
+        task.add_done_callback(timed(loop.time()))
+        tasks.append(task)
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = loop.time() - start
+    failed = [ chat_id for chat_id, r in zip(chats, results) if isinstance(r, BaseException) ]
+    for chat_id in failed: # never joined, nothing to leave
+        tgcalls.calls.pop(chat_id)
+    return {'joined': len(chats) - len(failed), 'failed': len(failed), 'elapsed': elapsed, 'latencies': times}
+
+async def leave_all(tgcalls:PyTgCalls) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(tgcalls.leave_group_call(chat_id) for chat_id in list(tgcalls.calls)), return_exceptions=True)
+    return time.perf_counter() - start
+
+async def joins(tgcalls:PyTgCalls, client:FakeClient, source:str, args:argparse.Namespace) -> dict:
+    joined = await join_all(tgcalls, chat_ids(args.calls), source)
+    leave = await leave_all(tgcalls)
+    return {
+        'calls': args.calls,
+        'joined': joined['joined'],
+        'failed': joined['failed'],
+        'joins_per_sec': joined['joined'] / joined['elapsed'],
+        'join': latencies(joined['latencies']),
+        'leave_all_ms': leave * 1000,
+        'requests': dict(client.requests),
+    }
+
+async def commands(tgcalls:PyTgCalls, client:FakeClient, source:str, args:argparse.Namespace) -> dict:
+    joined = await join_all(tgcalls, chat_ids(args.calls), source)
+    times : List[float] = []
+    failed = 0
+    deadline = time.perf_counter() + args.seconds
+
+    async def drive(chat_id:int) -> None:
+        nonlocal failed
+        paused = False
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                await (tgcalls.resume_stream(chat_id) if paused else tgcalls.pause_stream(chat_id))
+                times.append(time.perf_counter() - start)
+            except Exception:
+                failed += 1
+            paused = not paused
+
+    start = time.perf_counter()
+    await asyncio.gather(*(drive(chat_id) for chat_id in tgcalls.calls))
+    elapsed = time.perf_counter() - start
+    await leave_all(tgcalls)
+    return {
+        'calls': joined['joined'],
+        'seconds': args.seconds,
+        'commands_per_sec': len(times) / elapsed,
+        'failed': failed,
+        'command': latencies(times),
+    }
+
+async def dispatch(tgcalls:PyTgCalls, client:FakeClient, source:str, args:argparse.Namespace) -> dict:
+    chats = chat_ids(args.calls)
+    calls = [ GroupCall(client, chat_id) for chat_id in chats ] # registered with the dispatcher, never joined
+    await asyncio.gather(*(call.initialized.wait() for call in calls))
+    unknown = chat_ids(args.calls * 2)[args.calls:]
+    ignored = UpdateGroupCallConnection(params=DataJSON(data='{}'))
+    updates = []
+    for i in range(args.updates):
+        kind = i % 3
+        if kind == 0:
+            updates.append(client.group_call_update(chats[i % len(chats)], i + 1))
+        elif kind == 1:
+            updates.append(client.group_call_update(unknown[i % len(unknown)], i + 1))
+        else:
+            updates.append(ignored)
+    start = time.perf_counter()
+    for update in updates:
+        await client.emit(update)
+    elapsed = time.perf_counter() - start
+    routed = sum(call.call is not None and call.call.access_hash != 0 for call in calls)
+    for call in calls:
+        call.dispatcher.unregister(call)
+    return {
+        'calls': args.calls,
+        'updates': args.updates,
+        'updates_per_sec': args.updates / elapsed,
+        'calls_updated': routed,
+    }
+
+async def memory(tgcalls:PyTgCalls, client:FakeClient, source:str, args:argparse.Namespace) -> dict:
+    joined = await join_all(tgcalls, chat_ids(args.calls), source)
+    samples : List[Dict[str, float]] = []
+    failed = 0
+    start = time.perf_counter()
+    second = 0
+    while time.perf_counter() - start < args.seconds:
+        tick = time.perf_counter()
+        sent = []
+        for chat_id in tgcalls.calls:
+            for i in range(args.rate):
+                sent.append(tgcalls.pause_stream(chat_id) if (second + i) % 2 else tgcalls.resume_stream(chat_id))
+        for chat_id in list(tgcalls.calls):
+            await client.emit(client.group_call_update(chat_id, second + 1))
+        failed += sum(isinstance(r, BaseException) for r in await asyncio.gather(*sent, return_exceptions=True))
+        gc.collect()
+        samples.append({'t': round(time.perf_counter() - start, 3), 'rss_mb': rss_mb(), 'objects': len(gc.get_objects())})
+        second += 1
+        await asyncio.sleep(max(0.0, 1.0 - (time.perf_counter() - tick)))
+    await leave_all(tgcalls)
+    gc.collect()
+    warm = samples[len(samples) // 10:] # leave the warm up out of the trend
+    return {
+        'calls': joined['joined'],
+        'seconds': args.seconds,
+        'failed': failed,
+        'rss_start_mb': samples[0]['rss_mb'],
+        'rss_end_mb': samples[-1]['rss_mb'],
+        'rss_peak_mb': max(s['rss_mb'] for s in samples),
+        'rss_growth_mb_per_min': slope([ [s['t'], s['rss_mb']] for s in warm ]) * 60,
+        'objects_growth_per_min': slope([ [s['t'], s['objects']] for s in warm ]) * 60,
+        'rss_after_leave_mb': rss_mb(),
+        'callbacks': {k: v for k, v in JSC.executor.stats().items() if k in ('pending', 'max_pending', 'errors')},
+        'samples': samples,
+    }
+
+SCENARIOS = {
+    'joins': joins,
+    'commands': commands,
+    'dispatch': dispatch,
+    'memory': memory,
+}
+
+async def run(scenarios:List[str], args:argparse.Namespace) -> List[dict]:
+    JSC.set_command(core_command(
+        ack_ms=args.ack_ms, join_ms=args.join_ms, burst=args.burst, crash_after=args.crash_after,
+    ))
+    results = []
+    with tempfile.NamedTemporaryFile(suffix='.raw') as source:
+        source.write(bytes(48000 * 2)) # a second of silence
+        source.flush()
+        for scenario in scenarios:
+            client = FakeClient(args.rpc_ms)
+            tgcalls = PyTgCalls(client, workers=args.workers)
+            crashes = sum(w.crashes for w in JSC.workers)
+            result = await SCENARIOS[scenario](tgcalls, client, source.name, args)
+            results.append({'scenario': scenario, **result, 'core_crashes': sum(w.crashes for w in JSC.workers) - crashes})
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', choices=SCENARIOS, action='append', help="defaults to every scenario")
+    parser.add_argument('--calls', type=int, default=1000)
+    parser.add_argument('--seconds', type=float, default=10.0, help="duration of commands and memory")
+    parser.add_argument('--updates', type=int, default=100000, help="updates sent by dispatch")
+    parser.add_argument('--rate', type=int, default=1, help="commands per call per second in memory")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="fake cores")
+    parser.add_argument('--ack-ms', type=float, default=0.0, help="time the fake core takes to ack")
+    parser.add_argument('--join-ms', type=float, default=50.0, help="time the fake core takes to connect")
+    parser.add_argument('--rpc-ms', type=float, default=20.0, help="time the fake client takes per request")
+    parser.add_argument('--burst', type=int, default=0, help="events per call the fake core sends every second")
+    parser.add_argument('--crash-after', type=int, default=0, help="commands after which each fake core crashes")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    results = asyncio.run(run(args.scenario or list(SCENARIOS), args))
+    print(json.dumps({
+        'benchmark': 'load',
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'time': int(time.time()),
+        },
+        'results': results,
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
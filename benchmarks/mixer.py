@@ -0,0 +1,62 @@
+"""Measure how many sources x calls one CPU core can mix in real time.
+
+Runs a Mixer per simulated call, as fast as it can (no real time pacing), each
+mixing N in-memory sources with a gain ramp and ducking in progress, and
+measures the CPU time spent per second of mixed audio. The real time factor
+is how many such calls one core keeps up with, printing results as JSON.
+Needs numpy.
+
+    python -m benchmarks.mixer --sources 1 2 4 8 --seconds 10 --calls 4
+"""
+import json
+import time
+import asyncio
+import argparse
+
+from typing import AsyncIterator
+
+from pytgcalls.mixer import Mixer
+
+async def silence(seconds:float, chunk:bytes) -> AsyncIterator[bytes]:
+    for _ in range(int(seconds * 48000 * 2 / len(chunk))):
+        yield chunk
+
+async def run(sources:int, seconds:float, calls:int, block_ms:int) -> dict:
+    chunk = b'\x10\x00' * (48000 * block_ms // 1000) # one block, a constant non zero sample
+    mixers = []
+    for _ in range(calls):
+        mixer = Mixer(block_ms=block_ms, lead=None)
+        for i in range(sources):
+            layer = mixer.add(silence(seconds, chunk), gain=0.5, ducking=i == 0 and sources > 1)
+            layer.set_gain(1.0, seconds) # ramping the whole time, worst case
+        mixer.close()
+        mixers.append(mixer)
+
+    async def drain(mixer:Mixer) -> None:
+        async for _ in mixer:
+            pass
+
+    start = time.process_time()
+    await asyncio.gather(*[ drain(mixer) for mixer in mixers ])
+    cpu = time.process_time() - start
+    mixed = seconds * calls
+    return {
+        'sources': sources,
+        'calls': calls,
+        'block_ms': block_ms,
+        'cpu_ms_per_second': cpu / mixed * 1000,
+        'realtime_calls_per_core': int(mixed / cpu) if cpu else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sources', type=int, nargs='+', default=[1, 2, 4, 8], help="sources per call")
+    parser.add_argument('--seconds', type=float, default=10.0, help="audio mixed per call")
+    parser.add_argument('--calls', type=int, default=4, help="calls mixed concurrently")
+    parser.add_argument('--block-ms', type=int, default=50, help="mixer block size")
+    args = parser.parse_args()
+    results = [ asyncio.run(run(n, args.seconds, args.calls, args.block_ms)) for n in args.sources ]
+    print(json.dumps({'benchmark': 'mixer', 'results': results}, indent=2))
+
+if __name__ == '__main__':
+    main()
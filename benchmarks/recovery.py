@@ -0,0 +1,132 @@
+"""Measure how long sessions take to come back after their core is killed mid-stream.
+
+Runs N sessions on a stand-in core that acks every command (taking --join-ms to
+answer join_call, like a real join), keeps commands flowing on every session, then
+SIGKILLs the core. The worker restarts it and each session's recovery hook replays
+it with join_call. Recovery time is measured from the kill to the 'reconnect'
+event. Commands in flight when the core dies fail, every command sent meanwhile
+must still be acked. Kills come in a row, pass --backoff to include the restart
+backoff in the measure. Prints results as JSON.
+
+    python -m benchmarks.recovery --sessions 1 10 100 --kills 5
+"""
+import sys
+import json
+import signal
+import asyncio
+import argparse
+import threading
+
+from typing import Dict, List
+
+from pytgcalls.codec import get_codec
+from pytgcalls.node_worker import NodeWorker, CoreDied
+
+def stand_in_core(join_ms:int) -> None:
+    """Acks every packet, join_call after join_ms without holding the others back"""
+    signal.signal(signal.SIGINT, signal.SIG_DFL) # workers are stopped with SIGINT
+    enc = get_codec('json')
+    lock = threading.Lock()
+
+    def write(*packets:dict) -> None:
+        with lock:
+            for packet in packets:
+                sys.stdout.buffer.write(enc.encode(packet))
+            sys.stdout.buffer.flush()
+
+    for line in sys.stdin.buffer:
+        packet = json.loads(line)
+        if packet.get('_') == 'response':
+            continue
+        ack = {'_': 'ack', 'sid': packet['sid'], 'pid': packet['pid'], 'result': 'OK'}
+        if packet.get('action') == 'join_call':
+            ack['result'] = 'JOINED_VOICE_CHAT'
+            status = {'_': 'status', 'sid': packet['sid'], 'pid': -1, 'status': 'playing'}
+            threading.Timer(join_ms / 1000, write, (status, ack)).start()
+        else:
+            write(ack)
+
+def percentile(samples:List[float], p:float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+async def run(sessions:int, kills:int, join_ms:int, backoff:float) -> dict:
+    worker = NodeWorker(
+        0, get_codec('json'), [sys.executable, '-m', 'benchmarks.recovery', '--core', f'--join-ms={join_ms}'],
+        restart_backoff=backoff, max_restarts=kills,
+    )
+    loop = asyncio.get_event_loop()
+    reconnected : Dict[str, asyncio.Future] = {}
+    sids = [ f'bench-{i}' for i in range(sessions) ]
+
+    def hooks(sid:str) -> None:
+        async def replay() -> None:
+            res = await worker.send(sid, {'action': 'join_call', 'offset': 0}, replay=True)
+            assert res['result'] == 'JOINED_VOICE_CHAT'
+
+        async def on_reconnect(packet:dict) -> None:
+            reconnected[sid].set_result(packet)
+
+        worker.on_recover(sid)(replay)
+        worker.on(sid, 'reconnect')(on_reconnect)
+
+    for sid in sids:
+        await worker.init(sid)
+        hooks(sid)
+        await worker.send(sid, {'action': 'join_call'})
+
+    acked = in_flight = 0
+    stop = False
+
+    async def traffic(sid:str) -> None:
+        nonlocal acked, in_flight
+        while not stop:
+            try:
+                await worker.send(sid, {'action': 'pause'})
+                acked += 1
+            except CoreDied:
+                in_flight += 1
+            await asyncio.sleep(0.01)
+
+    streams = [ loop.create_task(traffic(sid)) for sid in sids ]
+    recoveries : List[float] = []
+    failed = 0
+    for _ in range(kills):
+        await asyncio.sleep(0.2)
+        reconnected.update({ sid: loop.create_future() for sid in sids })
+        killed = loop.time()
+        worker.proc.kill()
+        events = await asyncio.gather(*reconnected.values())
+        recoveries.append(loop.time() - killed)
+        failed += sum(not e['recovered'] for e in events)
+    stop = True
+    results = await asyncio.gather(*streams, return_exceptions=True)
+    for sid in sids:
+        await worker.clear(sid)
+    return {
+        'sessions': sessions,
+        'kills': kills,
+        'join_ms': join_ms,
+        'recovery_p50_ms': percentile(recoveries, 0.50) * 1000,
+        'recovery_max_ms': max(recoveries) * 1000,
+        'sessions_lost': failed,
+        'commands_acked': acked,
+        'commands_in_flight_lost': in_flight,
+        'commands_failed': sum(isinstance(r, BaseException) for r in results),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--kills', type=int, default=5, help="times the core is killed per run")
+    parser.add_argument('--join-ms', type=int, default=50, help="time the stand-in core takes to join a call")
+    parser.add_argument('--backoff', type=float, default=0.0, help="restart backoff of the worker")
+    parser.add_argument('--core', action='store_true', help=argparse.SUPPRESS)
+    args, _ = parser.parse_known_args()
+    if args.core: # the worker appends --codec and --prewarm to the command line
+        return stand_in_core(args.join_ms)
+    results = [ asyncio.run(run(n, args.kills, args.join_ms, args.backoff)) for n in args.sessions ]
+    print(json.dumps({'benchmark': 'recovery', 'results': results}, indent=2))
+
+if __name__ == '__main__':
+    main()
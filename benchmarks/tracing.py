@@ -0,0 +1,50 @@
+"""Measure what tracing costs on the IPC hot path.
+
+Sends commands to the echo peer of benchmarks.ipc_codec with tracing disabled,
+then with a SpanStats tracer installed, and compares packets/sec. Prints results
+as JSON, with the 'ipc' span histogram gathered by the tracer.
+
+    python -m benchmarks.tracing --packets 50000 --window 64
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+from typing import Optional
+
+from pytgcalls import tracing
+from pytgcalls.codec import get_codec
+from pytgcalls.node_worker import NodeWorker
+
+async def run(tracer:Optional[tracing.Tracer], packets:int, window:int) -> dict:
+    tracing.set_tracer(tracer)
+    worker = NodeWorker(0, get_codec('json'), [sys.executable, '-m', 'benchmarks.ipc_codec', '--peer'])
+    await worker.init('bench')
+    slots = asyncio.Semaphore(window)
+
+    async def one() -> None:
+        async with slots:
+            await worker.send('bench', {'action': 'pause'})
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(packets)))
+    elapsed = time.perf_counter() - start
+    await worker.clear('bench')
+    tracing.set_tracer(None)
+    result = {'tracer': type(tracer).__name__ if tracer else None, 'packets_per_sec': packets / elapsed}
+    if isinstance(tracer, tracing.SpanStats):
+        result['spans'] = tracer.stats()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--packets', type=int, default=20000)
+    parser.add_argument('--window', type=int, default=64, help="max packets in flight")
+    args = parser.parse_args()
+    results = [ asyncio.run(run(tracer, args.packets, args.window)) for tracer in (None, tracing.SpanStats()) ]
+    print(json.dumps({'benchmark': 'tracing', 'results': results}, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -5,19 +5,14 @@ from pyrogram import Client
 from pyrogram import filters
 from pyrogram.types import Message
 
-from pytgcalls import PyLogs
 from pytgcalls import PyTgCalls
-from pytgcalls import StreamType
 
 app = Client(
     'py-tgcalls',
     api_id=123456789,
     api_hash='abcdef12345',
 )
-call_py = PyTgCalls(
-    app,
-    log_mode=PyLogs.ultra_verbose,
-)
+call_py = PyTgCalls(app)
 if __name__ == '__main__':
     @app.on_message(filters.regex('!play'))
     async def play_handler(client: Client, message: Message):
@@ -27,7 +22,6 @@ if __name__ == '__main__':
         call_py.join_group_call(
             message.chat.id,
             file,
-            stream_type=StreamType["LOCAL"],
         )
 
     @app.on_message(filters.regex('!change_stream'))
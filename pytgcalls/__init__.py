@@ -1,6 +1,9 @@
 from .__version__ import __version__
-from .methods.logs.py_logs import PyLogs
-from .methods.stream.stream_type import StreamType
 from .pytgcalls import PyTgCalls
+from .cluster import Cluster
+from .ring_buffer import PcmRingBuffer
+from .pcm_cache import PcmCache
+from .broadcast import Broadcast
+from .mixer import Mixer
 
-__all__ = ('__version__', 'PyLogs', 'StreamType', 'PyTgCalls')
+__all__ = ('__version__', 'PyTgCalls', 'Cluster', 'PcmRingBuffer', 'PcmCache', 'Broadcast', 'Mixer')
@@ -0,0 +1,54 @@
+import logging
+
+from typing import Dict, Optional
+
+from .js_core import INSTANCE as JSC
+
+from .session import Session, Source
+from .pcm_cache import PcmCache
+
+logger = logging.getLogger(__name__)
+
+class BroadcastError(Exception):
+    pass
+
+class Broadcast(Session):
+    """A source read, buffered and paced once inside NodeJS, played by any number of group calls.
+    Pass it to join_group_call instead of a source: calls joining it are pinned to the broadcast's
+    worker and only cost their own peer connection. Pausing or leaving a call doesn't affect the others,
+    pausing the broadcast pauses all of them. Its queue is the queue of every subscribed call"""
+    _recover_priority = 0 # before the calls playing it
+    def __init__(self, source:Source, bitrate:int = 48000, live:bool = False, cache:Optional[PcmCache] = None):
+        super().__init__(cache)
+        self.source : Source = source
+        self.bitrate : int = min(bitrate, 48000)
+        self._live : bool = live
+        self.started : bool = False
+
+    async def start(self) -> None:
+        track = await self._prepare_source(self.source, self._live)
+        await JSC.init(self.sid)
+        self._listen()
+        res = await self._stream_action('broadcast', {**track.packet, 'bitrate': self.bitrate})
+        if res['result'] != 'BROADCASTING':
+            track.discard()
+            raise BroadcastError(f"Could not start broadcast : {res.get('error', res['result'])}")
+        self.started = True
+        await self._swap_source(track)
+
+    async def _replay(self, packet:dict) -> None:
+        res = await self._stream_action('broadcast', {**packet, 'bitrate': self.bitrate}, replay=True)
+        if res['result'] != 'BROADCASTING':
+            raise BroadcastError(f"Could not restart broadcast : {res.get('error', res['result'])}")
+
+    async def stats(self) -> Dict[str, int]:
+        """Like GroupCall.stats, plus how many calls are subscribed"""
+        res = await self._stream_action('stats')
+        return {k: res[k] for k in ('cache_bytes', 'cache_fill', 'subscribers') if k in res}
+
+    async def stop(self) -> None:
+        """Stop the broadcast, subscribed calls stay in their voice chat and get an ended_stream event"""
+        await self._stream_action('stop_broadcast')
+        await JSC.clear(self.sid)
+        self._drop_tracks()
+        self.started = False
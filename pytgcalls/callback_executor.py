@@ -0,0 +1,154 @@
+import time
+import asyncio
+import inspect
+import logging
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# events of a session run before giving its worker to another session, so a busy one can't starve the rest
+BATCH = 16
+
+class LatencyHistogram:
+    """Counts of durations per bucket of BUCKETS_MS, plus one for anything longer"""
+    def __init__(self):
+        self.counts : List[int] = [0] * (len(BUCKETS_MS) + 1)
+        self.count : int = 0
+        self.total : float = 0.0
+        self.max : float = 0.0
+
+    def observe(self, seconds:float) -> None:
+        ms = seconds * 1000
+        i = 0
+        while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def quantile(self, q:float) -> Optional[float]:
+        """Upper bound of the bucket holding quantile q, in ms"""
+        if not self.count:
+            return None
+        seen = 0
+        for bound, n in zip(BUCKETS_MS, self.counts):
+            seen += n
+            if seen >= q * self.count:
+                return float(bound)
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Cumulative counts keyed by upper bound like Prometheus 'le' labels, with count, mean, max, p50 and p99"""
+        buckets, seen = {}, 0
+        for bound, n in zip(BUCKETS_MS, self.counts):
+            seen += n
+            buckets[str(bound)] = seen
+        buckets['+Inf'] = self.count
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count if self.count else None,
+            'max_ms': self.max,
+            'p50_ms': self.quantile(0.50),
+            'p99_ms': self.quantile(0.99),
+            'buckets': buckets,
+        }
+
+class CallbackExecutor:
+    """Runs event callbacks on at most workers tasks, spawned only while events are pending.
+    Events of one key (a session) run one after the other in arrival order, each through all of its callbacks,
+    while different keys run in parallel. Exceptions are logged and counted, callbacks taking longer than slow
+    seconds are logged, and the latency of every handler goes into a histogram, as well as how long events waited.
+    Coroutine functions run on the loop, other callables too unless threads > 0: then they run in a thread pool
+    of that size, so blocking handlers don't stall the loop. Submitting never blocks: it's called from the
+    packet reader, which must keep reading acks for callbacks to make progress.
+    Bounding costs throughput: a burst drains in about events x handler time / workers at best, where a task
+    per callback would run them all at once. Raise workers when handlers mostly wait on I/O"""
+    def __init__(self, workers:int = 32, slow:float = 0.5, threads:int = 0):
+        self.workers : int = workers
+        self.slow : float = slow
+        self.threads : int = threads
+        self.pending : int = 0 # events submitted and not started
+        self.max_pending : int = 0 # high water mark
+        self.errors : int = 0
+        self.slow_calls : int = 0
+        self.handlers : Dict[str, LatencyHistogram] = {} # by 'event:handler'
+        self.queue_delay : LatencyHistogram = LatencyHistogram()
+        self._queues : Dict[str, Deque[Tuple[str, List[Callable], dict, float]]] = {}
+        self._ready : Deque[str] = deque() # keys with queued events and no worker on them
+        self._scheduled : Set[str] = set() # keys either ready or being run
+        self._running : int = 0
+        self._pool : Optional[ThreadPoolExecutor] = None
+
+    def submit(self, key:str, event:str, callbacks:List[Callable], packet:dict) -> None:
+        """Queue packet for every callback, after whatever is already queued for key"""
+        if not callbacks:
+            return
+        self._queues.setdefault(key, deque()).append((event, list(callbacks), packet, time.monotonic()))
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        if key not in self._scheduled:
+            self._scheduled.add(key)
+            self._ready.append(key)
+        if self._ready and self._running < self.workers:
+            self._running += 1
+            asyncio.get_event_loop().create_task(self._work())
+
+    async def _work(self) -> None:
+        try:
+            while self._ready:
+                key = self._ready.popleft()
+                queue = self._queues[key]
+                for _ in range(min(len(queue), BATCH)):
+                    event, callbacks, packet, queued = queue.popleft()
+                    self.pending -= 1
+                    self.queue_delay.observe(time.monotonic() - queued)
+                    for cb in callbacks:
+                        await self._run(key, event, cb, packet)
+                if queue: # more came meanwhile, back in line behind the others
+                    self._ready.append(key)
+                else:
+                    del self._queues[key]
+                    self._scheduled.discard(key)
+        finally:
+            self._running -= 1
+
+    async def _run(self, key:str, event:str, cb:Callable, packet:dict) -> None:
+        name = f"{event}:{getattr(cb, '__qualname__', type(cb).__name__)}"
+        start = time.monotonic()
+        try:
+            if self.threads and not asyncio.iscoroutinefunction(cb):
+                if not self._pool:
+                    self._pool = ThreadPoolExecutor(self.threads, thread_name_prefix='pytgcalls-callback')
+                result = await asyncio.get_event_loop().run_in_executor(self._pool, cb, packet)
+            else:
+                result = cb(packet)
+            if inspect.isawaitable(result):
+                await result
+        except Exception:
+            self.errors += 1
+            logger.exception("Callback %s failed on '%s'", name, key)
+        elapsed = time.monotonic() - start
+        if name not in self.handlers:
+            self.handlers[name] = LatencyHistogram()
+        self.handlers[name].observe(elapsed)
+        if elapsed > self.slow:
+            self.slow_calls += 1
+            logger.warning("Callback %s took %.0fms on '%s', later events of it waited", name, elapsed * 1000, key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'workers': self._running,
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'errors': self.errors,
+            'slow_calls': self.slow_calls,
+            'queue_delay': self.queue_delay.to_dict(),
+            'handlers': { name: h.to_dict() for name, h in self.handlers.items() },
+        }
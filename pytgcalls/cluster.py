@@ -0,0 +1,255 @@
+import asyncio
+import logging
+
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+
+import pyrogram
+from pyrogram.errors import FloodWait, RPCError
+from pyrogram.raw.base import InputPeer
+
+from .helpers import assert_version
+from .pcm_cache import PcmCache
+from .peer_cache import TTLCache
+from .rate_limit import RateLimiter
+from .dispatcher import UpdateDispatcher
+from .groupcall import GroupCall, JoinError, Source
+from .broadcast import Broadcast
+from .decoder import needs_decoding
+from .pytgcalls import PyTgCalls
+
+logger = logging.getLogger(__name__)
+
+# calls moved at once off a rate limited account, each costs a join to another account
+MOVE_CONCURRENCY = 8
+
+class PlacementError(Exception):
+    pass
+
+class Account:
+    """A client of a Cluster and the calls placed on it. Whether it's a member of a chat is asked once,
+    and kept membership_ttl seconds"""
+    def __init__(self, index:int, client:pyrogram.Client, max_calls:Optional[int] = None, membership_ttl:float = 600.0):
+        self.index : int = index
+        self.client : pyrogram.Client = client
+        self.max_calls : Optional[int] = max_calls # None for no limit
+        self.calls : Set[int] = set() # chat ids, counted from placement on so concurrent joins see them
+        self.members : TTLCache = TTLCache(membership_ttl)
+        self.evacuating : bool = False
+
+    @property
+    def limiter(self) -> RateLimiter:
+        return RateLimiter.for_client(self.client)
+
+    @property
+    def full(self) -> bool:
+        return self.max_calls is not None and len(self.calls) >= self.max_calls
+
+    @property
+    def load(self) -> float:
+        return len(self.calls) / self.max_calls if self.max_calls else float(len(self.calls))
+
+    async def is_member(self, chat_id:int) -> bool:
+        """Raises FloodWait when the server won't tell right now"""
+        async def check():
+            try:
+                await self.client.get_chat_member(chat_id, 'me')
+                return True
+            except FloodWait as e:
+                self.limiter.flood(e.x)
+                raise
+            except RPCError: # not a participant, private, banned...
+                return False
+        return await self.members.fetch(chat_id, check)
+
+    def stats(self, flood_window:float) -> Dict[str, Any]:
+        return {
+            'account': self.index,
+            'calls': len(self.calls),
+            'max_calls': self.max_calls,
+            'flood_wait_left': round(self.limiter.flooded(), 1),
+            'recent_floods': self.limiter.recent_floods(flood_window),
+            'evacuating': self.evacuating,
+        }
+
+class Cluster(PyTgCalls):
+    """PyTgCalls over several accounts sharing the same NodeJS workers, calls are still addressed by chat id.
+    Each join is placed on an account that is a member of the chat and isn't in a FLOOD_WAIT nor at max_calls:
+    the one with the fewest FLOOD_WAITs in the last flood_window seconds, then the fewest calls. A join failing on
+    a FLOOD_WAIT is placed again on another account. An account hitting a FLOOD_WAIT of move_after seconds or more
+    has its calls moved to other accounts: joined there at the same position with the same queue, paused state and
+    local volume, then left. Only calls playing files, urls and broadcasts can move, listeners hear them go back by
+    the time the new join took. Other calls, and calls no other account can take, stay where they are"""
+    def __init__(
+        self,
+        clients: List[pyrogram.Client],
+        max_calls: Optional[int] = None,
+        flood_window: float = 600.0,
+        move_after: float = 60.0,
+        workers: Optional[int] = None,
+        wire_format: Optional[str] = None,
+        decoders: Optional[int] = None,
+        pcm_cache: Optional[PcmCache] = None,
+        callback_threads: int = 0,
+    ):
+        if not clients:
+            raise ValueError("At least 1 client is needed")
+        super().__init__(clients[0], workers, wire_format, decoders, pcm_cache, callback_threads)
+        self.flood_window : float = flood_window
+        self.move_after : float = move_after
+        self.accounts : List[Account] = [ Account(i, client, max_calls) for i, client in enumerate(clients) ]
+        self.placement : Dict[int, Account] = {}
+        for account in self.accounts:
+            account.limiter.flood_listeners.append(self._flood_listener(account))
+
+    def run(self, start_pyro=True):
+        assert_version('pyrogram', '1.2', pyrogram.__version__)
+
+        if start_pyro:
+            for account in self.accounts:
+                account.client.start()
+            pyrogram.idle()
+            for account in self.accounts:
+                account.client.stop()
+
+    def on_group_call_invite(self) -> Callable:
+        """Invites received by any account, the callback gets the client it was received by"""
+        def decorator(fun:Callable) -> Callable:
+            for account in self.accounts:
+                UpdateDispatcher.for_client(account.client).on_group_call_invite()(fun)
+            return fun
+        return decorator
+
+    def account(self, chat_id:int) -> pyrogram.Client:
+        """Client of the account the call in chat_id is placed on"""
+        return self.placement[chat_id].client
+
+    def account_stats(self) -> List[Dict[str, Any]]:
+        """Calls, FLOOD_WAIT left and recent FLOOD_WAITs of every account"""
+        return [ account.stats(self.flood_window) for account in self.accounts ]
+
+    async def _place(self, chat_id:int, exclude:Set[Account]) -> Account:
+        """Least busy member of chat_id with headroom. Membership is asked to every account at once (then cached)
+        and the pick is made after, so concurrent placements see each other's calls"""
+        candidates = [ account for account in self.accounts if account not in exclude ]
+        members = await asyncio.gather(*(account.is_member(chat_id) for account in candidates), return_exceptions=True)
+        candidates = [
+            account for account, member in zip(candidates, members)
+            if member is True and not account.full and not account.limiter.flooded()
+        ]
+        if not candidates:
+            raise PlacementError(f"No account with headroom is a member of {chat_id}")
+        return min(candidates, key=lambda a: (a.limiter.recent_floods(self.flood_window), a.load, a.index))
+
+    async def _join(self, chat_id:int, join:Callable[[GroupCall], Any], exclude:Set[Account]) -> Tuple[Account, GroupCall]:
+        """Place a call and join it, on another account whenever the join hits a FLOOD_WAIT"""
+        exclude = set(exclude)
+        while True:
+            account = await self._place(chat_id, exclude)
+            account.calls.add(chat_id)
+            call = GroupCall(account.client, chat_id, self.pcm_cache)
+            try:
+                await join(call)
+                return account, call
+            except JoinError: # the call cleaned up after itself
+                account.calls.discard(chat_id)
+                if not account.limiter.flooded(): # failed for another reason, would fail anywhere
+                    raise
+                logger.warning("Join in %d hit a flood wait on account #%d, placing it again", chat_id, account.index)
+                exclude.add(account)
+            except BaseException:
+                account.calls.discard(chat_id)
+                raise
+
+    async def _join_group_call(self, chat_id:int, join:Callable[[GroupCall], Any]) -> None:
+        self.placement[chat_id], self.calls[chat_id] = await self._join(chat_id, join, set())
+
+    def join_group_call(
+            self,
+            chat_id: int,
+            source: Union[Source, Broadcast],
+            bitrate: int = 48000,
+            invite_hash: Optional[str] = None,
+            join_as: Optional[InputPeer] = None,
+            live: bool = False,
+    ) -> asyncio.Task:
+        """Like PyTgCalls.join_group_call, on the account placement picks. join_as must be a peer every
+        account can join as, leave it None to join as the account itself"""
+        return self._run_bg(self._join_group_call(
+            chat_id, lambda call: call.join_group_call(source, bitrate, invite_hash, join_as, live),
+        ))
+
+    def leave_group_call(self, chat_id:int, reason:str = 'committed sudoku') -> asyncio.Task:
+        account = self.placement.pop(chat_id)
+        account.calls.discard(chat_id)
+        return super().leave_group_call(chat_id, reason)
+
+    def _flood_listener(self, account:Account) -> Callable[[float], None]:
+        def listener(seconds:float) -> None:
+            if seconds >= self.move_after and account.calls and not account.evacuating:
+                self._run_bg(self._evacuate(account))
+        return listener
+
+    async def _evacuate(self, account:Account) -> None:
+        account.evacuating = True
+        slots = asyncio.Semaphore(MOVE_CONCURRENCY)
+
+        async def move(chat_id:int) -> bool:
+            async with slots:
+                if self.placement.get(chat_id) is not account:
+                    return False # left or placed meanwhile
+                try:
+                    return await self._move(chat_id, account)
+                except PlacementError:
+                    logger.warning("No other account can take the call in %d, it stays on #%d", chat_id, account.index)
+                except Exception:
+                    logger.exception("Could not move the call in %d off account #%d", chat_id, account.index)
+                return False
+
+        try:
+            moved = sum(await asyncio.gather(*(move(chat_id) for chat_id in list(account.calls))))
+            logger.info("Moved %d calls off account #%d, rate limited for %.0fs", moved, account.index, account.limiter.flooded())
+        finally:
+            account.evacuating = False
+
+    async def _move(self, chat_id:int, account:Account) -> bool:
+        """Join the call of chat_id on another account where it was, then leave it on account"""
+        old = self.calls[chat_id]
+        source : Union[str, Broadcast]
+        if old.broadcast:
+            source, start, live = old.broadcast, 0.0, False
+        elif old.track and isinstance(old.track.source, str):
+            path = old.track.source
+            # decoded sources are live while their cache file grows, only raw files are live for the user
+            source, start, live = path, old.position, old.track.growing and not needs_decoding(path)
+        else:
+            return False
+        queued = list(old.queue)
+        if old.upcoming:
+            upcoming = old.upcoming.source
+            if not isinstance(upcoming, str):
+                return False
+            queued.insert(0, (upcoming, old.upcoming.live and not needs_decoding(upcoming)))
+        if not all(isinstance(s, str) for s, _ in queued):
+            return False
+        target, new = await self._join(chat_id, lambda call: call.join_group_call(
+            source, old.bitrate, old.invite_hash, old.join_as, live, start,
+        ), {account})
+        if self.placement.get(chat_id) is not account: # left while joining, nobody wants it anymore
+            target.calls.discard(chat_id)
+            await new.leave_group_call('moved')
+            return False
+        self.placement[chat_id], self.calls[chat_id] = target, new
+        account.calls.discard(chat_id)
+        try:
+            if old.paused:
+                await new.pause_stream()
+            if old.local_volume != 1.0:
+                await new.set_local_volume(old.local_volume, 0.0)
+            for queued_source, queued_live in queued:
+                await new.enqueue(queued_source, queued_live)
+        finally:
+            try:
+                await old.leave_group_call('moved')
+            except FloodWait: # NodeJS left already, the server drops it on its own
+                pass
+        return True
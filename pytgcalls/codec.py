@@ -0,0 +1,69 @@
+import json
+import struct
+import asyncio
+
+from typing import Optional
+
+try:
+    import msgpack
+except ImportError: # optional, only needed for the binary wire format
+    msgpack = None
+
+from .helpers import DependancyException
+
+class CodecException(Exception):
+    pass
+
+class JsonLinesCodec:
+    """One JSON document per line, human readable and dependency free"""
+    name = 'json'
+
+    def encode(self, packet:dict) -> bytes:
+        return json.dumps(packet).encode('utf-8') + b'\n'
+
+    async def read(self, stream:asyncio.StreamReader) -> Optional[dict]:
+        try:
+            buf = await stream.readline()
+        except ValueError as e: # longer than the reader's limit, dropped: what's left of it fails to parse next
+            raise CodecException("Packet exceeds the reader's limit") from e
+        if not buf:
+            return None
+        try:
+            return json.loads(buf)
+        except json.JSONDecodeError as e:
+            raise CodecException(f"Could not deserialize packet {buf!r}") from e
+
+class MsgpackCodec:
+    """msgpack documents, each prefixed with its length as a 4 bytes big endian unsigned int"""
+    name = 'msgpack'
+    HEADER = struct.Struct('>I')
+
+    def __init__(self):
+        if msgpack is None:
+            raise DependancyException("Dependancy 'msgpack' is required for the msgpack wire format")
+        self._packer = msgpack.Packer(use_bin_type=True)
+
+    def encode(self, packet:dict) -> bytes:
+        body = self._packer.pack(packet)
+        return self.HEADER.pack(len(body)) + body
+
+    async def read(self, stream:asyncio.StreamReader) -> Optional[dict]:
+        try:
+            head = await stream.readexactly(self.HEADER.size)
+            body = await stream.readexactly(self.HEADER.unpack(head)[0])
+        except asyncio.IncompleteReadError:
+            return None
+        try:
+            return msgpack.unpackb(body, raw=False)
+        except Exception as e: # msgpack raises a whole family of unrelated exceptions
+            raise CodecException(f"Could not deserialize packet {body!r}") from e
+
+CODECS = {
+    JsonLinesCodec.name: JsonLinesCodec,
+    MsgpackCodec.name: MsgpackCodec,
+}
+
+def get_codec(name:str):
+    if name not in CODECS:
+        raise ValueError(f"Unknown wire format '{name}', available: {', '.join(CODECS)}")
+    return CODECS[name]()
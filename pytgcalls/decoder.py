@@ -0,0 +1,134 @@
+import os
+import re
+import heapq
+import asyncio
+import logging
+
+from itertools import count
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from .helpers import DependancyException
+
+logger = logging.getLogger(__name__)
+
+# decoding for what's on air right now always goes before prefetching what's next
+PLAYING = 0
+PREFETCH = 1
+
+# anything else is handed to ffmpeg
+RAW_EXTENSIONS = ('', '.raw', '.pcm', '.s16le')
+
+BENCH = re.compile(rb'bench: utime=([\d.]+)s stime=([\d.]+)s')
+
+class DecoderError(Exception):
+    pass
+
+def needs_decoding(source:str) -> bool:
+    """Raw PCM files are streamed as they are, everything else, urls included, goes through ffmpeg"""
+    if '://' in source:
+        return True
+    return os.path.splitext(source)[1].lower() not in RAW_EXTENSIONS
+
+class DecoderPool:
+    """Caps how many ffmpeg processes decode at once. Waiting decodes are served by priority,
+    then in arrival order. Decoded PCM is streamed out in chunks, nothing is written to disk"""
+    def __init__(self, max_decoders:Optional[int] = None, ffmpeg:str = 'ffmpeg', chunk_size:int = 64 * 1024):
+        self.max_decoders : int = max_decoders or os.cpu_count() or 1
+        self.ffmpeg : str = ffmpeg
+        self.chunk_size : int = chunk_size
+        self.running : int = 0
+        self._waiting : List[Tuple[int, int, asyncio.Future]] = [] # heap of (priority, arrival, slot)
+        self._arrival = count()
+        self.decodes : int = 0
+        self.failures : int = 0
+        self.cpu_seconds : float = 0.0 # user + system time reported by ffmpeg -benchmark
+        self.queue_wait_total : float = 0.0
+        self.queue_wait_max : float = 0.0
+
+    def resize(self, max_decoders:int) -> None:
+        self.max_decoders = max_decoders
+        self._wake()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'running': self.running,
+            'waiting': len(self._waiting),
+            'decodes': self.decodes,
+            'failures': self.failures,
+            'cpu_seconds': self.cpu_seconds,
+            'queue_wait_avg': self.queue_wait_total / self.decodes if self.decodes else 0.0,
+            'queue_wait_max': self.queue_wait_max,
+        }
+
+    def _wake(self) -> None:
+        while self._waiting and self.running < self.max_decoders:
+            _, _, slot = heapq.heappop(self._waiting)
+            if slot.done(): # waiter was cancelled
+                continue
+            self.running += 1
+            slot.set_result(None)
+
+    async def _acquire(self, priority:int) -> None:
+        if self.running < self.max_decoders and not self._waiting:
+            self.running += 1
+            return
+        slot = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._arrival), slot))
+        try:
+            await slot
+        except asyncio.CancelledError:
+            if slot.done() and not slot.cancelled(): # got the slot right as we were cancelled
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        self.running -= 1
+        self._wake()
+
+    async def decode(self, source:str, sample_rate:int = 48000, priority:int = PLAYING, channels:int = 1, start:float = 0.0, skip_bytes:int = 0) -> AsyncIterator[bytes]:
+        """Yield source as raw 16 bit PCM at sample_rate, once a decoder slot is free.
+        Decoding begins start seconds in, or start seconds after byte skip_bytes: reading an elementary
+        stream (see seek_index) from a known packet offset, what lies before is never read"""
+        if skip_bytes: # decoded and dropped, start is what remains after the indexed packet
+            seek = ['-skip_initial_bytes', str(skip_bytes), '-i', source] + (['-ss', str(start)] if start else [])
+        else: # ffmpeg seeks in the input with the container's own index
+            seek = (['-ss', str(start)] if start else []) + ['-i', source]
+        loop = asyncio.get_event_loop()
+        queued = loop.time()
+        await self._acquire(priority)
+        wait = loop.time() - queued
+        self.queue_wait_total += wait
+        self.queue_wait_max = max(self.queue_wait_max, wait)
+        self.decodes += 1
+        proc = None
+        try:
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    self.ffmpeg, '-nostdin', '-hide_banner', '-nostats', '-benchmark',
+                    *seek, '-f', 's16le', '-ac', str(channels), '-acodec', 'pcm_s16le', '-ar', str(sample_rate), 'pipe:1',
+                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                )
+            except FileNotFoundError:
+                raise DependancyException(f"Dependancy '{self.ffmpeg}' is required to play compressed audio")
+            assert proc.stdout is not None and proc.stderr is not None # both piped
+            stderr = loop.create_task(proc.stderr.read()) # drained concurrently, ffmpeg would block on a full pipe
+            while True:
+                chunk = await proc.stdout.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+            code = await proc.wait()
+            log = await stderr
+            bench = BENCH.search(log)
+            if bench:
+                self.cpu_seconds += float(bench.group(1)) + float(bench.group(2))
+            if code != 0:
+                self.failures += 1
+                raise DecoderError(f"ffmpeg exited with {code} decoding '{source}' : {log.decode(errors='replace').strip()[-500:]}")
+        finally:
+            if proc and proc.returncode is None: # consumer went away early
+                proc.kill()
+                await proc.wait()
+            self._release()
+
+DECODERS = DecoderPool()
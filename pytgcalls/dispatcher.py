@@ -0,0 +1,108 @@
+import logging
+import weakref
+
+from typing import Any, Awaitable, Callable, Dict, List
+
+from pyrogram import Client, ContinuePropagation
+from pyrogram.raw.types import ChannelForbidden
+from pyrogram.raw.types import GroupCall as RawGroupCall
+from pyrogram.raw.types import GroupCallDiscarded
+from pyrogram.raw.types import InputGroupCall
+from pyrogram.raw.types import MessageActionInviteToGroupCall
+from pyrogram.raw.types import UpdateChannel
+from pyrogram.raw.types import UpdateGroupCall
+from pyrogram.raw.types import UpdateNewChannelMessage
+
+from .peer_cache import ClientCache
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+# chat ids of channels and supergroups are this minus their channel id, like pyrogram's
+MAX_CHANNEL_ID = -1000000000000
+
+class UpdateDispatcher:
+    """Single raw update handler for a pyrogram Client.
+    Updates are filtered by type and routed by chat id to the GroupCall registered for that chat."""
+    _instances : 'weakref.WeakKeyDictionary[Client, UpdateDispatcher]' = weakref.WeakKeyDictionary()
+
+    def __init__(self, client:Client):
+        self.client : Client = client
+        self.cache : ClientCache = ClientCache.for_client(client)
+        self.calls : Dict[int, Any] = {}
+        self.invite_callbacks : List[Callable] = []
+        self.routes : Dict[type, Callable[[Any, dict], Awaitable]] = {
+            UpdateChannel: self._on_channel,
+            UpdateGroupCall: self._on_group_call,
+            UpdateNewChannelMessage: self._on_channel_message,
+        }
+        self.client.on_raw_update()(self._handler)
+
+    @classmethod
+    def for_client(cls, client:Client) -> 'UpdateDispatcher':
+        if client not in cls._instances:
+            cls._instances[client] = cls(client)
+        return cls._instances[client]
+
+    def register(self, call:Any) -> None:
+        self.calls[call.chat_id] = call
+
+    def unregister(self, call:Any) -> None:
+        chat_id = call.chat_id
+        if self.calls.get(chat_id) is call:
+            del self.calls[chat_id]
+
+    def on_group_call_invite(self) -> Callable:
+        def decorator(fun:Callable) -> Callable:
+            self.invite_callbacks.append(fun)
+            return fun
+        return decorator
+
+    async def _handler(self, client, update, users, chats):
+        route = self.routes.get(type(update))
+        if route is not None:
+            tracer = tracing.TRACER
+            token = tracer.start('dispatch', {'update': type(update).__name__}) if tracer else None
+            error = None
+            try:
+                await route(update, chats)
+            except Exception as e:
+                error = e
+                logger.exception("Exception dispatching update %s", type(update).__name__)
+            if tracer:
+                tracer.end(token, error)
+        raise ContinuePropagation() # so that it won't ever shadow other handlers
+
+    async def _on_channel(self, update:UpdateChannel, chats:dict) -> None:
+        if update.channel_id not in chats or not isinstance(chats[update.channel_id], ChannelForbidden):
+            return
+        chat_id = MAX_CHANNEL_ID - update.channel_id
+        self.cache.forget_chat(chat_id)
+        call = self.calls.get(chat_id)
+        if call is not None:
+            await call._on_kicked()
+
+    async def _on_group_call(self, update:UpdateGroupCall, chats:dict) -> None:
+        chat_id = MAX_CHANNEL_ID - update.chat_id
+        call = self.calls.get(chat_id)
+        if isinstance(update.call, RawGroupCall):
+            input_call = InputGroupCall(
+                access_hash=update.call.access_hash,
+                id=update.call.id,
+            )
+            self.cache.calls.put(chat_id, input_call)
+            if call is not None:
+                call.call = input_call
+        elif isinstance(update.call, GroupCallDiscarded):
+            self.cache.calls.pop(chat_id)
+            if call is not None:
+                await call._on_closed()
+
+    async def _on_channel_message(self, update:UpdateNewChannelMessage, chats:dict) -> None:
+        if not isinstance(getattr(update.message, 'action', None), MessageActionInviteToGroupCall):
+            return
+        for cb in self.invite_callbacks:
+            try:
+                await cb(self.client, update.message)
+            except Exception:
+                logger.exception("Exception running group call invite callback")
@@ -0,0 +1,82 @@
+"use strict";
+Object.defineProperty(exports, "__esModule", { value: true });
+exports.AudioRing = void 0;
+// Fixed capacity ring of PCM bytes. The capacity is a whole number of frames
+// and frames are always read at frame aligned offsets, so a frame never wraps
+// around and can be handed out as a view over the ring memory: no copies and
+// no allocations once constructed.
+class AudioRing {
+    constructor(minCapacity, frameSize) {
+        this.frameSize = frameSize;
+        this.readIndex = 0;
+        this.writeIndex = 0;
+        this.capacity = Math.ceil(minCapacity / frameSize) * frameSize;
+        // allocUnsafeSlow gives the ring its own ArrayBuffer, so views start aligned
+        this.buffer = Buffer.allocUnsafeSlow(this.capacity);
+        this.frames = [];
+        for (let offset = 0; offset < this.capacity; offset += frameSize) {
+            this.frames.push(new Int16Array(this.buffer.buffer, this.buffer.byteOffset + offset, frameSize / 2));
+        }
+    }
+    get length() {
+        return this.writeIndex - this.readIndex;
+    }
+    get free() {
+        return this.capacity - this.length;
+    }
+    // Copies as much of chunk as fits, returns how many bytes were taken
+    write(chunk) {
+        const length = Math.min(chunk.length, this.free);
+        const position = this.writeIndex % this.capacity;
+        const head = Math.min(length, this.capacity - position);
+        chunk.copy(this.buffer, position, 0, head);
+        if (head < length) {
+            chunk.copy(this.buffer, 0, head, length);
+        }
+        this.writeIndex += length;
+        return length;
+    }
+    // View over the next frame, valid until the ring is written again
+    readFrame() {
+        if (this.length < this.frameSize) {
+            return null;
+        }
+        const frame = this.frames[(this.readIndex % this.capacity) / this.frameSize];
+        this.readIndex += this.frameSize;
+        return frame;
+    }
+    // Bytes ever written/read since the last clear, track boundaries are kept in these units
+    get writeOffset() {
+        return this.writeIndex;
+    }
+    get readOffset() {
+        return this.readIndex;
+    }
+    // Copy of everything written from offset on, still unread
+    copyFrom(offset) {
+        offset = Math.max(offset, this.readIndex);
+        const out = Buffer.allocUnsafe(this.writeIndex - offset);
+        const position = offset % this.capacity;
+        const head = Math.min(out.length, this.capacity - position);
+        this.buffer.copy(out, 0, position, position + head);
+        if (head < out.length) {
+            this.buffer.copy(out, head, 0, out.length - head);
+        }
+        return out;
+    }
+    // Drop everything written from offset on
+    truncate(offset) {
+        this.writeIndex = Math.max(this.readIndex, Math.min(offset, this.writeIndex));
+    }
+    // Drop unread bytes up to offset, rounded down to a whole frame so reads stay aligned
+    skipTo(offset) {
+        offset = Math.min(offset, this.writeIndex);
+        offset -= offset % this.frameSize;
+        this.readIndex = Math.max(this.readIndex, offset);
+    }
+    clear() {
+        this.readIndex = 0;
+        this.writeIndex = 0;
+    }
+}
+exports.AudioRing = AudioRing;
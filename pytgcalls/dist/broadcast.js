@@ -0,0 +1,145 @@
+"use strict";
+Object.defineProperty(exports, "__esModule", { value: true });
+exports.Broadcast = exports.Subscription = void 0;
+const events_1 = require("events");
+const stream_1 = require("./stream");
+const gain_1 = require("./gain");
+const metrics_1 = require("./metrics");
+// One subscriber of a broadcast: the audio source of its own peer connection,
+// with its own pause and volume. Pausing drops frames, the broadcast goes on.
+class Subscription extends events_1.EventEmitter {
+    constructor(broadcast, audioSource) {
+        super();
+        this.broadcast = broadcast;
+        this.audioSource = audioSource;
+        this.paused = false;
+        this.stopped = false;
+        this.gain = new gain_1.Gain();
+        this.counters = new metrics_1.FrameCounters();
+    }
+    // Nothing is buffered per subscriber
+    get cacheBytes() {
+        return 0;
+    }
+    get cacheFill() {
+        return 0;
+    }
+    get position() {
+        return this.broadcast.stream.position;
+    }
+    get playing() {
+        return !this.paused && this.broadcast.stream.playing;
+    }
+    // Frames this subscriber sent, buffering and underruns of the broadcast
+    metrics() {
+        const stream = this.broadcast.stream;
+        return {
+            ...this.counters.report(stream.bufferMs),
+            underruns: stream.counters.underruns,
+            starved_frames: stream.counters.starvedFrames,
+        };
+    }
+    setVolume(volume, rampMs = 50) {
+        const stream = this.broadcast.stream;
+        this.gain.set(volume, (rampMs * stream.sampleRate * stream.channelCount) / 1000);
+    }
+    pause() {
+        if (this.stopped) {
+            throw new Error('Cannot pause when stopped');
+        }
+        this.paused = true;
+        this.emit('pause', this.paused);
+    }
+    resume() {
+        if (this.stopped) {
+            throw new Error('Cannot resume when stopped');
+        }
+        this.paused = false;
+        this.emit('resume', this.paused);
+    }
+    stop() {
+        this.stopped = true;
+        this.broadcast.unsubscribe(this);
+        this.emit('finish');
+    }
+    push(data) {
+        if (this.paused) {
+            return;
+        }
+        this.counters.sent(this.broadcast.stream.late);
+        const samples = this.gain.apply(data.samples);
+        if (samples === data.samples) {
+            this.audioSource.onData(data);
+            return;
+        }
+        // the gain reuses its buffer, so does the frame wrapping it
+        if (this.frame === undefined || this.frame.samples !== samples) {
+            this.frame = { ...data, samples };
+        }
+        this.audioSource.onData(this.frame);
+    }
+}
+exports.Subscription = Subscription;
+// Reads, buffers and paces a source once, then hands every frame to all of
+// its subscribers. Stands in for the RTCAudioSource of its Stream, so the
+// per-subscriber cost is one onData call per frame.
+class Broadcast extends events_1.EventEmitter {
+    constructor(sid, source, bitrate, logMode, buffer_lenght) {
+        super();
+        this.sid = sid;
+        this.file_path = '';
+        this.subscribers = new Set();
+        this.setSource(source);
+        this.stream = new stream_1.Stream(source, 16, bitrate, 1, logMode, buffer_lenght, undefined, this);
+        this.stream.on('finish', () => {
+            if (this.stream.stopped) {
+                return;
+            }
+            this.subscribers.forEach((sub) => sub.emit('finish'));
+            this.emit('finish');
+        });
+        this.stream.on('track_changed', (track) => this.emit('track_changed', track));
+        this.stream.on('underrun', () => {
+            this.subscribers.forEach((sub) => sub.emit('underrun'));
+            this.emit('underrun');
+        });
+    }
+    get subscriberCount() {
+        return this.subscribers.size;
+    }
+    createTrack() {
+        throw new Error('A broadcast has no track, subscribe a peer connection');
+    }
+    onData(data) {
+        this.subscribers.forEach((sub) => sub.push(data));
+    }
+    subscribe(audioSource) {
+        const subscription = new Subscription(this, audioSource);
+        this.subscribers.add(subscription);
+        return subscription;
+    }
+    unsubscribe(subscription) {
+        this.subscribers.delete(subscription);
+    }
+    setSource(source) {
+        this.file_path =
+            typeof source === 'string' ? source : source.path.toString();
+    }
+    pause() {
+        this.stream.pause();
+    }
+    resume() {
+        this.stream.resume();
+    }
+    changeStream(source, track = '', start = 0) {
+        this.setSource(source);
+        this.stream.setReadable(source, track, start);
+    }
+    // Subscribers are left without audio, they are told the stream ended
+    stop() {
+        this.stream.stop();
+        this.subscribers.forEach((sub) => sub.emit('finish'));
+        this.subscribers.clear();
+    }
+}
+exports.Broadcast = Broadcast;
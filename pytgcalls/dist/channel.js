@@ -0,0 +1,162 @@
+"use strict";
+Object.defineProperty(exports, "__esModule", { value: true });
+exports.Channel = void 0;
+const events_1 = require("events");
+const msgpack_1 = require("@msgpack/msgpack");
+// Multiplexed stdio channel towards the Python side. Inbound commands are
+// emitted as 'packet' events, outbound packets sent during the same tick
+// are coalesced into a single write. Requests towards Python are
+// correlated with their response by pid.
+class Channel extends events_1.EventEmitter {
+    constructor(codec = 'json', input = process.stdin, output = process.stdout) {
+        super();
+        this.codec = codec;
+        this.input = input;
+        this.output = output;
+        this.pending = Buffer.alloc(0);
+        this.outbox = [];
+        this.flushScheduled = false;
+        this.packetCount = 0;
+        this.requests = new Map();
+    }
+    static codecFromArgv(argv = process.argv) {
+        for (const arg of argv) {
+            if (arg.startsWith('--codec=')) {
+                const codec = arg.split('=')[1];
+                if (codec === 'json' || codec === 'msgpack') {
+                    return codec;
+                }
+                throw new Error('Unknown wire format: ' + codec);
+            }
+        }
+        return 'json';
+    }
+    start() {
+        this.input.on('data', (chunk) => this.receive(chunk));
+        this.input.on('end', () => {
+            for (const pending of this.requests.values()) {
+                pending.reject(new Error('Channel closed'));
+            }
+            this.requests.clear();
+            this.emit('close');
+        });
+    }
+    ack(command, data = {}) {
+        this.send({ ...data, _: 'ack', sid: command.sid, pid: command.pid });
+    }
+    status(sid, status, data = {}) {
+        this.send({ ...data, _: 'status', sid, pid: this.packetCount++, status });
+    }
+    event(sid, event, data = {}) {
+        this.send({ ...data, _: 'event', sid, pid: this.packetCount++, event });
+    }
+    request(sid, request, data, timeoutMs = 30000) {
+        const pid = this.packetCount++;
+        return new Promise((resolve, reject) => {
+            const timer = setTimeout(() => {
+                this.requests.delete(pid);
+                reject(new Error('Request timed out: ' + request));
+            }, timeoutMs);
+            this.requests.set(pid, {
+                resolve: (data) => {
+                    clearTimeout(timer);
+                    resolve(data);
+                },
+                reject: (error) => {
+                    clearTimeout(timer);
+                    reject(error);
+                },
+            });
+            this.send({ _: 'request', sid, pid, request, data });
+        });
+    }
+    resolve(packet) {
+        const pending = this.requests.get(packet.pid);
+        if (pending === undefined) {
+            console.error('UNEXPECTED_RESPONSE ->', packet.pid);
+            return;
+        }
+        this.requests.delete(packet.pid);
+        if (packet.error) {
+            pending.reject(new Error(packet.error));
+        }
+        else {
+            pending.resolve(packet.data);
+        }
+    }
+    send(packet) {
+        this.outbox.push(this.encode(packet));
+        if (!this.flushScheduled) {
+            this.flushScheduled = true;
+            setImmediate(() => this.flush());
+        }
+    }
+    flush() {
+        this.flushScheduled = false;
+        const buf = this.outbox.length === 1
+            ? this.outbox[0]
+            : Buffer.concat(this.outbox);
+        this.outbox = [];
+        this.output.write(buf);
+    }
+    encode(packet) {
+        if (this.codec === 'json') {
+            return Buffer.from(JSON.stringify(packet) + '\n');
+        }
+        const body = (0, msgpack_1.encode)(packet);
+        const frame = Buffer.allocUnsafe(4 + body.length);
+        frame.writeUInt32BE(body.length, 0);
+        frame.set(body, 4);
+        return frame;
+    }
+    receive(chunk) {
+        this.pending =
+            this.pending.length > 0
+                ? Buffer.concat([this.pending, chunk])
+                : chunk;
+        let offset = 0;
+        while (offset < this.pending.length) {
+            let start;
+            let end;
+            if (this.codec === 'json') {
+                end = this.pending.indexOf(10, offset);
+                if (end < 0) {
+                    break;
+                }
+                start = offset;
+                offset = end + 1;
+            }
+            else {
+                if (this.pending.length - offset < 4) {
+                    break;
+                }
+                start = offset + 4;
+                end = start + this.pending.readUInt32BE(offset);
+                if (end > this.pending.length) {
+                    break;
+                }
+                offset = end;
+            }
+            try {
+                const packet = this.decode(this.pending.subarray(start, end));
+                if (packet._ === 'response') {
+                    this.resolve(packet);
+                }
+                else {
+                    this.emit('packet', packet);
+                }
+            }
+            catch (e) {
+                console.error('INVALID_PACKET ->', e);
+            }
+        }
+        this.pending = this.pending.subarray(offset);
+    }
+    decode(frame) {
+        if (this.codec === 'json') {
+            return JSON.parse(frame.toString('utf-8'));
+        }
+        return (0, msgpack_1.decode)(frame);
+    }
+}
+exports.Channel = Channel;
@@ -0,0 +1,43 @@
+"use strict";
+Object.defineProperty(exports, "__esModule", { value: true });
+exports.Gain = void 0;
+// Software gain applied to frames on their way to an RTCAudioSource. Changes
+// ramp linearly, sample by sample, so they never click. At unity frames are
+// passed through untouched, otherwise they are scaled into a buffer of our
+// own: the frame handed in may be shared.
+class Gain {
+    constructor() {
+        this.current = 1;
+        this.target = 1;
+        // change per sample while ramping
+        this.step = 0;
+    }
+    get volume() {
+        return this.target;
+    }
+    set(volume, rampSamples) {
+        this.target = Math.max(0, volume);
+        this.step =
+            Math.abs(this.target - this.current) / Math.max(1, rampSamples);
+    }
+    apply(samples) {
+        if (this.current === 1 && this.target === 1) {
+            return samples;
+        }
+        if (this.scaled === undefined || this.scaled.length !== samples.length) {
+            this.scaled = new Int16Array(samples.length);
+        }
+        for (let i = 0; i < samples.length; i++) {
+            if (this.current !== this.target) {
+                this.current =
+                    this.current < this.target
+                        ? Math.min(this.target, this.current + this.step)
+                        : Math.max(this.target, this.current - this.step);
+            }
+            // saturate, Int16Array would wrap around
+            this.scaled[i] = Math.max(-32768, Math.min(32767, samples[i] * this.current));
+        }
+        return this.scaled;
+    }
+}
+exports.Gain = Gain;
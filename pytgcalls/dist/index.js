@@ -0,0 +1,307 @@
+"use strict";
+Object.defineProperty(exports, "__esModule", { value: true });
+const fs_1 = require("fs");
+const rtc_connection_1 = require("./rtc-connection");
+const channel_1 = require("./channel");
+const offer_pool_1 = require("./offer-pool");
+const ring_source_1 = require("./ring-source");
+const live_file_1 = require("./live-file");
+const broadcast_1 = require("./broadcast");
+const stream_1 = require("./stream");
+const scheduler_1 = require("./scheduler");
+// worker wide status, carries the frame clock health to Python
+const STATUS_INTERVAL_MS = 1000;
+(async () => {
+    var _a;
+    const logMode = parseInt(((_a = process.argv.find((arg) => arg.startsWith('--log-mode='))) !== null && _a !== void 0 ? _a : '=0')
+        .split('=')[1]);
+    const channel = new channel_1.Channel(channel_1.Channel.codecFromArgv());
+    channel.start();
+    channel.on('close', () => process.exit(0));
+    process.on('SIGINT', () => process.exit(0));
+    console.error('\x1b[32m', 'Started NodeJS Core!', '\x1b[0m');
+    const connections = new Map();
+    // keyed by their own sid, subscribers are pinned to this same worker
+    const broadcasts = new Map();
+    const offers = new offer_pool_1.OfferPool(offer_pool_1.OfferPool.sizeFromArgv());
+    // playback position of every session, [seconds, playing], Python
+    // extrapolates between two reports instead of asking
+    const positions = () => {
+        const result = {};
+        connections.forEach((connection, sid) => {
+            const stream = connection.stream;
+            result[sid] = [stream.position, stream.playing];
+        });
+        broadcasts.forEach((broadcast, sid) => {
+            const stream = broadcast.stream;
+            result[sid] = [stream.position, stream.playing];
+        });
+        return result;
+    };
+    // audio health of every session, aggregated in the same packet
+    const metrics = () => {
+        const result = {};
+        connections.forEach((connection, sid) => {
+            result[sid] = {
+                ...connection.stream.metrics(),
+                join_ms: connection.requestMs + connection.connectMs,
+            };
+        });
+        broadcasts.forEach((broadcast, sid) => {
+            result[sid] = {
+                ...broadcast.stream.metrics(),
+                subscribers: broadcast.subscriberCount,
+            };
+        });
+        return result;
+    };
+    setInterval(() => channel.status('', 'running', {
+        scheduler: scheduler_1.scheduler.stats(),
+        positions: positions(),
+        metrics: metrics(),
+    }), STATUS_INTERVAL_MS).unref();
+    // Rings and live files Python still writes into, by path: with a queue
+    // several of them can be open for the same session
+    const writable = new Map();
+    // Raw PCM file path, a file still being written, or the shared memory ring
+    // Python writes into. Files are read from data.offset on, when seeking,
+    // rings from cursor data.offset on, when replayed after a crash
+    const buildSource = (data) => {
+        var _a;
+        const offset = (_a = data['offset']) !== null && _a !== void 0 ? _a : 0;
+        let source;
+        if (data['ring']) {
+            source = new ring_source_1.RingSource(data['ring']['path'], data['ring']['capacity'], (cursor) => channel.event(data.sid, 'ring_read', {
+                cursor,
+                path: data['ring']['path'],
+            }), offset);
+        }
+        else if (data['live']) {
+            source = new live_file_1.LiveFileSource(data['file_path'], undefined, offset);
+        }
+        else if (offset > 0) {
+            return (0, fs_1.createReadStream)(data['file_path'], { start: offset });
+        }
+        else {
+            return data['file_path'];
+        }
+        const path = source.path;
+        writable.set(path, source);
+        source.on('close', () => {
+            if (writable.get(path) === source) {
+                writable.delete(path);
+            }
+        });
+        return source;
+    };
+    // What a session is doing after its source changed, pausing is kept
+    const streamStatus = (stream) => stream.paused ? 'paused' : 'playing';
+    // Queues belong to whoever owns a Stream, broadcast subscribers don't
+    const ownStream = (stream) => {
+        if (stream instanceof broadcast_1.Subscription) {
+            throw new Error('Broadcast subscribers have no queue of their own');
+        }
+        return stream;
+    };
+    channel.on('packet', async function (data) {
+        var _a, _b;
+        if (logMode > 0) {
+            console.error('REQUEST: ', data);
+        }
+        const connection = connections.get(data.sid);
+        const broadcast = broadcasts.get(data.sid);
+        if (data['action'] === 'broadcast') {
+            if (broadcast) {
+                channel.ack(data, { result: 'ALREADY_BROADCASTING' });
+                return;
+            }
+            try {
+                const created = new broadcast_1.Broadcast(data.sid, buildSource(data), data['bitrate'], logMode, data['buffer_lenght']);
+                created.stream.setStart((_a = data['start']) !== null && _a !== void 0 ? _a : 0);
+                created.on('underrun', () => channel.event(data.sid, 'underrun', {}));
+                created.on('track_changed', (track) => channel.event(data.sid, 'track_changed', { track }));
+                created.on('finish', () => {
+                    channel.status(data.sid, 'ended');
+                    channel.event(data.sid, 'ended_stream', {});
+                });
+                broadcasts.set(data.sid, created);
+            }
+            catch (e) {
+                channel.status(data.sid, 'error');
+                channel.ack(data, { result: 'ERROR', error: String(e) });
+                return;
+            }
+            channel.status(data.sid, 'playing');
+            channel.ack(data, { result: 'BROADCASTING' });
+            return;
+        }
+        if (data['action'] === 'join_call') {
+            if (connection) {
+                channel.ack(data, { result: 'ALREADY_JOINED' });
+                return;
+            }
+            let source;
+            if (data['broadcast']) {
+                source = broadcasts.get(data['broadcast']);
+                if (!source) {
+                    channel.status(data.sid, 'error');
+                    channel.ack(data, { result: 'NO_SUCH_BROADCAST' });
+                    return;
+                }
+            }
+            channel.status(data.sid, 'joining');
+            // before claiming an offer, a missing ring or file must not cost one
+            let built;
+            try {
+                built = source !== null && source !== void 0 ? source : buildSource(data);
+            }
+            catch (e) {
+                channel.status(data.sid, 'error');
+                channel.ack(data, { result: 'ERROR', error: String(e) });
+                return;
+            }
+            const claimStart = Date.now();
+            let offer, pooled;
+            try {
+                [offer, pooled] = await offers.claim();
+            }
+            catch (e) {
+                channel.status(data.sid, 'error');
+                channel.ack(data, { result: 'JOIN_ERROR', error: String(e) });
+                return;
+            }
+            const offerMs = Date.now() - claimStart;
+            const created = new rtc_connection_1.default(data.sid, data.chat_id, built, channel, data['bitrate'], logMode, data['buffer_lenght'], data['invite_hash'], offer);
+            if (created.stream instanceof stream_1.Stream) {
+                created.stream.setStart((_b = data['start']) !== null && _b !== void 0 ? _b : 0);
+            }
+            connections.set(data.sid, created);
+            const joined = await created.joinCall();
+            const timings = {
+                pooled,
+                offer_ms: offerMs,
+                request_ms: created.requestMs,
+                connect_ms: created.connectMs,
+            };
+            if (joined) {
+                channel.status(data.sid, 'playing');
+                channel.ack(data, { result: 'JOINED_VOICE_CHAT', timings });
+            }
+            else {
+                // start may have given up before its connection or stream
+                // were closed, neither must outlive the failed join
+                created.stop();
+                connections.delete(data.sid);
+                channel.status(data.sid, 'error');
+                channel.ack(data, { result: 'JOIN_ERROR', timings });
+            }
+            if (logMode > 0) {
+                console.error('UPDATED_CONNECTIONS: ', connections.size);
+            }
+            return;
+        }
+        if (data['action'] === 'prewarm') {
+            offers.resize(data['size']);
+            channel.ack(data, { result: 'OK', available: offers.available });
+            return;
+        }
+        const session = connection !== null && connection !== void 0 ? connection : broadcast;
+        if (!session) {
+            channel.ack(data, { result: 'NOT_IN_CALL' });
+            return;
+        }
+        try {
+            if (data['action'] === 'stop_broadcast' && broadcast) {
+                broadcast.stop();
+                broadcasts.delete(data.sid);
+                channel.status(data.sid, 'left');
+                channel.ack(data, { result: 'STOPPED_BROADCAST' });
+            }
+            else if (data['action'] === 'leave_call' && connection) {
+                connection.stop();
+                connections.delete(data.sid);
+                if (data['type'] === 'kicked_from_group') {
+                    channel.status(data.sid, 'kicked');
+                    channel.ack(data, { result: 'KICKED_FROM_GROUP' });
+                }
+                else {
+                    channel.status(data.sid, 'left');
+                    channel.ack(data, { result: 'LEFT_VOICE_CHAT' });
+                }
+            }
+            else if (data['action'] === 'pause') {
+                session.pause();
+                channel.status(data.sid, 'paused');
+                channel.ack(data, { result: 'PAUSED_AUDIO_STREAM' });
+            }
+            else if (data['action'] === 'resume') {
+                session.resume();
+                channel.status(data.sid, 'playing');
+                channel.ack(data, { result: 'RESUMED_AUDIO_STREAM' });
+            }
+            else if (data['action'] === 'stats') {
+                channel.ack(data, {
+                    result: 'OK',
+                    cache_bytes: session.stream.cacheBytes,
+                    cache_fill: session.stream.cacheFill,
+                    subscribers: broadcast === null || broadcast === void 0 ? void 0 : broadcast.subscriberCount,
+                });
+            }
+            else if (data['action'] === 'ring_write') {
+                const ring = writable.get(data['path']);
+                if (ring instanceof ring_source_1.RingSource) {
+                    ring.update(data['cursor'], data['eof']);
+                }
+                channel.ack(data, { result: 'OK' });
+            }
+            else if (data['action'] === 'finish_input') {
+                const live = writable.get(data['path']);
+                if (live instanceof live_file_1.LiveFileSource) {
+                    live.finish();
+                }
+                channel.ack(data, { result: 'OK' });
+            }
+            else if (data['action'] === 'change_stream') {
+                session.changeStream(buildSource(data), data['track'], data['start']);
+                channel.status(data.sid, streamStatus(session.stream));
+                channel.ack(data, { result: 'CHANGED_AUDIO_STREAM' });
+            }
+            else if (data['action'] === 'enqueue') {
+                const stream = ownStream(session.stream);
+                stream.enqueue(buildSource(data), data['track']);
+                channel.status(data.sid, streamStatus(stream));
+                channel.ack(data, { result: 'ENQUEUED' });
+            }
+            else if (data['action'] === 'skip') {
+                const skipped = ownStream(session.stream).skip();
+                channel.ack(data, {
+                    result: skipped ? 'SKIPPED' : 'QUEUE_EMPTY',
+                });
+            }
+            else if (data['action'] === 'queue_clear') {
+                ownStream(session.stream).clearQueue();
+                channel.ack(data, { result: 'OK' });
+            }
+            else if (data['action'] === 'queue') {
+                channel.ack(data, {
+                    result: 'OK',
+                    queue: ownStream(session.stream).queued,
+                });
+            }
+            else if (data['action'] === 'volume') {
+                // a broadcast's own stream scales every subscriber at once
+                session.stream.setVolume(data['volume'], data['ramp_ms']);
+                channel.ack(data, { result: 'OK' });
+            }
+            else {
+                channel.ack(data, { result: 'UNKNOWN_ACTION' });
+            }
+        }
+        catch (e) {
+            if (logMode > 0) {
+                console.error('ERROR_INTERNAL: ', e);
+            }
+            channel.ack(data, { result: 'ERROR', error: String(e) });
+        }
+    });
+})();
@@ -0,0 +1,92 @@
+"use strict";
+Object.defineProperty(exports, "__esModule", { value: true });
+exports.LiveFileSource = void 0;
+const fs_1 = require("fs");
+const stream_1 = require("stream");
+// A raw PCM file that is still being written, like a live ffmpeg output.
+// New bytes are picked up on change notifications instead of polling the
+// file size, and the end of the stream is signalled explicitly by Python
+// with finish(): reads only ever touch the fd, never stat the path.
+class LiveFileSource extends stream_1.Readable {
+    // start: byte offset to read from, seeks never read what comes before
+    constructor(path, chunkSize = 64 * 1024, start = 0) {
+        super();
+        this.path = path;
+        this.chunkSize = chunkSize;
+        this.eof = false;
+        this.wanted = 0;
+        this.reading = false;
+        this.changed = false;
+        this.readCursor = start;
+    }
+    finish() {
+        this.eof = true;
+        this.pump();
+    }
+    get starved() {
+        return !this.eof && this.wanted > 0 && !this.reading;
+    }
+    get bytesRead() {
+        return this.readCursor;
+    }
+    _construct(callback) {
+        (0, fs_1.open)(this.path, 'r', (error, fd) => {
+            if (error) {
+                callback(error);
+                return;
+            }
+            this.fd = fd;
+            // coalesced by pump(), a burst of notifications costs one read
+            this.watcher = (0, fs_1.watch)(this.path, () => this.pump());
+            callback();
+        });
+    }
+    _read(size) {
+        this.wanted = Math.max(size, this.chunkSize);
+        this.pump();
+    }
+    _destroy(error, callback) {
+        var _a;
+        (_a = this.watcher) === null || _a === void 0 ? void 0 : _a.close();
+        if (this.fd === undefined) {
+            callback(error);
+            return;
+        }
+        (0, fs_1.close)(this.fd, () => callback(error));
+    }
+    pump() {
+        if (this.reading) {
+            // writer may have appended after our read was issued, look again
+            this.changed = true;
+            return;
+        }
+        if (this.wanted === 0 || this.fd === undefined) {
+            return;
+        }
+        this.reading = true;
+        this.changed = false;
+        const chunk = Buffer.allocUnsafe(this.wanted);
+        (0, fs_1.read)(this.fd, chunk, 0, chunk.length, this.readCursor, (error, n) => {
+            this.reading = false;
+            if (error) {
+                this.destroy(error);
+                return;
+            }
+            if (n === 0) {
+                // caught up with the writer: wait for the next notification
+                if (this.eof) {
+                    this.wanted = 0;
+                    this.push(null);
+                }
+                else if (this.changed) {
+                    this.pump();
+                }
+                return;
+            }
+            this.readCursor += n;
+            this.wanted = 0;
+            this.push(chunk.subarray(0, n));
+        });
+    }
+}
+exports.LiveFileSource = LiveFileSource;
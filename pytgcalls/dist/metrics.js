@@ -0,0 +1,34 @@
+"use strict";
+Object.defineProperty(exports, "__esModule", { value: true });
+exports.FrameCounters = void 0;
+// Audio health of one session, reported to Python in the worker wide status
+// packet. Counters only grow, Python derives rates from two reports.
+class FrameCounters {
+    constructor() {
+        this.framesSent = 0;
+        // sent by a scheduler catching up, after their due time
+        this.lateFrames = 0;
+        this.underruns = 0;
+        // ticks without a frame to send while playing
+        this.starvedFrames = 0;
+        this.lastFrameAt = 0;
+    }
+    sent(late) {
+        this.framesSent += 1;
+        if (late) {
+            this.lateFrames += 1;
+        }
+        this.lastFrameAt = Date.now();
+    }
+    report(bufferMs) {
+        return {
+            buffer_ms: Math.round(bufferMs),
+            frames_sent: this.framesSent,
+            late_frames: this.lateFrames,
+            underruns: this.underruns,
+            starved_frames: this.starvedFrames,
+            since_last_frame_ms: this.lastFrameAt > 0 ? Date.now() - this.lastFrameAt : null,
+        };
+    }
+}
+exports.FrameCounters = FrameCounters;
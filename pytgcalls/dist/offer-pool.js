@@ -0,0 +1,82 @@
+"use strict";
+Object.defineProperty(exports, "__esModule", { value: true });
+exports.OfferPool = void 0;
+const wrtc_1 = require("wrtc");
+const utils_1 = require("./utils");
+// Keeps `size` peer connections with their local offer already set, so that
+// joining a call only needs to claim one instead of negotiating from scratch.
+class OfferPool {
+    constructor(size = 0) {
+        this.size = size;
+        this.ready = [];
+        this.filling = 0;
+        this.refill();
+    }
+    static sizeFromArgv(argv = process.argv) {
+        const arg = argv.find((a) => a.startsWith('--prewarm='));
+        return arg ? parseInt(arg.split('=')[1]) || 0 : 0;
+    }
+    get available() {
+        return this.ready.length;
+    }
+    async create() {
+        const start = Date.now();
+        const audioSource = new wrtc_1.nonstandard.RTCAudioSource();
+        const connection = new wrtc_1.RTCPeerConnection();
+        connection.addTrack(audioSource.createTrack());
+        const offer = await connection.createOffer({
+            offerToReceiveVideo: false,
+            offerToReceiveAudio: true,
+        });
+        await connection.setLocalDescription(offer);
+        if (!offer.sdp) {
+            connection.close();
+            throw new Error('Could not create local offer');
+        }
+        return {
+            connection,
+            audioSource,
+            sdp: (0, utils_1.parseSdp)(offer.sdp),
+            createdMs: Date.now() - start,
+        };
+    }
+    // Returns a prepared offer and whether it came from the pool
+    async claim() {
+        const prepared = this.ready.shift();
+        this.refill();
+        if (prepared !== undefined) {
+            return [prepared, true];
+        }
+        return [await this.create(), false];
+    }
+    resize(size) {
+        var _a;
+        this.size = size;
+        while (this.ready.length > size) {
+            (_a = this.ready.pop()) === null || _a === void 0 ? void 0 : _a.connection.close();
+        }
+        this.refill();
+    }
+    refill() {
+        while (this.ready.length + this.filling < this.size) {
+            this.filling += 1;
+            this.create()
+                .then((prepared) => {
+                if (this.ready.length < this.size) {
+                    this.ready.push(prepared);
+                }
+                else {
+                    prepared.connection.close();
+                }
+            })
+                .catch((e) => console.error('PREWARM_ERROR ->', e))
+                .finally(() => {
+                this.filling -= 1;
+            });
+        }
+    }
+    close() {
+        this.resize(0);
+    }
+}
+exports.OfferPool = OfferPool;
@@ -0,0 +1,60 @@
+"use strict";
+Object.defineProperty(exports, "__esModule", { value: true });
+exports.RingSource = void 0;
+const fs_1 = require("fs");
+const stream_1 = require("stream");
+// Consumer side of a PcmRingBuffer: reads PCM out of the file shared with
+// Python (usually on tmpfs) between its read and write cursors. Python
+// publishes the write cursor, we report back how far we read. A ring handed
+// to a restarted core goes on from the cursor the previous one stopped at.
+class RingSource extends stream_1.Readable {
+    constructor(path, capacity, onConsumed, start = 0) {
+        super();
+        this.path = path;
+        this.capacity = capacity;
+        this.onConsumed = onConsumed;
+        this.readCursor = 0;
+        this.writeCursor = 0;
+        this.eof = false;
+        this.wanted = 0;
+        this.fd = (0, fs_1.openSync)(path, 'r');
+        this.readCursor = this.writeCursor = start;
+    }
+    update(writeCursor, eof) {
+        this.writeCursor = Math.max(this.writeCursor, writeCursor);
+        this.eof = this.eof || eof;
+        if (this.wanted > 0) {
+            this.pump();
+        }
+    }
+    get starved() {
+        return !this.eof && this.readCursor === this.writeCursor;
+    }
+    _read(size) {
+        this.wanted = size;
+        this.pump();
+    }
+    _destroy(error, callback) {
+        (0, fs_1.closeSync)(this.fd);
+        callback(error);
+    }
+    pump() {
+        const available = this.writeCursor - this.readCursor;
+        if (available === 0) {
+            if (this.eof) {
+                this.wanted = 0;
+                this.push(null);
+            }
+            return;
+        }
+        const position = this.readCursor % this.capacity;
+        const length = Math.min(available, this.wanted, this.capacity - position);
+        const chunk = Buffer.allocUnsafe(length);
+        (0, fs_1.readSync)(this.fd, chunk, 0, length, position);
+        this.readCursor += length;
+        this.wanted = 0;
+        this.onConsumed(this.readCursor);
+        this.push(chunk);
+    }
+}
+exports.RingSource = RingSource;
@@ -0,0 +1,111 @@
+"use strict";
+Object.defineProperty(exports, "__esModule", { value: true });
+const tgcalls_1 = require("./tgcalls");
+const broadcast_1 = require("./broadcast");
+class RTCConnection {
+    constructor(sid, chat_id, source, channel, bitrate, logMode, buffer_lenght, invite_hash, offer) {
+        this.file_path = '';
+        this.requestMs = 0;
+        this.connectMs = 0;
+        this.sid = sid;
+        this.chat_id = chat_id;
+        this.channel = channel;
+        this.bitrate = bitrate;
+        this.logMode = logMode;
+        this.buffer_lenght = buffer_lenght;
+        this.invite_hash = invite_hash;
+        this.offer = offer;
+        this.tgcalls = new tgcalls_1.TGCalls({}, chat_id);
+        if (source instanceof broadcast_1.Broadcast) {
+            // frames come paced from the broadcast, nothing is read or buffered here
+            this.stream = source.subscribe(offer.audioSource);
+        }
+        else {
+            this.setSource(source);
+            this.stream = new tgcalls_1.Stream(source, 16, bitrate, 1, logMode, buffer_lenght, undefined, offer.audioSource);
+        }
+        this.tgcalls.joinVoiceCall = async (payload) => {
+            payload = {
+                chat_id: this.chat_id,
+                ufrag: payload.ufrag,
+                pwd: payload.pwd,
+                hash: payload.hash,
+                setup: payload.setup,
+                fingerprint: payload.fingerprint,
+                source: payload.source,
+                invite_hash: this.invite_hash,
+            };
+            if (logMode > 0) {
+                console.error('callJoinPayload -> ', payload);
+            }
+            const requestStart = Date.now();
+            const joinCallResult = await this.channel.request(this.sid, 'join_call', payload);
+            this.requestMs = Date.now() - requestStart;
+            if (logMode > 0) {
+                console.error('joinCallRequestResult -> ', joinCallResult);
+            }
+            return joinCallResult;
+        };
+        this.stream.on('underrun', () => {
+            this.channel.event(this.sid, 'underrun', {
+                chat_id: chat_id,
+            });
+        });
+        this.stream.on('track_changed', (track) => {
+            this.channel.event(this.sid, 'track_changed', {
+                chat_id: chat_id,
+                track,
+            });
+        });
+        this.stream.on('finish', () => {
+            if (this.stream.stopped) {
+                return;
+            }
+            this.channel.status(this.sid, 'ended');
+            this.channel.event(this.sid, 'ended_stream', {
+                chat_id: chat_id,
+            });
+        });
+    }
+    async joinCall() {
+        const start = Date.now();
+        try {
+            return await this.tgcalls.start(this.offer);
+        }
+        catch (e) {
+            this.stream.stop();
+            if (this.logMode > 0) {
+                console.error('joinCallError ->', e);
+            }
+            return false;
+        }
+        finally {
+            this.connectMs = Date.now() - start - this.requestMs;
+        }
+    }
+    stop() {
+        try {
+            this.stream.stop();
+            this.tgcalls.close();
+        }
+        catch (e) { }
+    }
+    pause() {
+        this.stream.pause();
+    }
+    resume() {
+        this.stream.resume();
+    }
+    setSource(source) {
+        this.file_path =
+            typeof source === 'string' ? source : source.path.toString();
+    }
+    changeStream(source, track = '', start = 0) {
+        if (this.stream instanceof broadcast_1.Subscription) {
+            throw new Error('Cannot change the stream of a broadcast subscriber');
+        }
+        this.setSource(source);
+        this.stream.setReadable(source, track, start);
+    }
+}
+exports.default = RTCConnection;
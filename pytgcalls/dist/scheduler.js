@@ -0,0 +1,81 @@
+"use strict";
+Object.defineProperty(exports, "__esModule", { value: true });
+exports.scheduler = exports.FrameScheduler = exports.FRAME_MS = void 0;
+exports.FRAME_MS = 10;
+// Single clock for every stream of this process. Deadlines are computed from
+// a monotonic origin, so timer lateness never accumulates into drift: late
+// frames are caught up right away, up to maxCatchUp per wakeup, anything
+// beyond that is skipped so a long stall can't turn into a burst.
+class FrameScheduler {
+    constructor(maxCatchUp = 5) {
+        this.maxCatchUp = maxCatchUp;
+        this.streams = new Set();
+        this.origin = process.hrtime.bigint();
+        this.ticks = 0;
+        this.lateFrames = 0;
+        this.skippedFrames = 0;
+        this.jitterMs = 0;
+        this.maxJitterMs = 0;
+    }
+    add(stream) {
+        this.streams.add(stream);
+        if (this.timer === undefined) {
+            this.origin = process.hrtime.bigint();
+            this.ticks = 0;
+            this.schedule();
+        }
+    }
+    remove(stream) {
+        this.streams.delete(stream);
+        if (this.streams.size === 0 && this.timer !== undefined) {
+            clearTimeout(this.timer);
+            this.timer = undefined;
+        }
+    }
+    stats() {
+        return {
+            streams: this.streams.size,
+            late_frames: this.lateFrames,
+            skipped_frames: this.skippedFrames,
+            jitter_ms: this.jitterMs,
+            max_jitter_ms: this.maxJitterMs,
+        };
+    }
+    elapsedMs() {
+        return Number(process.hrtime.bigint() - this.origin) / 1e6;
+    }
+    schedule() {
+        const delay = (this.ticks + 1) * exports.FRAME_MS - this.elapsedMs();
+        this.timer = setTimeout(() => this.run(), Math.max(0, delay));
+    }
+    run() {
+        const now = this.elapsedMs();
+        const lateness = now - (this.ticks + 1) * exports.FRAME_MS;
+        // exponentially weighted, like RTP interarrival jitter
+        this.jitterMs += (Math.abs(lateness) - this.jitterMs) / 16;
+        this.maxJitterMs = Math.max(this.maxJitterMs, lateness);
+        let due = Math.floor(now / exports.FRAME_MS) - this.ticks;
+        if (due > 1) {
+            this.lateFrames += due - 1;
+        }
+        if (due > this.maxCatchUp) {
+            this.skippedFrames += due - this.maxCatchUp;
+            this.ticks += due - this.maxCatchUp;
+            due = this.maxCatchUp;
+        }
+        for (let i = 0; i < due; i++) {
+            for (const stream of this.streams) {
+                stream.tick(i < due - 1);
+            }
+            this.ticks += 1;
+        }
+        if (this.streams.size > 0) {
+            this.schedule();
+        }
+        else {
+            this.timer = undefined;
+        }
+    }
+}
+exports.FrameScheduler = FrameScheduler;
+exports.scheduler = new FrameScheduler();
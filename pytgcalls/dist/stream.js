@@ -0,0 +1,402 @@
+"use strict";
+Object.defineProperty(exports, "__esModule", { value: true });
+exports.Stream = void 0;
+const fs_1 = require("fs");
+const events_1 = require("events");
+const stream_1 = require("stream");
+const wrtc_1 = require("wrtc");
+const audio_ring_1 = require("./audio-ring");
+const scheduler_1 = require("./scheduler");
+const gain_1 = require("./gain");
+const metrics_1 = require("./metrics");
+// slack on top of buffer_lenght, a read chunk may land after the threshold
+const RING_HEADROOM = 2 * 64 * 1024;
+// buffering bookkeeping doesn't need to run on every frame
+const HOUSEKEEPING_TICKS = 10;
+class Stream extends events_1.EventEmitter {
+    constructor(source, bitsPerSample = 16, sampleRate = 48000, channelCount = 1, logMode = 0, buffer_lenght = 10, timePulseBuffer = buffer_lenght == 4 ? 1.5 : 0, audioSource) {
+        super();
+        this.bitsPerSample = bitsPerSample;
+        this.sampleRate = sampleRate;
+        this.channelCount = channelCount;
+        this.logMode = logMode;
+        this.buffer_lenght = buffer_lenght;
+        this.timePulseBuffer = timePulseBuffer;
+        this.gain = new gain_1.Gain();
+        this.ticks = 0;
+        this.readable = undefined;
+        this.upcoming = [];
+        this.boundaries = [];
+        // cache offset where the playing track begins, and its time at that offset
+        this.trackOffset = 0;
+        this.trackStart = 0;
+        this.underrun = false;
+        this.counters = new metrics_1.FrameCounters();
+        // the frame being sent is late, the scheduler is catching up
+        this.late = false;
+        this.paused = false;
+        this.finished = true;
+        this.stopped = false;
+        this.finishedLoading = false;
+        this.bytesLoaded = 0;
+        this.runningPulse = false;
+        this.audioSource = audioSource !== null && audioSource !== void 0 ? audioSource : new wrtc_1.nonstandard.RTCAudioSource();
+        this.byteLength =
+            ((this.sampleRate * this.bitsPerSample) / 8 / 100) *
+                this.channelCount;
+        this.cache = new audio_ring_1.AudioRing(this.byteLength * 100 * this.buffer_lenght + RING_HEADROOM, this.byteLength);
+        this.file_path = typeof source === 'string' ? source : '';
+        this.setReadable(source);
+        scheduler_1.scheduler.add(this);
+    }
+    // Either a complete raw PCM file path or a readable producing raw PCM, like
+    // a RingSource or a LiveFileSource. Files still being written must come
+    // through a LiveFileSource, a plain path ends at the current end of file.
+    // Replaces the current track, queued tracks play after it. start is the
+    // time in seconds the source begins at, when it was opened at an offset.
+    setReadable(source, id = '', start = 0) {
+        if (this.stopped) {
+            throw new Error('Cannot set readable when stopped');
+        }
+        // tracks already read past the current one keep what they buffered
+        const carried = this.boundaries.map((boundary, i) => {
+            const next = this.boundaries[i + 1];
+            const carry = this.cache.copyFrom(boundary.offset);
+            if (next || this.readable.readableEnded) {
+                const end = next ? next.offset - boundary.offset : carry.length;
+                return {
+                    id: boundary.id,
+                    source: stream_1.Readable.from([carry.subarray(0, end)]),
+                };
+            }
+            return { id: boundary.id, source: this.readable, carry };
+        });
+        if (carried.length > 0) {
+            this.detach();
+        }
+        else if (this.readable !== undefined && this.readable !== source) {
+            this.readable.destroy();
+        }
+        this.upcoming.unshift(...carried);
+        this.boundaries = [];
+        this.cache.clear();
+        this.playFrom(0, start);
+        this.attach(source);
+        if (id) {
+            this.emit('track_changed', id);
+        }
+    }
+    attach(source, carry) {
+        this.bytesLoaded = 0;
+        if (typeof source === 'string') {
+            this.file_path = source;
+            this.readable = (0, fs_1.createReadStream)(source);
+        }
+        else {
+            this.file_path = '';
+            this.readable = source;
+        }
+        const readable = this.readable;
+        if (carry && carry.length > 0) {
+            readable.unshift(carry);
+        }
+        this.finished = false;
+        this.finishedLoading = false;
+        readable.on('data', (data) => {
+            const taken = this.cache.write(data);
+            if (taken < data.length) {
+                // ring is full, hand the rest back until frames are consumed
+                readable.pause();
+                readable.unshift(data.subarray(taken));
+            }
+            this.bytesLoaded += taken;
+            if (!this.needsBuffering()) {
+                readable.pause();
+                this.runningPulse = false;
+                if (this.logMode > 1) {
+                    console.error('ENDED_BUFFERING ->', new Date().getTime());
+                    console.error('BYTES_STREAM_CACHE_LENGTH ->', this.cache.length);
+                    if (this.logMode > 1) {
+                        console.error('PULSE ->', this.runningPulse);
+                    }
+                }
+            }
+            if (this.logMode > 1) {
+                console.error('BYTES_LOADED ->', this.bytesLoaded);
+            }
+        });
+        readable.on('end', () => {
+            if (this.logMode > 1) {
+                console.error('COMPLETED_BUFFERING ->', new Date().getTime());
+                console.error('BYTES_STREAM_CACHE_LENGTH ->', this.cache.length);
+                console.error('BYTES_LOADED ->', this.bytesLoaded);
+            }
+            this.endLoading();
+        });
+        // a file or ring gone missing ends its track, unhandled it would take
+        // the whole process down. Kept when detached, a carried readable
+        // attached again already has it
+        if (readable.listenerCount('error') === 0) {
+            readable.on('error', (error) => {
+                if (this.logMode > 0) {
+                    console.error('READ_ERROR ->', error);
+                }
+                if (this.readable === readable) {
+                    this.endLoading();
+                }
+            });
+        }
+    }
+    endLoading() {
+        if (this.upcoming.length > 0) {
+            this.loadNext();
+        }
+        else {
+            this.finishedLoading = true;
+        }
+    }
+    // Stop reading the current readable without destroying it
+    detach() {
+        if (this.readable !== undefined) {
+            this.readable.removeAllListeners('data');
+            this.readable.removeAllListeners('end');
+            this.readable.pause();
+        }
+    }
+    // Read the next queued track right behind the current one, its first
+    // sample directly follows the last one of the current track
+    loadNext() {
+        const next = this.upcoming.shift();
+        this.boundaries.push({ offset: this.cache.writeOffset, id: next.id });
+        this.attach(next.source, next.carry);
+    }
+    // Queue a track after the current one and whatever is already queued
+    enqueue(source, id) {
+        if (this.stopped) {
+            throw new Error('Cannot enqueue when stopped');
+        }
+        if (this.finished) {
+            // nothing left to play behind, it starts right away
+            this.setReadable(source, id);
+            return;
+        }
+        this.upcoming.push({ id, source });
+        if (this.finishedLoading) {
+            this.finishedLoading = false;
+            this.loadNext();
+        }
+    }
+    get queued() {
+        return this.boundaries
+            .map((boundary) => boundary.id)
+            .concat(this.upcoming.map((track) => track.id));
+    }
+    // Jump to the next track, returns false when there is none
+    skip() {
+        var _a;
+        if (this.boundaries.length > 0) {
+            // already buffered: drop the rest of the current track
+            const boundary = this.boundaries.shift();
+            this.cache.skipTo(boundary.offset);
+            this.playFrom(boundary.offset);
+            this.emit('track_changed', boundary.id);
+            return true;
+        }
+        const next = this.upcoming.shift();
+        if (next === undefined) {
+            return false;
+        }
+        (_a = this.readable) === null || _a === void 0 ? void 0 : _a.destroy();
+        this.readable = undefined;
+        this.cache.clear();
+        this.playFrom(0);
+        this.attach(next.source, next.carry);
+        this.emit('track_changed', next.id);
+        return true;
+    }
+    // Forget every queued track, the current one plays to its end
+    clearQueue() {
+        var _a;
+        this.upcoming.forEach((track) => {
+            if (typeof track.source !== 'string') {
+                track.source.destroy();
+            }
+        });
+        this.upcoming = [];
+        if (this.boundaries.length > 0) {
+            this.cache.truncate(this.boundaries[0].offset);
+            this.boundaries = [];
+            (_a = this.readable) === null || _a === void 0 ? void 0 : _a.destroy();
+            this.readable = undefined;
+            this.finishedLoading = true;
+        }
+    }
+    playFrom(offset, start = 0) {
+        this.trackOffset = offset;
+        this.trackStart = start;
+    }
+    // Time in seconds the current track begins at, for a source opened at an
+    // offset before the stream existed, like a session replayed after a crash
+    setStart(start) {
+        this.trackStart = start;
+    }
+    // Audio buffered ahead of playback
+    get bufferMs() {
+        return (this.cache.length / this.byteLength) * 10;
+    }
+    metrics() {
+        return this.counters.report(this.bufferMs);
+    }
+    // Seconds into the playing track
+    get position() {
+        const played = Math.max(0, this.cache.readOffset - this.trackOffset);
+        return this.trackStart + played / (this.byteLength * 100);
+    }
+    // Local software gain, ramped over rampMs, costs no network request
+    setVolume(volume, rampMs = 50) {
+        this.gain.set(volume, (rampMs * this.sampleRate * this.channelCount) / 1000);
+    }
+    // Whether position is moving right now
+    get playing() {
+        return !this.paused && !this.finished && !this.underrun;
+    }
+    // Bytes allocated for this stream's cache, fixed for its whole life
+    get cacheBytes() {
+        return this.cache.capacity;
+    }
+    get cacheFill() {
+        return this.cache.length;
+    }
+    needsBuffering(withPulseCheck = true) {
+        if (this.finishedLoading) {
+            return false;
+        }
+        let result = this.cache.length < this.byteLength * 100 * this.buffer_lenght;
+        if (this.timePulseBuffer > 0 && withPulseCheck) {
+            result = result && this.runningPulse;
+        }
+        return result;
+    }
+    checkLag() {
+        if (this.finishedLoading) {
+            return false;
+        }
+        // stall only once not even a frame is left, then resume from a low
+        // water mark of a second: real-time producers keep less than that
+        // buffered and would otherwise flip in and out of underrun
+        return (this.cache.length < this.byteLength * (this.underrun ? 100 : 1));
+    }
+    pause() {
+        if (this.stopped) {
+            throw new Error('Cannot pause when stopped');
+        }
+        this.paused = true;
+        this.emit('pause', this.paused);
+    }
+    resume() {
+        if (this.stopped) {
+            throw new Error('Cannot resume when stopped');
+        }
+        this.paused = false;
+        this.emit('resume', this.paused);
+    }
+    finish() {
+        this.finished = true;
+        this.emit('finish');
+    }
+    stop() {
+        this.stopped = true;
+        this.clearQueue();
+        scheduler_1.scheduler.remove(this);
+        this.finish();
+    }
+    createTrack() {
+        return this.audioSource.createTrack();
+    }
+    getIdSource() {
+        return this.audioSource;
+    }
+    // Buffering bookkeeping, runs every HOUSEKEEPING_TICKS frames
+    housekeeping() {
+        const now = Date.now();
+        if (this.needsBuffering(false)) {
+            let checkBuff = true;
+            if (this.timePulseBuffer > 0) {
+                this.runningPulse =
+                    this.cache.length <
+                        this.byteLength * 100 * this.timePulseBuffer;
+                checkBuff = this.runningPulse;
+            }
+            if (this.readable !== undefined && checkBuff) {
+                if (this.logMode > 1) {
+                    console.error('PULSE ->', this.runningPulse);
+                }
+                this.readable.resume();
+                if (this.logMode > 1) {
+                    console.error('BUFFERING -> ', now);
+                }
+            }
+        }
+        if (this.logMode > 1 && this.underrun) {
+            console.error('STREAM_LAG -> ', now);
+            console.error('BYTES_STREAM_CACHE_LENGTH ->', this.cache.length);
+            console.error('BYTES_LOADED ->', this.bytesLoaded);
+        }
+    }
+    // Called by the shared scheduler once per 10ms frame, late when it's
+    // catching up on frames it could not send on time
+    tick(late = false) {
+        if (this.stopped) {
+            return;
+        }
+        this.late = late;
+        if (this.finishedLoading && this.cache.length < this.byteLength) {
+            if (!this.finished) {
+                this.finish();
+            }
+            return;
+        }
+        this.ticks += 1;
+        if (this.ticks % HOUSEKEEPING_TICKS === 0) {
+            this.housekeeping();
+        }
+        if (this.paused || this.finished) {
+            return;
+        }
+        if (this.checkLag()) {
+            this.counters.starvedFrames += 1;
+            if (!this.underrun) {
+                this.underrun = true;
+                this.counters.underruns += 1;
+                this.emit('underrun');
+            }
+            return;
+        }
+        const frame = this.cache.readFrame();
+        this.underrun = false;
+        // the frame just read holds samples of the next track
+        while (this.boundaries.length > 0 &&
+            this.cache.readOffset > this.boundaries[0].offset) {
+            const boundary = this.boundaries.shift();
+            this.playFrom(boundary.offset);
+            this.emit('track_changed', boundary.id);
+        }
+        if (frame !== null) {
+            const samples = this.gain.apply(frame);
+            this.counters.sent(late);
+            try {
+                this.audioSource.onData({
+                    bitsPerSample: this.bitsPerSample,
+                    sampleRate: this.sampleRate,
+                    channelCount: this.channelCount,
+                    numberOfFrames: samples.length,
+                    samples,
+                });
+            }
+            catch (error) {
+                this.emit('error', error);
+            }
+        }
+    }
+}
+exports.Stream = Stream;
@@ -1,132 +1,262 @@
-import os
 import json
+import time
 import asyncio
-from uuid import uuid4
+import logging
 
-from typing import Awaitable, Callable, Optional
+from typing import Any, Dict, Optional, Tuple, Union
 
 from pyrogram import Client
+from pyrogram.errors import FloodWait
 from pyrogram.raw.functions.phone import JoinGroupCall, LeaveGroupCall, EditGroupCallParticipant
-from pyrogram.raw.functions.channels import GetFullChannel
-from pyrogram.raw.base import InputPeer, DataJSON
+from pyrogram.raw.types import DataJSON, UpdateGroupCallConnection
+from pyrogram.raw.base import InputPeer
 
 from .js_core import INSTANCE as JSC
 
-from .helpers import event_handler
+from .dispatcher import UpdateDispatcher
+from .session import Session, Source, Track
+from .broadcast import Broadcast
+from .pcm_cache import PcmCache
+from .node_worker import InvalidState
+from .rate_limit import RateLimiter
+from . import tracing
 
-class GroupCall:
-    def __init__(self, client:Client, chat_id:int) -> bool:
+logger = logging.getLogger(__name__)
+
+# set_volume sends the latest value once it stopped changing for this long,
+# and never later than VOLUME_MAX_DELAY after the first change
+VOLUME_DEBOUNCE = 0.3
+VOLUME_MAX_DELAY = 1.0
+
+class JoinError(Exception):
+    pass
+
+class GroupCall(Session):
+    def __init__(self, client:Client, chat_id:int, cache:Optional[PcmCache] = None) -> bool:
+        super().__init__(cache)
         self.client = client
         self.chat_id : int = chat_id
         self.initialized : asyncio.Event = asyncio.Event()
         self.request : dict = None
-        self.sid : str = str(uuid4())
-        # Register the event handler to process groupcall transport events
-        self.client.on_raw_update()(event_handler(self))
+        self.join_as : Optional[InputPeer] = None
+        self.invite_hash : Optional[str] = None
+        self.timings : Dict[str, Union[float, bool]] = {}
+        self.broadcast : Optional[Broadcast] = None
+        self._volume : Tuple[int, float] = (100, 0.0) # latest value asked for, and when
+        self._volume_sent : Optional[asyncio.Future] = None # resolved once it reached the server
+        self._volume_applied : Optional[int] = None # last value the server got
+        # Route this chat's groupcall updates to us
+        self.dispatcher : UpdateDispatcher = UpdateDispatcher.for_client(client)
+        self.dispatcher.register(self)
         # Fetch everything in background
         asyncio.get_event_loop().create_task(self._build_cache())
 
     async def _build_cache(self):
-        self.me = await self.client.get_me()
-        self.peer = await self.client.resolve_peer(self.me.id)
-        self.chat = await self.client.get_chat(self.chat_id)
-        chat_peer = await self.client.resolve_peer(self.chat_id)
-        self.full_chat = await self.client.send(GetFullChannel(channel=chat_peer))
-        self.call = self.full_chat.full_chat.call # TODO this might not exist right away?
+        # both are shared with every other call on this client, usually no request is needed
+        with tracing.span('build_cache', chat_id=self.chat_id):
+            self.peer, self.call = await asyncio.gather(
+                self.dispatcher.cache.self_peer(),
+                self.dispatcher.cache.input_call(self.chat_id),
+            )
         self.initialized.set()
 
-    @property
-    def state(self) -> Optional[str]:
-        return JSC.state(self.sid)
+    def metrics(self) -> Dict[str, Any]:
+        """Like Session.metrics, join_ms covers the whole join as timed here"""
+        result = super().metrics()
+        if 'total' in self.timings:
+            result['join_ms'] = round(self.timings['total'] * 1000)
+        return result
 
-    def on(self, event:str) -> Callable:
-        return JSC.on(self.sid, event)
-
-    async def _stream_action(self, action:str, extra:Optional[dict] = None) -> None:
-        await JSC.send( # merge the 2 dictionaries, in py 3.9+ extra | {'action':...}
-            **( extra or {} ),
-            **{
-                # 'session_id': self.sid,
-                'action': action,
-                'chat_id': self.chat_id,
-            }
-        )
+    def _check_own_stream(self) -> None:
+        if self.broadcast:
+            raise InvalidState("Calls playing a broadcast can't change stream or queue, leave and join again")
 
     async def set_volume(self, vol:int) -> None:
-        # await self._stream_action('volume', {'volume':vol})
-        await self.client.send(
-            EditGroupCallParticipant(
-                call=self.call,
-                participant=self.peer,
-                muted=False,
-                volume=max(0, min(vol, 100)),
-            ),
-        )
+        """Volume of our participant, set server side. Rapid calls are coalesced: only the latest value is sent,
+        once it didn't change for VOLUME_DEBOUNCE seconds, and requests of a client are rate limited.
+        set_local_volume costs no request at all, prefer it for sliders and auto leveling"""
+        loop = asyncio.get_event_loop()
+        self._volume = (max(0, min(vol, 100)), loop.time())
+        if self._volume_sent is None:
+            self._volume_sent = loop.create_future()
+            loop.create_task(self._send_volume(self._volume_sent))
+        await asyncio.shield(self._volume_sent)
+
+    async def _send_volume(self, sent:asyncio.Future) -> None:
+        loop = asyncio.get_event_loop()
+        first = loop.time()
+        while True:
+            wait = min(self._volume[1] + VOLUME_DEBOUNCE, first + VOLUME_MAX_DELAY) - loop.time()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        self._volume_sent = None # later changes go in the next request
+        try:
+            while True:
+                await RateLimiter.for_client(self.client).acquire()
+                volume = self._volume[0]
+                if volume == self._volume_applied: # sent meanwhile by a later round
+                    break
+                try:
+                    await self.client.send(
+                        EditGroupCallParticipant(
+                            call=self.call,
+                            participant=self.peer,
+                            muted=False,
+                            volume=volume,
+                        ),
+                    )
+                    self._volume_applied = volume
+                    break
+                except FloodWait as e: # retried once it's over, acquire waits for it
+                    logger.warning("Volume change in %d hit a flood wait of %ds", self.chat_id, e.x)
+                    RateLimiter.for_client(self.client).flood(e.x)
+            sent.set_result(None)
+        except Exception as e:
+            sent.set_exception(e)
     
-    async def pause_stream(self) -> None:
-        await self._stream_action('pause')
+    async def leave_group_call(self, reason: str = 'committed sudoku'):
+        self.dispatcher.unregister(self)
+        try:
+            await self._stream_action('leave_call', {'type':reason})
+        except InvalidState: # its core died and could not be brought back, there's nothing to leave in NodeJS
+            if self.state != 'lost':
+                raise
+        await JSC.clear(self.sid) # frees the slot on its worker
+        self._drop_tracks()
+        self.sid = ''
+        try:
+            await self.client.send(
+                LeaveGroupCall(
+                    call=self.call,
+                    source=0,
+                ),
+            )
+        except FloodWait as e:
+            RateLimiter.for_client(self.client).flood(e.x)
+            raise
 
-    async def resume_stream(self) -> None:
-        await self._stream_action('resume')
+    async def _join_request(self, data:dict) -> dict:
+        """Called back by NodeJS once the local offer is ready, performs the actual MTProto join"""
+        start = time.monotonic()
+        await self.initialized.wait() # cache warm-up ran concurrently with the offer creation
+        if self.call is None: # maybe a voice chat was started since we last looked
+            self.call = await self.dispatcher.cache.input_call(self.chat_id)
+            if self.call is None:
+                raise JoinError(f"No active voice chat in {self.chat_id}")
+        self.timings['cache_wait'] = time.monotonic() - start
+        self.request = {
+            'ufrag': data['ufrag'],
+            'pwd': data['pwd'],
+            'fingerprints': [{
+                'hash': data['hash'],
+                'setup': data['setup'],
+                'fingerprint': data['fingerprint'],
+            }],
+            'ssrc': data['source'],
+        }
+        start = time.monotonic()
+        with tracing.span('join_rpc', chat_id=self.chat_id):
+            try:
+                updates = await self.client.send(
+                    JoinGroupCall(
+                        call=self.call,
+                        params=DataJSON(data=json.dumps(self.request)),
+                        muted=False,
+                        join_as=self.join_as or self.peer,
+                        invite_hash=data.get('invite_hash'),
+                    ),
+                )
+            except FloodWait as e:
+                RateLimiter.for_client(self.client).flood(e.x)
+                raise
+        self.timings['join_rpc'] = time.monotonic() - start
+        await self.client.handle_updates(updates)
+        for update in updates.updates:
+            if isinstance(update, UpdateGroupCallConnection):
+                return {'transport': json.loads(update.params.data)['transport']}
+        return {'transport': None}
 
-    async def change_stream(self, file_path: str):
-        await self._stream_action('change_stream', {'file_path':file_path})
+    async def _replay(self, packet:dict) -> None:
+        """Join again from a restarted NodeJS, which calls _join_request back like for the first join"""
+        res = await self._stream_action('join_call', {
+            **packet,
+            'invite_hash': self.invite_hash,
+            'bitrate': self.bitrate,
+        }, replay=True)
+        if res['result'] != 'JOINED_VOICE_CHAT':
+            raise JoinError(f"Could not join call in {self.chat_id} again : {res['result']}")
 
-    async def leave_group_call(self, reason: str = 'committed sudoku'):
-        await self._stream_action('leave_call', {'type':reason})
-        # await JSC.clear(self.sid)
-        self.sid = ''
-        await self.client.send(
-            LeaveGroupCall(
-                call=self.call,
-                source=0,
-            ),
-        )
+    async def _on_kicked(self) -> None:
+        try:
+            await self.leave_group_call('kicked_from_group')
+        except Exception:
+            logger.exception("Exception while leaving group call when kicked")
+
+    async def _on_closed(self) -> None:
+        try:
+            await self.leave_group_call('closed_voice_chat')
+        except Exception:
+            logger.exception("Exception while leaving group call when closed")
 
     async def join_group_call(
             self,
-            file_path: str,
+            source: Union[Source, Broadcast],
             bitrate: int = 48000,
             invite_hash: Optional[str] = None,
             join_as: Optional[InputPeer] = None,
+            live: bool = False,
+            start: float = 0.0,
     ) -> None:
-        await self.initialized.wait()
-        if not os.path.isfile(file_path):
-            raise ValueError("Invalid file provided")
-        if join_as is None:
-            join_as = self.peer
-        # PC.set(self.chat_id, join_as)
+        """Join the voice chat streaming source from start seconds in. The MTProto lookups and the NodeJS offer
+        are prepared concurrently, see self.timings for how long each stage took.
+        Joining a Broadcast plays it, its bitrate is the one of the broadcast and start doesn't apply"""
         bitrate = min(bitrate, 48000)
-        await JSC.init(self.sid)
-        res = await JSC.send(
-            {
-                'action': 'join_call',
-                'chat_id': self.chat_id,
-                'file_path': file_path,
-                'invite_hash': invite_hash,
-                'bitrate': bitrate,
-                # 'session_id': self.sid,
-                # 'buffer_long': stream_type.value,
-            }
-        )
-        self.request = {
-            'ufrag': res['urfrag'],
-            'pwd': res['pwd'],
-            'fingerprints': [{
-                'hash': res['hash'],
-                'setup': res['setup'],
-                'fingerprint': res['fingerprint'],
-            }],
-            'ssrc': res['source'],
-        }
-        await self.client.handle_updates(
-            await self.client.send(
-                JoinGroupCall(
-                    call=self.call,
-                    params=DataJSON(data=json.dumps(self.request)),
-                    muted=False,
-                    join_as=join_as,
-                    invite_hash=invite_hash,
-                ),
-            )
-        )
\ No newline at end of file
+        self.bitrate = bitrate
+        if isinstance(source, Broadcast):
+            if not source.started:
+                raise InvalidState("Broadcast must be started before joining it")
+            track = Track({'broadcast': source.sid})
+        else:
+            start = max(0.0, round(start, 2)) # whole 10ms frames
+            track = await self._prepare_source(source, live, start=start)
+            if start:
+                track.packet = {**track.packet, 'start': start}
+                if track.file_path: # decoders already start there
+                    track.packet['offset'] = self._byte_offset(start)
+        self.broadcast = source if isinstance(source, Broadcast) else None
+        self.join_as = join_as
+        self.invite_hash = invite_hash
+        self.timings = {}
+        try:
+            with tracing.span('join', chat_id=self.chat_id):
+                t0 = time.monotonic()
+                # subscribers must live in the same NodeJS process as their broadcast
+                await JSC.init(self.sid, near=self.broadcast.sid if self.broadcast else None)
+                self.timings['core'] = time.monotonic() - t0
+                JSC.handle(self.sid, 'join_call')(self._join_request)
+                self._listen()
+                res = await JSC.send(self.sid,
+                    {
+                        **track.packet,
+                        'action': 'join_call',
+                        'chat_id': self.chat_id,
+                        'invite_hash': invite_hash,
+                        'bitrate': bitrate,
+                    }
+                )
+                node_timings = res.get('timings', {})
+                self.timings['offer'] = node_timings.get('offer_ms', 0) / 1000
+                self.timings['connect'] = node_timings.get('connect_ms', 0) / 1000
+                self.timings['offer_pooled'] = node_timings.get('pooled', False)
+                self.timings['total'] = time.monotonic() - t0
+                logger.debug("Join timings for %d : %s", self.chat_id, self.timings)
+                if res['result'] != 'JOINED_VOICE_CHAT':
+                    raise JoinError(f"Could not join call in {self.chat_id} : {res['result']}")
+        except BaseException: # timeouts and cancellations too, nothing of this session may stay behind
+            track.discard()
+            self.dispatcher.unregister(self)
+            await JSC.clear(self.sid) # would count in its worker's load, keep it running and be replayed
+            self.sid = ''
+            raise
+        await self._swap_source(track, 0.0 if self.broadcast else start)
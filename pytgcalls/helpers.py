@@ -1,30 +1,29 @@
+import os
 import re
-import logging
+import json
+import shutil
+import asyncio
+import tempfile
 
-from pkg_resources import parse_version
-from typing import Any, Optional
+from typing import Dict, Optional, Tuple
 from subprocess import Popen, PIPE
 
-from pyrogram import ContinuePropagation
-from pyrogram.raw.types import ChannelForbidden
-from pyrogram.raw.types import GroupCall
-from pyrogram.raw.types import GroupCallDiscarded
-from pyrogram.raw.types import InputGroupCall
-from pyrogram.raw.types import MessageActionInviteToGroupCall
-from pyrogram.raw.types import UpdateChannel
-from pyrogram.raw.types import UpdateGroupCall
-from pyrogram.raw.types import UpdateNewChannelMessage
-
-from .call import Call
-
 class DependancyException(Exception):
     pass
 
 FIND_V_NUMBER = re.compile(r"[0-9\.]+")
-def _get_version(pkg : str) -> str:
-    proc = Popen([pkg, '--version'], stderr=PIPE, stdout=PIPE)
-    stdout, _stderr = proc.communicate()
-    v = stdout.decode('utf-8').strip()
+
+# versions of executables by path and mtime, kept on disk so that new processes don't probe them again
+VERSION_CACHE = os.path.join(tempfile.gettempdir(), 'pytgcalls-versions.json')
+_versions : Dict[str, str] = {}
+_probing : Dict[str, asyncio.Future] = {}
+
+def parse_version(v:str) -> Tuple[int, ...]:
+    """'15.2.1' as (15, 2, 1), enough to compare the plain numeric versions checked here"""
+    return tuple(int(n) for n in v.split('.') if n.isdigit())
+
+def _find_version(pkg:str, output:bytes) -> str:
+    v = output.decode('utf-8').strip()
     if not v:
         raise DependancyException(f"Dependancy '{pkg}' could not be found")
     match = FIND_V_NUMBER.search(v)
@@ -32,50 +31,54 @@ def _get_version(pkg : str) -> str:
         raise DependancyException(f"Dependancy '{pkg}' didn't provide valid version number: '{v}'")
     return match.group(0)
 
+def _get_version(pkg : str) -> str:
+    proc = Popen([pkg, '--version'], stderr=PIPE, stdout=PIPE)
+    stdout, _stderr = proc.communicate()
+    return _find_version(pkg, stdout)
+
 def assert_version(pkg: str, min_v:str, curr_v:Optional[str] = None) -> None:
     if not curr_v:
         curr_v = _get_version(pkg)
     if parse_version(curr_v) < parse_version(min_v):
         raise DependancyException(f"Dependancy '{pkg}' requires version {min_v}+, found {curr_v}")
 
-def event_handler(ctx : Call):
-    async def handler(client, update, users, chats):
-        if isinstance(update, UpdateChannel) and update.channel_id in chats and \
-                isinstance(chats[update.channel_id], ChannelForbidden): # Check if any channel became forbidden
-            chat_id = int(f'-100{update.channel_id}')
-            for event in pytgcalls._on_event_update.kick:
-                await event(chat_id)
-            try:
-                ctx.leave_group_call('kicked_from_group')
-            except Exception:
-                logging.exception("Exception while leaving group call when kicked")
-            pytgcalls.peer_cache.pop(chat_id)
-        if isinstance(update, UpdateGroupCall):
-            if isinstance(update.call, GroupCall):
-                pytgcalls.chat_cache.put(
-                    int(f'-100{update.chat_id}'),
-                    InputGroupCall(
-                        access_hash=update.call.access_hash,
-                        id=update.call.id,
-                    )
-                )
-            if isinstance(update.call, GroupCallDiscarded):
-                chat_id = int(f'-100{update.chat_id}')
-                for event in pytgcalls._on_event_update.closed:
-                    await event(chat_id)
-                try:
-                    pytgcalls.leave_group_call(chat_id, 'closed_voice_chat')
-                except Exception:
-                    logging.exception("Exception while leaving group call when closed")
-                pytgcalls.peer_cache.pop(chat_id)
-                pytgcalls.chat_cache.put(chat_id, None)
-        if isinstance(update, UpdateNewChannelMessage):
-            try: # wtf is this
-                if isinstance(update.message.action, MessageActionInviteToGroupCall):
-                    for event in pytgcalls._on_event_update.group_call:
-                        await event(client, update.message)
-            except Exception:
-                logging.exception("Exception trying to run GROUP_CALL callbacks")
-        raise ContinuePropagation() # so that it won't ever shadow other handlers
+async def get_version(pkg:str) -> str:
+    """Version of executable pkg without blocking the loop. Probed once per binary: cached by its path
+    and mtime, in memory and in VERSION_CACHE, so upgrading it is noticed. Concurrent callers share a probe"""
+    path = shutil.which(pkg)
+    if path is None:
+        raise DependancyException(f"Dependancy '{pkg}' could not be found")
+    path = os.path.realpath(path)
+    key = f'{path}:{os.stat(path).st_mtime_ns}'
+    if key in _versions:
+        return _versions[key]
+    if key not in _probing:
+        _probing[key] = asyncio.ensure_future(_probe(pkg, path, key))
+        _probing[key].add_done_callback(lambda _: _probing.pop(key, None))
+    return await asyncio.shield(_probing[key])
+
+async def _probe(pkg:str, path:str, key:str) -> str:
+    try:
+        with open(VERSION_CACHE) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        cached = {}
+    if key not in cached:
+        proc = await asyncio.create_subprocess_exec(path, '--version', stdout=PIPE, stderr=PIPE)
+        stdout, _stderr = await proc.communicate()
+        cached[key] = _find_version(pkg, stdout)
+        try: # best effort, written aside and renamed so that concurrent processes never read half of it
+            tmp = f'{VERSION_CACHE}.{os.getpid()}'
+            with open(tmp, 'w') as f:
+                json.dump(cached, f)
+            os.replace(tmp, VERSION_CACHE)
+        except OSError:
+            pass
+    _versions[key] = cached[key]
+    return cached[key]
 
-    return handler
\ No newline at end of file
+async def check_version(pkg:str, min_v:str) -> str:
+    """Like assert_version for an executable, through get_version: returns the version found"""
+    curr_v = await get_version(pkg)
+    assert_version(pkg, min_v, curr_v)
+    return curr_v
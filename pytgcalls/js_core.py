@@ -1,147 +1,209 @@
 import os
-import json
-import sys
 import asyncio
 import logging
 
-from uuid import uuid4
-from asyncio.subprocess import Process
+from typing import Any, Dict, List, Optional, Callable, Tuple, cast
 
-from signal import SIGINT
-from subprocess import PIPE
-
-from typing import Dict, Tuple, Any, List, Union, Optional, Awaitable, Generator, Callable
-
-from .helpers import assert_version
+from .codec import get_codec
+from .node_worker import NodeWorker, InvalidState, CoreDied, RequestTimeout
+from .callback_executor import CallbackExecutor
 
 logger = logging.getLogger(__name__)
 
-class InvalidState(Exception):
-    pass
-
 class JSCore:
-    def __init__(self):
-        assert_version('node', '15')
-        self.proc : Process = None
-        self.packet_count : int = 0
-        self.waiting : Dict[int, asyncio.Future] = {}
-        self.sessions : Dict[str, str] = {}
-        self.callbacks : Dict[str, Dict[str, List[Awaitable]]] = {}
+    """Supervisor over a pool of NodeJS workers.
+    Every session is placed on the least loaded worker and stays pinned there until cleared.
+    Workers talk over stdio using the given wire format, either 'json' (lines) or 'msgpack' (length prefixed frames).
+    Every command waits for its ack at most timeout seconds, and at most max_inflight commands (max_inflight_session
+    per session) are awaiting an ack at any time: further senders wait for a free slot.
+    Each worker keeps offer_pool peer connections ready with a local offer, making joins faster.
+    A worker dying under live sessions is restarted and its sessions replayed, see NodeWorker.
+    Event callbacks of every worker run on one CallbackExecutor, callback_workers tasks at most,
+    in order for each session."""
+    def __init__(
+        self,
+        workers:Optional[int] = None,
+        codec:str = 'json',
+        timeout:float = 30.0,
+        max_inflight:int = 1024,
+        max_inflight_session:int = 32,
+        offer_pool:int = 0,
+        callback_workers:int = 32,
+        command:Optional[List[str]] = None,
+    ):
+        self.offer_pool : int = offer_pool
+        self.codec : str = codec
+        self.command : Optional[List[str]] = command # replaces the NodeJS core, see NodeWorker
+        self.timeout : float = timeout
+        self.max_inflight : int = max_inflight
+        self.max_inflight_session : int = max_inflight_session
+        self._inflight : Optional[asyncio.Semaphore] = None # created lazily, must belong to the running loop
+        self._inflight_session : Dict[str, asyncio.Semaphore] = {}
+        self.executor : CallbackExecutor = CallbackExecutor(callback_workers)
+        self.workers : List[NodeWorker] = [ self._new_worker(i) for i in range(workers or os.cpu_count() or 1) ]
+        self.placement : Dict[str, NodeWorker] = {}
 
     @property
     def running(self) -> bool:
-        """Check if NodeJS core is already running"""
-        if self.proc and self.proc.returncode is None:
-            return True
-        return False
-
-    async def __aiter__(self) -> Generator[Tuple[dict, str, int, str], Any, None]: # This was a cool 2-liner but like this it's more reliable
-        while self.running:
-            buf = await self.proc.stdout.readline()
-            try:
-                packet = json.loads(buf)
-            except json.JSONDecodeError:
-                logger.exception("Could not deserialize packet '%s'", buf)
-                continue
-            if not all(k in packet for k in ("sid", "pid", "_")):
-                logger.error("Ignoring packet with missing slots : %s", str(packet))
-                continue
-            yield packet, packet["sid"], packet["pid"], packet["_"].lower()
-
-    async def _send(self, packet:bytes) -> None:
-        self.proc.stdin.write(packet + b'\n')
-        await self.proc.stdin.drain()
-
-    async def _event_worker(self) -> None:
-        logger.debug("Starting packet worker")
-        async for packet, sid, pid, type in self:
-            try:
-                logger.debug("Processing event '%d' [%s] | %s", pid, type, str(packet))
-                if type == "ack":
-                    self.waiting[pid].set_result(packet)
-                elif type == "status":
-                    self.sessions[sid] = packet['status']
-                elif type == "event" and sid in self.callbacks:
-                    if packet["event"] in self.callbacks[sid]:
-                        for cb in self.callbacks[sid][packet["event"]]:
-                            asyncio.get_event_loop().create_task(cb(packet)) # can't block the worker
-                else:
-                    logger.warning("Unexpected packet type '%s'", type)
-            except Exception: # this background worker must not die, catch very broadly
-                logger.exception("Exception processing packet '%s'", str(packet))
-        logger.debug("Stopping packet worker")
+        """Check if any NodeJS worker is running"""
+        return any(w.running for w in self.workers)
+
+    @property
+    def sessions(self) -> Dict[str, Optional[str]]:
+        return { sid: w.state(sid) for sid, w in self.placement.items() }
+
+    def resize(self, workers:int) -> None:
+        """Grow or shrink the pool. Only idle workers can be dropped when shrinking"""
+        if workers < 1:
+            raise ValueError("At least 1 worker is needed")
+        while len(self.workers) < workers:
+            self.workers.append(self._new_worker(len(self.workers)))
+        while len(self.workers) > workers:
+            if self.workers[-1].load > 0 or self.workers[-1].running:
+                raise InvalidState(f"Worker #{self.workers[-1].index} is busy, cannot shrink pool")
+            self.workers.pop()
+
+    def set_codec(self, codec:str) -> None:
+        """Switch wire format, only possible while no worker is running"""
+        if self.running:
+            raise InvalidState("Cannot change wire format while NodeJS workers are running")
+        for w in self.workers:
+            w.codec = get_codec(codec)
+        self.codec = codec
+
+    def set_command(self, command:Optional[List[str]]) -> None:
+        """Run workers with command instead of the NodeJS core, like the fake core of the benchmarks.
+        Only possible while no worker is running, None goes back to NodeJS"""
+        if self.running:
+            raise InvalidState("Cannot change worker command while NodeJS workers are running")
+        for w in self.workers:
+            w.command = command
+        self.command = command
+
+    def _new_worker(self, index:int) -> NodeWorker:
+        return NodeWorker(
+            index, get_codec(self.codec), self.command, offer_pool=self.offer_pool, executor=self.executor,
+        )
+
+    async def prewarm(self, workers:Optional[int] = None) -> None:
+        """Start the processes of the first workers workers (all by default) in parallel, ahead of the first calls
+        so that they don't wait for NodeJS to boot. A prewarmed worker stops again once its last call ends"""
+        await asyncio.gather(*(w.start() for w in self.workers[:workers or len(self.workers)]))
+
+    async def set_offer_pool(self, size:int) -> None:
+        """Change how many prepared peer connections each worker keeps, running workers are resized right away"""
+        self.offer_pool = size
+        for w in self.workers:
+            w.offer_pool = size
+        await asyncio.gather(*(
+            w.send('', {'action': 'prewarm', 'size': size}, self.timeout) for w in self.workers if w.running
+        ))
+
+    def _least_loaded(self) -> NodeWorker:
+        # prefer already running workers on ties, so that we don't spawn processes needlessly
+        return min(self.workers, key=lambda w: (w.load, not w.running, w.index))
+
+    def worker(self, sid:str) -> NodeWorker:
+        if sid not in self.placement:
+            raise InvalidState(f"Session '{sid}' is not placed on any worker")
+        return self.placement[sid]
 
     def on(self, sid:str, event:str) -> Callable:
-        def decorator(fun:Awaitable) -> Awaitable:
-            if sid not in self.callbacks:
-                self.callbacks[sid] = {}
-            if event not in self.callbacks[sid]:
-                self.callbacks[sid][event] = []
-            self.callbacks[sid][event].append(fun)
-            return fun
-        return decorator
+        return self.worker(sid).on(sid, event)
+
+    def handle(self, sid:str, request:str) -> Callable:
+        return self.worker(sid).handle(sid, request)
+
+    def on_recover(self, sid:str, priority:int = 0) -> Callable:
+        return self.worker(sid).on_recover(sid, priority)
+
+    def recovering(self, sid:str) -> bool:
+        """Whether the worker of a session crashed and is being restarted or replayed"""
+        return sid in self.placement and self.placement[sid].recovering
 
     def state(self, sid:str) -> Optional[str]:
-        if sid not in self.sessions:
+        if sid not in self.placement:
             return None
-        return self.sessions[sid]
-
-    async def send(self, sid:str, packet:dict) -> dict:
-        if not self.running:
-            raise InvalidState("Session not initialized")
-        pid = self.packet_count
-        self.packet_count += 1
-        packet["pid"] = pid
-        packet["sid"] = sid
-        future = asyncio.get_event_loop().create_future()
-        self.waiting[pid] = future
-        buf = json.dumps(packet).encode('utf-8')
-        await self._send(buf)
-        return await future
-
-    async def init(self, sid:str) -> str:
-        if not self.running:
-            await self._start()
-        self.sessions[sid] = 'new'
-        self.callbacks[sid] = {}
-        # setup session on js side?
+        return self.placement[sid].state(sid)
+
+    def position(self, sid:str) -> Optional[Tuple[float, bool, float]]:
+        """Playback position of a session as last reported by its worker: seconds, whether it was moving,
+        and the loop time of the report"""
+        worker = self.placement.get(sid)
+        if not worker or sid not in worker.core_status.get('positions', {}):
+            return None
+        seconds, playing = worker.core_status['positions'][sid]
+        return seconds, playing, worker.core_status_at
+
+    def metrics(self, sid:str) -> Dict[str, Any]:
+        """Audio health of a session as last reported by its worker, see Session.metrics, with the round trips
+        of its commands"""
+        worker = self.placement.get(sid)
+        if not worker:
+            return {}
+        result = dict(worker.core_status.get('metrics', {}).get(sid, {}))
+        if result:
+            result['report_age_ms'] = round((asyncio.get_event_loop().time() - worker.core_status_at) * 1000)
+        if sid in worker.rtt:
+            result['ipc_rtt'] = worker.rtt[sid].to_dict()
+        return result
+
+    def worker_stats(self) -> List[Dict[str, Any]]:
+        """Frame scheduler health of every running worker, as last reported by its periodic status,
+        with how many times it crashed and how long the last recovery took"""
+        return [
+            {
+                'worker': w.index,
+                'sessions': w.load,
+                'crashes': w.crashes,
+                'last_recovery_ms': round(w.last_recovery * 1000) if w.last_recovery is not None else None,
+                **w.core_status.get('scheduler', {}),
+            }
+            for w in self.workers if w.running
+        ]
+
+    async def send(self, sid:str, packet:dict, timeout:Optional[float] = None, replay:bool = False) -> dict:
+        worker = self.worker(sid)
+        if not self._inflight:
+            self._inflight = asyncio.Semaphore(self.max_inflight)
+        if not replay: # held back outside of the slots, replays need them
+            await worker.wait_recovered()
+        async with self._inflight_session[sid], self._inflight:
+            return await worker.send(sid, packet, timeout or self.timeout, replay)
+
+    async def init(self, sid:str, near:Optional[str] = None) -> str:
+        """Place a session on the least loaded worker, or on the same worker as session 'near'"""
+        if sid in self.placement:
+            return sid
+        worker = self.worker(near) if near else self._least_loaded()
+        self.placement[sid] = worker
+        self._inflight_session[sid] = asyncio.Semaphore(self.max_inflight_session)
+        await worker.init(sid)
+        logger.debug("Session '%s' placed on worker #%d (load %d)", sid, worker.index, worker.load)
         return sid
 
     async def clear(self, sid:str) -> None:
-        self.sessions.pop(sid)
-        self.callbacks.pop(sid)
-        # clear js side too maybe?
-        if len(self.sessions) < 1:
-            # asyncio.get_event_loop().create_task(self._stop())
-            await self._stop()
-
-    async def _start(self) -> None:
-        """Will start the NodeJS core if not running.
-        Returns True if a node process was started"""
-        if self.running:
-            raise InvalidState("NodeJS is already running")
-        js_file = os.getcwd() + os.path.sep + "dist" + os.path.sep + "index.js"
-        self.proc = await asyncio.create_subprocess_exec(
-            "node", js_file,
-            stdin=PIPE,
-            stdout=PIPE,
-            stderr=sys.stderr,
-        )
-        asyncio.get_event_loop().create_task(self._event_worker())
-        logger.info("NodeJS started")
-
-    async def _stop(self, timeout:float=3.0) -> None:
-        """Will attempt to terminate gracefully the NodeJS core and wait until timeout (default 3s).
-        If the application won't exit by then, a SIGKILL will be sent."""
-        if not self.running:
-            raise InvalidState("NodeJS is not running")
-        try:
-            self.proc.send_signal(SIGINT)
-            await asyncio.wait_for(self.proc.communicate(), timeout=timeout)
-        except asyncio.TimeoutError:
-            logger.warning("NodeJS did not terminate cleanly, killing process...")
-            self.proc.kill()
-            await self.proc.communicate()
-        logger.info("NodeJS stopped")
-
-INSTANCE = JSCore()
\ No newline at end of file
+        worker = self.placement.pop(sid, None)
+        self._inflight_session.pop(sid, None)
+        if worker:
+            await worker.clear(sid)
+
+_instance : Optional[JSCore] = None
+
+def instance() -> JSCore:
+    """The JSCore every call shares, created on first use: importing the package spawns nothing"""
+    global _instance
+    if _instance is None:
+        _instance = JSCore()
+    return _instance
+
+class _LazyInstance:
+    """Stands for the shared JSCore, forwarding to instance()"""
+    def __getattr__(self, name:str) -> Any:
+        return getattr(instance(), name)
+
+    def __setattr__(self, name:str, value:Any) -> None:
+        setattr(instance(), name, value)
+
+# typed as the JSCore it forwards to, so that callers are checked against JSCore
+INSTANCE = cast(JSCore, _LazyInstance())
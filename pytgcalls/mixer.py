@@ -0,0 +1,185 @@
+import asyncio
+import logging
+
+from typing import TYPE_CHECKING, Any, AsyncIterable, AsyncIterator, List, Optional, Union
+
+from .helpers import DependancyException
+from .decoder import DECODERS, needs_decoding
+
+logger = logging.getLogger(__name__)
+
+if TYPE_CHECKING:
+    import numpy
+
+np : Any = None # numpy, optional and slow to import: imported by the first Mixer
+
+def _import_numpy() -> None:
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise DependancyException("Dependancy 'numpy' is required to mix sources") from None
+        np = numpy
+
+# a raw PCM or compressed file path or url, or an async iterable of PCM chunks
+LayerSource = Union[str, AsyncIterable[bytes]]
+
+async def _read_raw(path:str, chunk_size:int = 64 * 1024) -> AsyncIterator[bytes]:
+    loop = asyncio.get_event_loop()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = await loop.run_in_executor(None, f.read, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+class Layer:
+    """One source of a Mixer with its own gain. Gain changes are linear ramps over fade seconds,
+    applied sample by sample so they never click. Layers created with ducking=True lower every
+    other layer while they play, like a voice over music"""
+    def __init__(self, mixer:'Mixer', source:AsyncIterable[bytes], gain:float, fade_in:float, ducking:bool):
+        self.mixer : Mixer = mixer
+        self.ducking : bool = ducking
+        self.gain : float = 0.0 if fade_in else gain # reached at the end of the last mixed block
+        self.target : float = gain
+        self.step : float = 0.0 # gain change per sample while ramping
+        self.ended : bool = False
+        self._source : AsyncIterator[bytes] = source.__aiter__()
+        self._pending : memoryview = memoryview(b'')
+        self._remove_at_zero : bool = False
+        self._buffer : bytearray = bytearray(mixer.block * 2)
+        self._samples = np.frombuffer(self._buffer, dtype=np.int16) # a view, refilled in place
+        if fade_in:
+            self.set_gain(gain, fade_in)
+
+    def set_gain(self, gain:float, fade:float = 0.05) -> None:
+        self.target = max(0.0, gain)
+        samples = max(1, int(fade * self.mixer.sample_rate))
+        self.step = abs(self.target - self.gain) / samples
+
+    def fade_out(self, seconds:float) -> None:
+        """Fade to silence, then remove the layer"""
+        self.set_gain(0.0, seconds)
+        self._remove_at_zero = True
+
+    def remove(self) -> None:
+        self.ended = True
+
+    async def _fill(self) -> None:
+        """Refill the block buffer, padding with silence once the source is exhausted"""
+        filled, size = 0, len(self._buffer)
+        while filled < size:
+            if not self._pending:
+                try:
+                    self._pending = memoryview(await self._source.__anext__())
+                except StopAsyncIteration:
+                    self._buffer[filled:] = bytes(size - filled)
+                    self.ended = True
+                    return
+            n = min(size - filled, len(self._pending))
+            self._buffer[filled:filled + n] = self._pending[:n]
+            self._pending = self._pending[n:]
+            filled += n
+
+    def _advance(self, ramp:'numpy.ndarray', envelope:'numpy.ndarray') -> None:
+        """Write this block's gain, one value per sample, into envelope"""
+        start = self.gain
+        delta = self.target - start
+        span = self.step * len(envelope)
+        end = self.target if abs(delta) <= span else start + (span if delta > 0 else -span)
+        np.multiply(ramp, end - start, out=envelope)
+        envelope += start
+        self.gain = end
+        if self._remove_at_zero and end == 0.0:
+            self.ended = True
+
+    async def _close(self) -> None:
+        if hasattr(self._source, 'aclose'): # a decoder holds a pool slot until closed
+            await self._source.aclose()
+
+class Mixer:
+    """Mixes any number of sources into one, to be played like any async iterable source.
+    Mixing runs block by block with vectorized NumPy arithmetic over buffers allocated once, and
+    saturates to 16 bit. It stays at most lead seconds ahead of real time, so gain changes, fades
+    and ducking are heard within that delay (NodeJS needs a second of audio buffered, keep lead above it)"""
+    def __init__(self, sample_rate:int = 48000, block_ms:int = 50, lead:Optional[float] = 2.0, duck_gain:float = 0.3, duck_fade:float = 0.25):
+        _import_numpy()
+        self.sample_rate : int = sample_rate
+        self.block : int = sample_rate * block_ms // 1000
+        self.lead : Optional[float] = lead # None mixes as fast as the consumer reads, for offline rendering
+        self.duck_gain : float = duck_gain
+        self.duck_step : float = (1.0 - duck_gain) / max(1, int(duck_fade * sample_rate))
+        self.layers : List[Layer] = []
+        self.closed : bool = False
+        self.blocks : int = 0
+        self._duck : float = 1.0
+        self._ramp = np.linspace(0.0, 1.0, self.block, endpoint=False, dtype=np.float32)
+        self._envelope = np.empty(self.block, dtype=np.float32)
+        self._duck_envelope = np.empty(self.block, dtype=np.float32)
+        self._scaled = np.empty(self.block, dtype=np.float32)
+        self._mix = np.empty(self.block, dtype=np.float32)
+        self._out = np.empty(self.block, dtype=np.int16)
+
+    def add(self, source:LayerSource, gain:float = 1.0, fade_in:float = 0.0, ducking:bool = False) -> Layer:
+        """Start mixing source in, from the next block"""
+        if isinstance(source, str):
+            source = DECODERS.decode(source, self.sample_rate) if needs_decoding(source) else _read_raw(source)
+        layer = Layer(self, source, gain, fade_in, ducking)
+        self.layers.append(layer)
+        return layer
+
+    def close(self) -> None:
+        """End the mix once every layer ended, instead of playing silence"""
+        self.closed = True
+
+    async def aclose(self) -> None:
+        """Stop mixing right away, called when the session stops playing the mix"""
+        self.closed = True
+        layers, self.layers = self.layers, []
+        for layer in layers:
+            await layer._close()
+
+    def _advance_duck(self) -> None:
+        target = self.duck_gain if any(layer.ducking for layer in self.layers) else 1.0
+        span = self.duck_step * self.block
+        end = target if abs(target - self._duck) <= span else self._duck + (span if target > self._duck else -span)
+        np.multiply(self._ramp, end - self._duck, out=self._duck_envelope)
+        self._duck_envelope += self._duck
+        self._duck = end
+
+    def _mix_block(self) -> bytes:
+        self._advance_duck()
+        self._mix.fill(0.0)
+        for layer in self.layers:
+            layer._advance(self._ramp, self._envelope)
+            if not layer.ducking:
+                self._envelope *= self._duck_envelope
+            np.multiply(layer._samples, self._envelope, out=self._scaled)
+            self._mix += self._scaled
+        np.rint(self._mix, out=self._mix)
+        np.clip(self._mix, -32768, 32767, out=self._mix)
+        self._out[:] = self._mix
+        self.blocks += 1
+        return self._out.tobytes()
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        loop = asyncio.get_event_loop()
+        started = loop.time()
+        try:
+            while True:
+                # exhausted or faded out while mixing the last block, or removed since
+                for layer in [ layer for layer in self.layers if layer.ended ]:
+                    self.layers.remove(layer)
+                    await layer._close()
+                if self.closed and not self.layers:
+                    return
+                await asyncio.gather(*[ layer._fill() for layer in self.layers ])
+                yield self._mix_block()
+                if self.lead is not None:
+                    ahead = self.blocks * self.block / self.sample_rate - (loop.time() - started) - self.lead
+                    if ahead > 0:
+                        await asyncio.sleep(ahead)
+        finally:
+            for layer in self.layers:
+                await layer._close()
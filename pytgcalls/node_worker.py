@@ -0,0 +1,392 @@
+import os
+import sys
+import asyncio
+import logging
+
+from asyncio.subprocess import Process
+
+from signal import SIGINT
+from subprocess import PIPE
+
+from typing import Dict, Tuple, Any, List, Optional, Awaitable, Generator, Callable
+
+from .helpers import check_version
+from .codec import JsonLinesCodec, CodecException
+from .callback_executor import CallbackExecutor, LatencyHistogram
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+# a core that stayed up this long before crashing is restarted right away, crashing sooner it's backed off
+STABLE_AFTER = 60.0
+
+NODE_MIN_VERSION = '15'
+
+# longest packet read from a core, the worker status carries positions and metrics of each of its sessions
+READ_LIMIT = 1 << 24
+
+class InvalidState(Exception):
+    pass
+
+class CoreDied(InvalidState):
+    pass
+
+class RequestTimeout(Exception):
+    pass
+
+class NodeWorker:
+    """A single NodeJS core process and the sessions pinned to it.
+    When the process dies under live sessions it's restarted, waiting restart_backoff seconds (doubled for
+    every further crash in a row, up to max_backoff) unless it stayed up STABLE_AFTER seconds, and giving up
+    after max_restarts crashes in a row. Then every session's recovery hook replays it, broadcasts first,
+    each within recovery_timeout seconds. Commands sent meanwhile wait for the recovery to end.
+    Sessions get a 'reconnect' event once it's over, telling whether they're back and how long it took"""
+    def __init__(
+        self,
+        index:int = 0,
+        codec:Optional[Any] = None,
+        command:Optional[List[str]] = None,
+        timeout:float = 30.0,
+        offer_pool:int = 0,
+        restart_backoff:float = 0.5,
+        max_backoff:float = 10.0,
+        max_restarts:int = 5,
+        recovery_timeout:float = 30.0,
+        executor:Optional[CallbackExecutor] = None,
+    ):
+        self.index : int = index
+        self.timeout : float = timeout # default deadline for acks, in seconds
+        self.offer_pool : int = offer_pool # peer connections kept ready with a local offer
+        self.codec = codec or JsonLinesCodec()
+        self.command : Optional[List[str]] = command # replaces the default 'node dist/index.js', mostly for benchmarks
+        self.proc : Process = None
+        self.packet_count : int = 0
+        self.waiting : Dict[int, asyncio.Future] = {}
+        self.sessions : Dict[str, str] = {}
+        self.core_status : Dict[str, Any] = {} # last worker wide status packet, carries scheduler stats and metrics
+        self.rtt : Dict[str, LatencyHistogram] = {} # command to ack round trips, by session
+        self.core_status_at : float = 0.0 # loop time it was received at
+        self.callbacks : Dict[str, Dict[str, List[Callable[[dict], Awaitable]]]] = {}
+        self.handlers : Dict[str, Dict[str, Callable]] = {}
+        self.executor : CallbackExecutor = executor or CallbackExecutor() # runs the callbacks, in order per session
+        self.recoveries : Dict[str, Tuple[int, Callable[[], Awaitable]]] = {} # replays a session, by priority
+        self.restart_backoff : float = restart_backoff
+        self.max_backoff : float = max_backoff
+        self.max_restarts : int = max_restarts
+        self.recovery_timeout : float = recovery_timeout
+        self.crashes : int = 0
+        self.last_recovery : Optional[float] = None # seconds from the last crash to every session replayed
+        self.crashed_at : Optional[float] = None # loop time of the last crash
+        self._crash_streak : int = 0
+        self._started_at : float = 0.0
+        self._stopping : bool = False
+        self._recovering : Optional[asyncio.Future] = None # resolved once a crashed core is back and replayed
+        self._starting : Optional[asyncio.Future] = None
+        self._outbox : List[bytes] = []
+        self._flushing : Optional[asyncio.Future] = None
+
+    @property
+    def running(self) -> bool:
+        """Check if this NodeJS worker is already running"""
+        if self.proc and self.proc.returncode is None:
+            return True
+        return False
+
+    @property
+    def load(self) -> int:
+        """Number of sessions currently pinned to this worker"""
+        return len(self.sessions)
+
+    async def __aiter__(self) -> Generator[Tuple[dict, str, int, str], Any, None]: # This was a cool 2-liner but like this it's more reliable
+        while self.running:
+            try:
+                packet = await self.codec.read(self.proc.stdout)
+            except CodecException:
+                logger.exception("Could not deserialize packet")
+                continue
+            if packet is None: # EOF, process is exiting
+                break
+            if not all(k in packet for k in ("sid", "pid", "_")):
+                logger.error("Ignoring packet with missing slots : %s", str(packet))
+                continue
+            yield packet, packet["sid"], packet["pid"], packet["_"].lower()
+
+    async def _send(self, packet:dict) -> None:
+        """Queue a packet for the next flush. Everything sent during the same loop iteration
+        is coalesced into a single write and drain"""
+        self._outbox.append(self.codec.encode(packet))
+        if not self._flushing:
+            self._flushing = asyncio.get_event_loop().create_task(self._flush())
+        await asyncio.shield(self._flushing)
+
+    async def _flush(self) -> None:
+        await asyncio.sleep(0) # let every other sender of this iteration queue up
+        buf, self._outbox = b''.join(self._outbox), []
+        self._flushing = None # anything queued from now on goes into the next batch
+        self.proc.stdin.write(buf)
+        await self.proc.stdin.drain()
+
+    async def _event_worker(self) -> None:
+        logger.debug("Starting packet worker #%d", self.index)
+        async for packet, sid, pid, type in self:
+            try:
+                debug = logger.isEnabledFor(logging.DEBUG) # cached by logging, the packet is only formatted if enabled
+                if debug:
+                    logger.debug("Processing event '%d' [%s] | %s", pid, type, packet)
+                if type == "ack":
+                    future = self.waiting.pop(pid, None)
+                    if future and not future.done():
+                        future.set_result(packet)
+                    elif debug: # caller timed out or was cancelled meanwhile
+                        logger.debug("Dropping late ack '%d'", pid)
+                elif type == "status":
+                    if sid:
+                        self.sessions[sid] = packet['status']
+                    else: # worker wide status, must not count as a session
+                        self.core_status = packet
+                        self.core_status_at = asyncio.get_event_loop().time()
+                elif type == "request":
+                    asyncio.get_event_loop().create_task(self._handle_request(packet, sid, pid))
+                elif type == "event":
+                    self._emit(sid, packet)
+                else:
+                    logger.warning("Unexpected packet type '%s'", type)
+            except Exception: # this background worker must not die, catch very broadly
+                logger.exception("Exception processing packet '%s'", str(packet))
+        self._fail_waiting(CoreDied(f"NodeJS worker #{self.index} exited"))
+        logger.debug("Stopping packet worker #%d", self.index)
+        if not self._stopping and self.sessions and not self._recovering:
+            self._recovering = asyncio.get_event_loop().create_future()
+            asyncio.get_event_loop().create_task(self._recover(self._recovering))
+
+    def _emit(self, sid:str, packet:dict) -> None:
+        self.executor.submit(sid, packet["event"], self.callbacks.get(sid, {}).get(packet["event"], []), packet)
+
+    async def _recover(self, recovering:asyncio.Future) -> None:
+        """The core died under live sessions: start it again and replay them, then resolve recovering"""
+        loop = asyncio.get_event_loop()
+        crashed = self.crashed_at = loop.time()
+        replayed : Dict[str, bool] = {}
+        try:
+            while True:
+                code = await self.proc.wait()
+                self.crashes += 1
+                self._crash_streak = 1 if loop.time() - self._started_at >= STABLE_AFTER else self._crash_streak + 1
+                logger.error(
+                    "NodeJS worker #%d died (exit code %s) under %d sessions, crash %d in a row",
+                    self.index, code, len(self.sessions), self._crash_streak,
+                )
+                if not self.sessions: # all cleared meanwhile
+                    break
+                if self._crash_streak > self.max_restarts:
+                    raise CoreDied(f"NodeJS worker #{self.index} crashed {self._crash_streak} times in a row, giving up")
+                if self._crash_streak > 1:
+                    await asyncio.sleep(min(self.max_backoff, self.restart_backoff * 2 ** (self._crash_streak - 2)))
+                await self._start()
+                for sid in self.sessions:
+                    self.sessions[sid] = 'recovering'
+                replayed = await self._replay()
+                if self.running: # else it died again while replaying
+                    break
+        except Exception as e:
+            logger.exception("Could not recover NodeJS worker #%d", self.index)
+            for sid in self.sessions:
+                self.sessions[sid] = 'lost'
+            recovering.set_exception(e if isinstance(e, CoreDied) else CoreDied(str(e)))
+            recovering.exception() # retrieved, nobody may be waiting
+            self._recovering = None
+            for sid in list(self.sessions):
+                self._emit(sid, {'event': 'reconnect', 'recovered': False, 'recovery_ms': None})
+            return
+        self.last_recovery = loop.time() - crashed
+        logger.info(
+            "NodeJS worker #%d recovered %d of %d sessions in %.0fms",
+            self.index, sum(replayed.values()), len(replayed), self.last_recovery * 1000,
+        )
+        recovering.set_result(None)
+        self._recovering = None
+        for sid, ok in replayed.items():
+            self._emit(sid, {'event': 'reconnect', 'recovered': ok, 'recovery_ms': round(self.last_recovery * 1000)})
+
+    async def _replay(self) -> Dict[str, bool]:
+        """Run the recovery hook of every session, lowest priority first: calls playing
+        a broadcast can only join again once the broadcast is back"""
+        replayed = { sid: False for sid in self.sessions }
+        for priority in sorted({ p for p, _ in self.recoveries.values() }):
+            sids = [ sid for sid, (p, _) in self.recoveries.items() if p == priority and sid in self.sessions ]
+            results = await asyncio.gather(
+                *(asyncio.wait_for(self.recoveries[sid][1](), self.recovery_timeout) for sid in sids),
+                return_exceptions=True,
+            )
+            for sid, result in zip(sids, results):
+                if isinstance(result, BaseException):
+                    logger.error("Could not replay session '%s' on worker #%d : %r", sid, self.index, result)
+                replayed[sid] = not isinstance(result, BaseException)
+        for sid, ok in replayed.items():
+            if not ok:
+                self.sessions[sid] = 'lost'
+        return replayed
+
+    def _fail_waiting(self, exc:Exception) -> None:
+        """Make every caller still awaiting an ack fail right away"""
+        waiting, self.waiting = self.waiting, {}
+        for future in waiting.values():
+            if not future.done():
+                future.set_exception(exc)
+
+    async def _handle_request(self, packet:dict, sid:str, pid:int) -> None:
+        """Answer a request coming from NodeJS, correlated by its pid"""
+        response = {'_': 'response', 'sid': sid, 'pid': pid}
+        try:
+            if packet["request"] not in self.handlers.get(sid, {}):
+                raise InvalidState(f"No handler for request '{packet['request']}' on session '{sid}'")
+            response['data'] = await self.handlers[sid][packet["request"]](packet.get("data", {}))
+        except Exception as e:
+            logger.exception("Exception handling request '%s'", packet["request"])
+            response['error'] = str(e) or type(e).__name__
+        try:
+            await self._send(response)
+        except Exception: # nobody awaits this task
+            logger.exception("Could not answer request '%s' of session '%s'", packet["request"], sid)
+
+    def handle(self, sid:str, request:str) -> Callable:
+        def decorator(fun:Callable[[dict], Awaitable]) -> Callable[[dict], Awaitable]:
+            if sid not in self.handlers:
+                self.handlers[sid] = {}
+            self.handlers[sid][request] = fun
+            return fun
+        return decorator
+
+    def on(self, sid:str, event:str) -> Callable:
+        def decorator(fun:Callable[[dict], Awaitable]) -> Callable[[dict], Awaitable]:
+            if sid not in self.callbacks:
+                self.callbacks[sid] = {}
+            if event not in self.callbacks[sid]:
+                self.callbacks[sid][event] = []
+            self.callbacks[sid][event].append(fun)
+            return fun
+        return decorator
+
+    def on_recover(self, sid:str, priority:int = 0) -> Callable:
+        """Register what replays a session into a restarted core. Its commands must be sent with replay=True"""
+        def decorator(fun:Callable[[], Awaitable]) -> Callable[[], Awaitable]:
+            self.recoveries[sid] = (priority, fun)
+            return fun
+        return decorator
+
+    @property
+    def recovering(self) -> bool:
+        return self._recovering is not None
+
+    async def wait_recovered(self) -> None:
+        """Return once a crashed core is back with its sessions replayed, right away when it's not crashed.
+        Raises CoreDied if it could not be restarted"""
+        if self._recovering:
+            await asyncio.shield(self._recovering)
+
+    def state(self, sid:str) -> Optional[str]:
+        if sid not in self.sessions:
+            return None
+        return self.sessions[sid]
+
+    async def send(self, sid:str, packet:dict, timeout:Optional[float] = None, replay:bool = False) -> dict:
+        """Send a command and wait for its ack, for at most timeout seconds (defaults to self.timeout).
+        While a crashed core recovers it's held back, unless it's part of a session's replay"""
+        if not replay:
+            await self.wait_recovered()
+        if not self.running:
+            raise InvalidState("Session not initialized")
+        pid = self.packet_count
+        self.packet_count += 1
+        packet["pid"] = pid
+        packet["sid"] = sid
+        future = asyncio.get_event_loop().create_future()
+        self.waiting[pid] = future
+        sent = asyncio.get_event_loop().time()
+        tracer = tracing.TRACER
+        token = tracer.start('ipc', {'sid': sid, 'action': packet.get('action'), 'worker': self.index}) if tracer else None
+        error : Optional[BaseException] = None
+        try:
+            await self._send(packet)
+            ack = await asyncio.wait_for(future, timeout or self.timeout)
+            if sid not in self.rtt:
+                self.rtt[sid] = LatencyHistogram()
+            self.rtt[sid].observe(asyncio.get_event_loop().time() - sent)
+            return ack
+        except asyncio.TimeoutError as e:
+            error = RequestTimeout(f"No ack for '{packet.get('action')}' from worker #{self.index} in {timeout or self.timeout}s")
+            raise error from e
+        except ConnectionError as e: # died before we could even write it
+            error = CoreDied(f"NodeJS worker #{self.index} exited")
+            raise error from e
+        except BaseException as e:
+            error = e
+            raise
+        finally: # acked, timed out or cancelled, never leave it behind
+            self.waiting.pop(pid, None)
+            if future.done() and not future.cancelled():
+                future.exception() # failed by _fail_waiting while still writing, already raised
+            if tracer:
+                tracer.end(token, error)
+
+    async def init(self, sid:str) -> str:
+        try:
+            await self.wait_recovered()
+        except CoreDied: # the crashed core was given up on, start a fresh one
+            pass
+        self.sessions[sid] = 'new' # reserve the slot right away so concurrent placements see it
+        self.callbacks[sid] = {}
+        await self.start()
+        return sid
+
+    async def start(self) -> None:
+        """Start the process unless it's running, concurrent callers share the same start"""
+        if self.running:
+            return
+        if not self._starting:
+            self._starting = asyncio.get_event_loop().create_task(self._start())
+            self._starting.add_done_callback(lambda _: setattr(self, '_starting', None))
+        await asyncio.shield(self._starting)
+
+    async def clear(self, sid:str) -> None:
+        self.sessions.pop(sid, None)
+        self.callbacks.pop(sid, None)
+        self.handlers.pop(sid, None)
+        self.recoveries.pop(sid, None)
+        self.rtt.pop(sid, None)
+        if len(self.sessions) < 1 and self.running:
+            await self._stop()
+
+    async def _start(self) -> None:
+        """Will start this NodeJS worker if not running"""
+        if self.running:
+            raise InvalidState("NodeJS worker is already running")
+        js_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dist", "index.js")
+        if not self.command: # probed once, later starts hit the cache
+            await check_version('node', NODE_MIN_VERSION)
+        self.proc = await asyncio.create_subprocess_exec(
+            *(self.command or ["node", js_file]), f"--codec={self.codec.name}", f"--prewarm={self.offer_pool}",
+            stdin=PIPE,
+            stdout=PIPE,
+            stderr=sys.stderr,
+            limit=READ_LIMIT,
+        )
+        self._stopping = False
+        self._started_at = asyncio.get_event_loop().time()
+        asyncio.get_event_loop().create_task(self._event_worker())
+        logger.info("NodeJS worker #%d started", self.index)
+
+    async def _stop(self, timeout:float=3.0) -> None:
+        """Will attempt to terminate gracefully this NodeJS worker and wait until timeout (default 3s).
+        If the application won't exit by then, a SIGKILL will be sent."""
+        if not self.running:
+            raise InvalidState("NodeJS worker is not running")
+        self._stopping = True
+        try:
+            self.proc.send_signal(SIGINT)
+            await asyncio.wait_for(self.proc.wait(), timeout=timeout) # stdout belongs to the packet worker
+        except asyncio.TimeoutError:
+            logger.warning("NodeJS worker #%d did not terminate cleanly, killing process...", self.index)
+            self.proc.kill()
+            await self.proc.wait()
+        logger.info("NodeJS worker #%d stopped", self.index)
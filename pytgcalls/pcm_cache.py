@@ -0,0 +1,181 @@
+import os
+import glob
+import fcntl
+import asyncio
+import hashlib
+import logging
+import tempfile
+
+from typing import Dict, Optional, Tuple
+
+from .decoder import DECODERS, DecoderPool, PLAYING
+
+logger = logging.getLogger(__name__)
+
+# how long a completed part file keeps its name, players are handed that path before it completes
+PART_GRACE = 30.0
+
+class PcmCache:
+    """Decoded PCM on disk, keyed by a hash of the source content plus sample rate and channels.
+    A missing entry is decoded at full speed into a part file, under an exclusive flock on '<key>.pcm.lock'
+    (empty, never deleted), and linked to its final name once complete, so whole entries are all other
+    processes ever see: a failed decode is dropped and decoded again by the next request.
+    In this process, every request for an entry being decoded shares that decode and can play the part
+    file right away as a live file. Least recently used entries are evicted once max_bytes is exceeded"""
+    def __init__(self, directory:Optional[str] = None, max_bytes:int = 1 << 30, decoders:Optional[DecoderPool] = None):
+        self.directory : str = directory or os.path.join(tempfile.gettempdir(), 'pytgcalls-cache')
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_bytes : int = max_bytes
+        self.decoders : DecoderPool = decoders or DECODERS
+        self.hits : int = 0
+        self.misses : int = 0
+        self.coalesced : int = 0 # misses served by a decode already in progress
+        self.evictions : int = 0
+        self._inflight : Dict[str, Tuple[str, asyncio.Future]] = {}
+        self._digests : Dict[Tuple[str, int, int], str] = {} # (path, size, mtime) -> content hash, hashing isn't free
+
+    def stats(self) -> Dict[str, int]:
+        entries, size = 0, 0
+        for _, _, entry_size in self._entries():
+            entries += 1
+            size += entry_size
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'evictions': self.evictions,
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+        }
+
+    def _path(self, key:str) -> str:
+        return os.path.join(self.directory, key + '.pcm')
+
+    async def _digest(self, source:str) -> str:
+        if '://' in source: # can't hash a remote stream without fetching it, the url has to do
+            return hashlib.sha256(source.encode()).hexdigest()
+        st = os.stat(source)
+        memo = (os.path.abspath(source), st.st_size, st.st_mtime_ns)
+        if memo not in self._digests:
+            self._digests[memo] = await asyncio.get_event_loop().run_in_executor(None, _hash_file, source)
+        return self._digests[memo]
+
+    async def key(self, source:str, sample_rate:int = 48000, channels:int = 1) -> str:
+        return f'{await self._digest(source)}-{sample_rate}-{channels}'
+
+    def lookup(self, key:str) -> Optional[str]:
+        """Path of a complete entry, marking it as recently used"""
+        path = self._path(key)
+        try:
+            os.utime(path) # mtime doubles as last use, atime is often disabled
+        except FileNotFoundError:
+            return None
+        return path
+
+    async def open(self, source:str, sample_rate:int = 48000, channels:int = 1, priority:int = PLAYING) -> Tuple[str, asyncio.Future]:
+        """Raw PCM path for source, and a future resolved once that file is complete. Until then the path
+        is still being written and must be played as a live file"""
+        key = await self.key(source, sample_rate, channels)
+        loop = asyncio.get_event_loop()
+        while True:
+            path = self.lookup(key)
+            if path:
+                self.hits += 1
+                complete = loop.create_future()
+                complete.set_result(None)
+                return path, complete
+            if key in self._inflight:
+                self.coalesced += 1
+                return self._inflight[key]
+            lock = os.open(self._path(key) + '.lock', os.O_RDONLY | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError: # another process is decoding it, wait until it's done and look again
+                try:
+                    await loop.run_in_executor(None, fcntl.flock, lock, fcntl.LOCK_SH)
+                finally:
+                    os.close(lock)
+                continue
+            if self.lookup(key): # completed while we were locking
+                os.close(lock)
+                continue
+            break
+        self.misses += 1
+        part = f'{self._path(key)}.{os.getpid()}.part'
+        try:
+            os.unlink(part) # left over by a crashed process with our pid
+        except FileNotFoundError:
+            pass
+        fd = os.open(part, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        complete = loop.create_future()
+        self._inflight[key] = (part, complete)
+        loop.create_task(self._fill(key, lock, fd, source, sample_rate, channels, priority))
+        return part, complete
+
+    async def _fill(self, key:str, lock:int, fd:int, source:str, sample_rate:int, channels:int, priority:int) -> None:
+        part, complete = self._inflight[key]
+        try:
+            with os.fdopen(fd, 'wb', buffering=0) as out:
+                async for chunk in self.decoders.decode(source, sample_rate, priority, channels):
+                    out.write(chunk)
+            # a second name for the same inode: the part path stays valid for players which didn't open it yet
+            os.link(part, self._path(key))
+        except BaseException as e:
+            # never linked, the next request decodes again. Players of the part file get the error
+            # through complete, and play what was decoded until then
+            os.close(lock) # releases the flock
+            del self._inflight[key]
+            _unlink(part)
+            if not isinstance(e, Exception):
+                complete.cancel()
+                raise
+            logger.exception("Could not decode '%s' into the PCM cache", source)
+            complete.set_exception(e)
+            complete.exception() # retrieved, whether anybody waits for it or not
+            return
+        os.close(lock)
+        del self._inflight[key]
+        complete.set_result(None)
+        asyncio.get_event_loop().call_later(PART_GRACE, _unlink, part)
+        self._evict()
+
+    def _entries(self):
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.pcm'):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError: # evicted by another process meanwhile
+                        continue
+                    yield entry.path, st.st_mtime, st.st_size
+
+    def _evict(self) -> None:
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            try: # readers keep their open descriptor, unlinking under them is safe
+                parts = [ p for p in glob.glob(glob.escape(path) + '.*.part') if os.path.samefile(p, path) ]
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            for part in parts: # other names of this same entry, still in their grace period
+                _unlink(part)
+            # its lock file stays: a process blocked on it would lock an inode the next filler doesn't share
+            total -= size
+            self.evictions += 1
+
+def _unlink(path:str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+def _hash_file(path:str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
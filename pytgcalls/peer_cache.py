@@ -0,0 +1,97 @@
+import time
+import asyncio
+import weakref
+
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from pyrogram import Client
+from pyrogram.raw.base import InputPeer
+from pyrogram.raw.types import InputGroupCall
+from pyrogram.raw.functions.channels import GetFullChannel
+
+class TTLCache:
+    """LRU cache whose entries expire ttl seconds after being stored.
+    Concurrent fetches of the same missing key share a single lookup."""
+    def __init__(self, ttl:float = 3600.0, maxsize:int = 1024):
+        self.ttl : float = ttl
+        self.maxsize : int = maxsize
+        self.entries : 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self.pending : Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key:Hashable) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key:Hashable) -> Optional[Any]:
+        if key not in self.entries:
+            return None
+        value, expires = self.entries[key]
+        if expires < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key:Hashable, value:Any) -> None:
+        self.entries[key] = (value, time.monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def pop(self, key:Hashable) -> Optional[Any]:
+        entry = self.entries.pop(key, None)
+        return entry[0] if entry else None
+
+    async def fetch(self, key:Hashable, factory:Callable[[], Awaitable]) -> Any:
+        """Return the cached value for key, or await factory() to get it.
+        None results are not cached."""
+        value = self.get(key)
+        if value is not None:
+            return value
+        if key not in self.pending:
+            self.pending[key] = asyncio.ensure_future(factory())
+            self.pending[key].add_done_callback(lambda _: self.pending.pop(key, None))
+        value = await asyncio.shield(self.pending[key])
+        if value is not None:
+            self.put(key, value)
+        return value
+
+class ClientCache:
+    """Peers and group call handles resolved through a pyrogram Client, shared by all its calls.
+    Kept fresh by the UpdateDispatcher, so that joining a known chat costs no lookups."""
+    _instances : 'weakref.WeakKeyDictionary[Client, ClientCache]' = weakref.WeakKeyDictionary()
+
+    def __init__(self, client:Client, ttl:float = 3600.0, maxsize:int = 1024):
+        self.client : Client = client
+        self.me = TTLCache(ttl, 1)
+        self.peers = TTLCache(ttl, maxsize)
+        self.calls = TTLCache(ttl, maxsize)
+
+    @classmethod
+    def for_client(cls, client:Client) -> 'ClientCache':
+        if client not in cls._instances:
+            cls._instances[client] = cls(client)
+        return cls._instances[client]
+
+    async def self_peer(self) -> InputPeer:
+        async def resolve():
+            me = await self.client.get_me()
+            return await self.client.resolve_peer(me.id)
+        return await self.me.fetch('me', resolve)
+
+    async def chat_peer(self, chat_id:int) -> InputPeer:
+        return await self.peers.fetch(chat_id, lambda: self.client.resolve_peer(chat_id))
+
+    async def input_call(self, chat_id:int) -> Optional[InputGroupCall]:
+        """InputGroupCall of the active voice chat in chat_id, None if there is none"""
+        async def resolve():
+            full_chat = await self.client.send(GetFullChannel(channel=await self.chat_peer(chat_id)))
+            return full_chat.full_chat.call
+        return await self.calls.fetch(chat_id, resolve)
+
+    def forget_chat(self, chat_id:int) -> None:
+        self.peers.pop(chat_id)
+        self.calls.pop(chat_id)
@@ -0,0 +1,104 @@
+import logging
+
+from typing import TYPE_CHECKING, Any, Callable, Dict, List
+
+from .helpers import DependancyException
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Session.metrics keys exported as is, with their type
+SESSION_METRICS = {
+    'buffer_ms': ('gauge', "Audio buffered ahead of playback"),
+    'frames_sent': ('counter', "10ms frames sent"),
+    'late_frames': ('counter', "Frames sent after their due time"),
+    'underruns': ('counter', "Times playback ran out of buffered audio"),
+    'starved_frames': ('counter', "Frames missing during underruns"),
+    'since_last_frame_ms': ('gauge', "Time since the last frame was sent"),
+    'join_ms': ('gauge', "Time the last join took"),
+}
+
+WORKER_METRICS = {
+    'sessions': ('gauge', "Sessions placed on the worker"),
+    'crashes': ('counter', "Times the worker process died"),
+    'late_frames': ('counter', "Frames the frame clock ticked late"),
+    'skipped_frames': ('counter', "Frames the frame clock gave up catching up on"),
+    'jitter_ms': ('gauge', "Frame clock jitter"),
+}
+
+class Exposition:
+    """Prometheus text exposition format, one family at a time"""
+    def __init__(self):
+        self.lines : List[str] = []
+
+    def family(self, name:str, type:str, help:str) -> str:
+        """Start a family, returns the name to sample it with: counters end with _total"""
+        if type == 'counter':
+            name += '_total'
+        self.lines.append(f"# HELP pytgcalls_{name} {help}")
+        self.lines.append(f"# TYPE pytgcalls_{name} {type}")
+        return name
+
+    def sample(self, name:str, labels:Dict[str, Any], value:Any) -> None:
+        if value is None:
+            return
+        if labels:
+            pairs = ','.join(f'{k}="{str(v)}"' for k, v in labels.items())
+            self.lines.append(f"pytgcalls_{name}{{{pairs}}} {value}")
+        else:
+            self.lines.append(f"pytgcalls_{name} {value}")
+
+    def histogram(self, name:str, labels:Dict[str, Any], histogram:Dict[str, Any]) -> None:
+        """From LatencyHistogram.to_dict()"""
+        for bound, count in histogram['buckets'].items():
+            self.sample(f"{name}_bucket", {**labels, 'le': bound}, count)
+        self.sample(f"{name}_sum", labels, (histogram['mean_ms'] or 0) * histogram['count'])
+        self.sample(f"{name}_count", labels, histogram['count'])
+
+    def text(self) -> str:
+        return '\n'.join(self.lines) + '\n'
+
+def render(sessions:Dict[int, Any], workers:List[Dict[str, Any]], callbacks:Dict[str, Any]) -> str:
+    """Metrics of every call by chat id (Session.metrics), of every worker (JSCore.worker_stats)
+    and of callbacks (CallbackExecutor.stats)"""
+    out = Exposition()
+    metrics = { chat_id: session.metrics() for chat_id, session in sessions.items() }
+    for key, (type, help) in SESSION_METRICS.items():
+        name = out.family(f"session_{key}", type, help)
+        for chat_id, m in metrics.items():
+            out.sample(name, {'chat_id': chat_id}, m.get(key))
+    out.family("session_ipc_rtt_ms", 'histogram', "Round trips of commands to NodeJS")
+    for chat_id, m in metrics.items():
+        if 'ipc_rtt' in m:
+            out.histogram("session_ipc_rtt_ms", {'chat_id': chat_id}, m['ipc_rtt'])
+    for key, (type, help) in WORKER_METRICS.items():
+        name = out.family(f"worker_{key}", type, help)
+        for w in workers:
+            out.sample(name, {'worker': w['worker']}, w.get(key))
+    out.sample(out.family("callback_errors", 'counter', "Event callbacks that raised"), {}, callbacks['errors'])
+    out.sample(out.family("callback_pending", 'gauge', "Events waiting for their callbacks"), {}, callbacks['pending'])
+    out.family("callback_latency_ms", 'histogram', "Time event callbacks took")
+    for handler, histogram in callbacks['handlers'].items():
+        out.histogram("callback_latency_ms", {'handler': handler}, histogram)
+    return out.text()
+
+async def serve(text:Callable[[], str], host:str = '127.0.0.1', port:int = 9464) -> 'web.AppRunner':
+    """Serve text() on /metrics, returns the runner: await runner.cleanup() to stop.
+    Only local by default, pass host='0.0.0.0' for a Prometheus on another machine"""
+    try: # optional and slow to import, only needed to serve metrics over http
+        from aiohttp import web
+    except ImportError:
+        raise DependancyException("Dependancy 'aiohttp' is required to serve metrics") from None
+
+    async def handler(request:'web.Request') -> 'web.Response':
+        return web.Response(text=text(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Serving metrics on http://%s:%d/metrics", host, port)
+    return runner
@@ -1,14 +1,19 @@
 """This file just provides backward compatibility for the old, synchronous way of using this library"""
 import asyncio
 
-from typing import Awaitable, Optional, Dict
+from typing import Any, Awaitable, Callable, Coroutine, Optional, Dict, List, Union
 
 import pyrogram
 from pyrogram.raw.base import InputPeer
 
 from .js_core import INSTANCE as JSC
-from .helpers import assert_version, event_handler
-from .groupcall import GroupCall
+from .decoder import DECODERS
+from .pcm_cache import PcmCache
+from .helpers import assert_version
+from .dispatcher import UpdateDispatcher
+from .groupcall import GroupCall, Source
+from .broadcast import Broadcast
+from . import prometheus
 
 class MissingClientException(Exception):
     pass
@@ -17,47 +22,124 @@ class PyTgCalls:
     def __init__(
         self,
         client: pyrogram.Client,
+        workers: Optional[int] = None,
+        wire_format: Optional[str] = None,
+        decoders: Optional[int] = None,
+        pcm_cache: Optional[PcmCache] = None,
+        callback_threads: int = 0,
     ):
         self.client : pyrogram.Client = client
+        self.pcm_cache : Optional[PcmCache] = pcm_cache # shared by every call, compressed inputs are decoded once
         self.calls : Dict[int, GroupCall] = {}
+        if workers: # defaults to one NodeJS worker per CPU
+            JSC.resize(workers)
+        if wire_format: # defaults to JSON lines
+            JSC.set_codec(wire_format)
+        if decoders: # defaults to one ffmpeg per CPU
+            DECODERS.resize(decoders)
+        if callback_threads: # sync event callbacks run on the loop by default
+            JSC.executor.threads = callback_threads
 
-    def _run_bg(self, task:Awaitable, *args, **kwargs) -> asyncio.Task:
-        return asyncio.get_event_loop().create_task(task(*args, **kwargs))
+    def _run_bg(self, task:Coroutine[Any, Any, Any]) -> asyncio.Task:
+        return asyncio.get_event_loop().create_task(task)
 
     def run(self, start_pyro=True):
         if not self.client:
             raise MissingClientException("Pyrogram client not configured")
-        
-        assert_version('node', '15')
+
         assert_version('pyrogram', '1.2', pyrogram.__version__)
 
         if start_pyro:
             self.client.run()
 
-    def set_volume(self, chat_id:int, vol:int) -> None:
-        self._run_bg(self.calls[chat_id].set_volume(vol))
+    def prewarm(self, workers:Optional[int] = None) -> asyncio.Task:
+        """Start NodeJS workers now, in background, when calls are known to be coming: see JSCore.prewarm"""
+        return self._run_bg(JSC.prewarm(workers))
+
+    def decoder_stats(self) -> Dict[str, float]:
+        """ffmpeg pool usage: running and queued decodes, total decoder CPU time and queue wait"""
+        return DECODERS.stats()
+
+    def cache_stats(self) -> Dict[str, int]:
+        """PCM cache hits, misses, coalesced decodes, evictions and size, empty without a cache"""
+        return self.pcm_cache.stats() if self.pcm_cache else {}
+
+    def callback_stats(self) -> Dict[str, Any]:
+        """Event callbacks: workers busy, events pending, errors, slow calls, and latency histograms
+        of how long events waited and of each handler"""
+        return JSC.executor.stats()
+
+    def metrics(self, chat_id:int) -> Dict[str, Any]:
+        """Audio health of a call, see Session.metrics"""
+        return self.calls[chat_id].metrics()
+
+    def metrics_text(self) -> str:
+        """Metrics of every call, worker and of event callbacks in Prometheus text format"""
+        return prometheus.render(self.calls, JSC.worker_stats(), JSC.executor.stats())
+
+    def serve_metrics(self, host:str = '127.0.0.1', port:int = 9464) -> asyncio.Task:
+        """Serve metrics_text() on http://host:port/metrics for Prometheus to scrape, needs aiohttp.
+        Only reachable locally unless host is set, metrics tell which chats are in a call"""
+        return self._run_bg(prometheus.serve(self.metrics_text, host, port))
+
+    def on_group_call_invite(self) -> Callable:
+        return UpdateDispatcher.for_client(self.client).on_group_call_invite()
+
+    def set_volume(self, chat_id:int, vol:int) -> asyncio.Task:
+        return self._run_bg(self.calls[chat_id].set_volume(vol))
     
-    def pause_stream(self, chat_id:int) -> None:
-        self._run_bg(self.calls[chat_id].pause_stream())
+    def set_local_volume(self, chat_id:int, volume:float, ramp:float = 0.05) -> asyncio.Task:
+        return self._run_bg(self.calls[chat_id].set_local_volume(volume, ramp))
 
-    def resume_stream(self, chat_id:int) -> None:
-        self._run_bg(self.calls[chat_id].resume_stream())
+    def pause_stream(self, chat_id:int) -> asyncio.Task:
+        return self._run_bg(self.calls[chat_id].pause_stream())
 
-    def change_stream(self, chat_id:int, file_path: str):
-        self._run_bg(self.calls[chat_id].change_stream(file_path))
+    def resume_stream(self, chat_id:int) -> asyncio.Task:
+        return self._run_bg(self.calls[chat_id].resume_stream())
 
-    def leave_group_call(self, chat_id:int, reason:str = 'committed sudoku'):
-        t = self._run_bg(self.calls[chat_id].leave_group_call(reason))
-        t.add_done_callback(lambda _: self._run_bg(JSC.clear(self.calls[chat_id].sid))) # EWWW!
-        self.calls.pop(chat_id)
+    def change_stream(self, chat_id:int, source: Source, live: bool = False) -> asyncio.Task:
+        return self._run_bg(self.calls[chat_id].change_stream(source, live))
+
+    def seek(self, chat_id:int, seconds:float) -> asyncio.Task:
+        return self._run_bg(self.calls[chat_id].seek(seconds))
+
+    def position(self, chat_id:int) -> float:
+        return self.calls[chat_id].position
+
+    def enqueue(self, chat_id:int, source: Source, live: bool = False) -> asyncio.Task:
+        return self._run_bg(self.calls[chat_id].enqueue(source, live))
+
+    def skip(self, chat_id:int) -> asyncio.Task:
+        return self._run_bg(self.calls[chat_id].skip())
+
+    def clear_queue(self, chat_id:int) -> asyncio.Task:
+        return self._run_bg(self.calls[chat_id].clear_queue())
+
+    def queued(self, chat_id:int) -> List[Source]:
+        return self.calls[chat_id].queued
+
+    def finish_input(self, chat_id:int) -> asyncio.Task:
+        return self._run_bg(self.calls[chat_id].finish_input())
+
+    def leave_group_call(self, chat_id:int, reason:str = 'committed sudoku') -> asyncio.Task:
+        return self._run_bg(self.calls.pop(chat_id).leave_group_call(reason))
 
     def join_group_call(
             self,
             chat_id: int,
-            file_path: str,
+            source: Union[Source, Broadcast],
             bitrate: int = 48000,
             invite_hash: Optional[str] = None,
             join_as: Optional[InputPeer] = None,
-    ) -> None:
-        self.calls[chat_id] = GroupCall(self.client, chat_id)
-        self._run_bg(self.calls[chat_id].join_group_call(file_path, bitrate, invite_hash, join_as))
\ No newline at end of file
+            live: bool = False,
+    ) -> asyncio.Task:
+        call = self.calls[chat_id] = GroupCall(self.client, chat_id, self.pcm_cache)
+        return self._run_bg(self._forget_on_failure(chat_id, call, call.join_group_call(source, bitrate, invite_hash, join_as, live)))
+
+    async def _forget_on_failure(self, chat_id:int, call:GroupCall, join:Awaitable) -> None:
+        try:
+            await join
+        except BaseException: # unless joined again meanwhile
+            if self.calls.get(chat_id) is call:
+                del self.calls[chat_id]
+            raise
@@ -0,0 +1,63 @@
+import time
+import asyncio
+import weakref
+
+from collections import deque
+from typing import Callable, Deque, List, Tuple
+
+from pyrogram import Client
+
+class RateLimiter:
+    """Token bucket: up to burst requests right away, then rate requests per second.
+    One is shared by every call of a client, for requests the server rate limits per account.
+    It also holds the client's FLOOD_WAITs: requests wait for them to pass, and listeners hear of them"""
+    _instances : 'weakref.WeakKeyDictionary[Client, RateLimiter]' = weakref.WeakKeyDictionary()
+
+    def __init__(self, rate:float = 1.0, burst:int = 3):
+        self.rate : float = rate
+        self.burst : int = burst
+        self.tokens : float = burst
+        self.updated : float = time.monotonic()
+        self.waited : float = 0.0 # total seconds callers were held back
+        self.floods : Deque[Tuple[float, float]] = deque(maxlen=64) # monotonic time and seconds of recent ones
+        self.blocked_until : float = 0.0
+        self.flood_listeners : List[Callable[[float], None]] = []
+
+    @classmethod
+    def for_client(cls, client:Client) -> 'RateLimiter':
+        if client not in cls._instances:
+            cls._instances[client] = cls()
+        return cls._instances[client]
+
+    def flood(self, seconds:float) -> None:
+        """The server answered FLOOD_WAIT: hold every request back for seconds"""
+        now = time.monotonic()
+        self.floods.append((now, seconds))
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        for listener in self.flood_listeners:
+            listener(seconds)
+
+    def flooded(self) -> float:
+        """Seconds left of the current FLOOD_WAIT, 0 when there's none"""
+        return max(0.0, self.blocked_until - time.monotonic())
+
+    def recent_floods(self, window:float) -> int:
+        """FLOOD_WAITs in the last window seconds"""
+        since = time.monotonic() - window
+        return sum(1 for at, _ in self.floods if at >= since)
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            if self.blocked_until > now:
+                self.waited += self.blocked_until - now
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            wait = (1 - self.tokens) / self.rate
+            self.waited += wait
+            await asyncio.sleep(wait)
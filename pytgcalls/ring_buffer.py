@@ -0,0 +1,87 @@
+import os
+import mmap
+import asyncio
+import tempfile
+
+from typing import Awaitable, Callable, Optional
+
+SHM_DIR = '/dev/shm'
+
+class RingClosed(Exception):
+    pass
+
+class PcmRingBuffer:
+    """Single producer, single consumer ring of raw PCM bytes, memory mapped from a file shared with NodeJS.
+    Only the read and write cursors travel over the pipe, as small control packets.
+    Writers block while the ring is full. Cursors count every byte ever written/read, positions wrap around capacity.
+    Default capacity holds 4 seconds of 48kHz 16 bit mono audio."""
+    def __init__(self, capacity:int = 48000 * 2 * 4, directory:Optional[str] = None):
+        if directory is None:
+            directory = SHM_DIR if os.path.isdir(SHM_DIR) else tempfile.gettempdir()
+        self.capacity : int = capacity
+        fd, self.path = tempfile.mkstemp(prefix='pytgcalls-', suffix='.pcm', dir=directory)
+        try:
+            os.ftruncate(fd, capacity)
+            self.mmap = mmap.mmap(fd, capacity)
+        finally:
+            os.close(fd)
+        self.write_cursor : int = 0
+        self.read_cursor : int = 0
+        self.eof : bool = False
+        self.underruns : int = 0
+        self._notify : Optional[Callable[[int, bool], Awaitable]] = None
+        self._space : Optional[asyncio.Event] = None
+
+    @property
+    def free(self) -> int:
+        return self.capacity - (self.write_cursor - self.read_cursor)
+
+    @property
+    def buffered(self) -> int:
+        return self.write_cursor - self.read_cursor
+
+    def attach(self, notify:Callable[[int, bool], Awaitable]) -> Awaitable:
+        """Start publishing cursor updates to the consumer, returns the first update"""
+        self._notify = notify
+        return notify(self.write_cursor, self.eof)
+
+    def consumed(self, cursor:int) -> None:
+        """Consumer advanced its read cursor"""
+        self.read_cursor = max(self.read_cursor, cursor)
+        if self._space:
+            self._space.set()
+
+    async def write(self, data:bytes) -> None:
+        """Copy data into the ring, waiting for the consumer whenever it's full"""
+        if self.eof:
+            raise RingClosed("Cannot write after close()")
+        view = memoryview(data)
+        while view:
+            while self.free <= 0:
+                if not self._space:
+                    self._space = asyncio.Event()
+                self._space.clear()
+                await self._space.wait()
+            n = min(self.free, len(view))
+            pos = self.write_cursor % self.capacity
+            head = min(n, self.capacity - pos)
+            self.mmap[pos:pos + head] = view[:head]
+            if head < n: # wrap around
+                self.mmap[0:n - head] = view[head:n]
+            self.write_cursor += n
+            view = view[n:]
+            if self._notify:
+                await self._notify(self.write_cursor, False)
+
+    async def close(self) -> None:
+        """Signal end of stream: the consumer will finish once it drained the ring"""
+        self.eof = True
+        if self._notify:
+            await self._notify(self.write_cursor, True)
+
+    def unlink(self) -> None:
+        self.mmap.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
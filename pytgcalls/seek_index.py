@@ -0,0 +1,117 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import tempfile
+
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from .helpers import DependancyException
+from .decoder import DecoderError
+
+logger = logging.getLogger(__name__)
+
+# no header, any packet can be decoded on its own: ffmpeg can start reading at a packet's byte offset.
+# Containers have an index of their own, ffmpeg -ss already uses it
+ELEMENTARY = ('.mp3', '.mp2', '.aac', '.adts', '.ac3', '.eac3')
+
+class SeekIndex:
+    """Byte offset of audio packets by time, thinned out to one packet per resolution seconds"""
+    def __init__(self, times:List[float], offsets:List[int]):
+        self.times : List[float] = times
+        self.offsets : List[int] = offsets
+
+    def lookup(self, seconds:float) -> Tuple[float, int]:
+        """Time and byte offset of the last indexed packet starting at or before seconds"""
+        i = bisect_right(self.times, seconds) - 1
+        if i < 0:
+            return 0.0, 0
+        return self.times[i], self.offsets[i]
+
+class SeekIndexCache:
+    """Seek indexes of compressed files, built once with ffprobe and kept on disk next to the file's
+    identity (path, size and mtime), so a file is only ever read through once to index it"""
+    def __init__(self, directory:Optional[str] = None, ffprobe:str = 'ffprobe', resolution:float = 1.0):
+        self.directory : str = directory or os.path.join(tempfile.gettempdir(), 'pytgcalls-seek')
+        self.ffprobe : str = ffprobe
+        self.resolution : float = resolution
+        self._indexes : Dict[str, SeekIndex] = {}
+        self._building : Dict[str, asyncio.Future] = {}
+
+    def _key(self, source:str) -> str:
+        st = os.stat(source)
+        return hashlib.sha256(f'{os.path.abspath(source)}:{st.st_size}:{st.st_mtime_ns}'.encode()).hexdigest()
+
+    async def get(self, source:str) -> Optional[SeekIndex]:
+        """Index of a local elementary stream, None for anything ffmpeg seeks in on its own"""
+        if '://' in source or os.path.splitext(source)[1].lower() not in ELEMENTARY:
+            return None
+        key = self._key(source)
+        if key in self._indexes:
+            return self._indexes[key]
+        if key in self._building: # same file indexed concurrently, share it
+            return await asyncio.shield(self._building[key])
+        self._building[key] = asyncio.get_event_loop().create_future()
+        try:
+            index = self._load(key) or await self._build(source)
+            self._store(key, index)
+            self._indexes[key] = index
+            self._building[key].set_result(index)
+            return index
+        except Exception as e:
+            self._building[key].set_exception(e)
+            self._building[key].exception() # retrieved, nobody may be waiting
+            raise
+        finally:
+            del self._building[key]
+
+    def _path(self, key:str) -> str:
+        return os.path.join(self.directory, key + '.json')
+
+    def _load(self, key:str) -> Optional[SeekIndex]:
+        try:
+            with open(self._path(key)) as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        return SeekIndex(data['times'], data['offsets'])
+
+    def _store(self, key:str, index:SeekIndex) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        part = f'{self._path(key)}.{os.getpid()}.part'
+        with open(part, 'w') as f:
+            json.dump({'times': index.times, 'offsets': index.offsets}, f)
+        os.replace(part, self._path(key))
+
+    async def _build(self, source:str) -> SeekIndex:
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                self.ffprobe, '-v', 'error', '-select_streams', 'a:0',
+                '-show_entries', 'packet=pts_time,pos', '-of', 'csv=p=0', source,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            )
+        except FileNotFoundError:
+            raise DependancyException(f"Dependancy '{self.ffprobe}' is required to seek in compressed audio")
+        times : List[float] = []
+        offsets : List[int] = []
+        assert proc.stdout is not None and proc.stderr is not None # both piped
+        stderr = asyncio.get_event_loop().create_task(proc.stderr.read())
+        async for line in proc.stdout:
+            try:
+                pts_field, pos_field = line.decode().strip().split(',')[:2]
+                pts, pos = float(pts_field), int(pos_field)
+            except ValueError: # N/A fields
+                continue
+            if not times or pts >= times[-1] + self.resolution:
+                times.append(pts)
+                offsets.append(pos)
+        code = await proc.wait()
+        log = await stderr
+        if code != 0:
+            raise DecoderError(f"ffprobe exited with {code} indexing '{source}' : {log.decode(errors='replace').strip()[-500:]}")
+        logger.debug("Indexed '%s' : %d entries", source, len(times))
+        return SeekIndex(times, offsets)
+
+SEEK_INDEX = SeekIndexCache()
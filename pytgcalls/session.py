@@ -0,0 +1,446 @@
+import os
+import abc
+import asyncio
+import logging
+from uuid import uuid4
+
+from typing import Any, AsyncIterable, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from .js_core import INSTANCE as JSC
+from .node_worker import InvalidState, CoreDied
+
+from .ring_buffer import PcmRingBuffer
+from .decoder import DECODERS, PLAYING, PREFETCH, needs_decoding
+from .pcm_cache import PcmCache
+from .seek_index import SEEK_INDEX
+
+logger = logging.getLogger(__name__)
+
+# a raw PCM file path, a compressed file path or url (decoded by ffmpeg), a ring to write PCM into,
+# or an async iterable of PCM chunks.
+# Pass live=True along a file path that is still being written, then call finish_input() once it's complete
+Source = Union[str, PcmRingBuffer, AsyncIterable[bytes]]
+
+class Track:
+    """One source as handed to NodeJS, with the ring it's read from and what feeds that ring.
+    Files still being decoded into the cache come with a future resolved once they are complete"""
+    def __init__(self, packet:dict, ring:Optional[PcmRingBuffer] = None, feed:Optional[AsyncIterable[bytes]] = None, complete:Optional[asyncio.Future] = None):
+        self.id : str = str(uuid4())
+        self.source : Optional[Source] = None # as given by the user
+        self.packet : dict = packet
+        self.ring : Optional[PcmRingBuffer] = ring
+        self.feed : Optional[AsyncIterable[bytes]] = feed # we created the ring when there's a feed
+        self.complete : Optional[asyncio.Future] = complete
+        self.feeder : Optional[asyncio.Task] = None
+
+    @property
+    def file_path(self) -> Optional[str]:
+        return self.packet.get('file_path')
+
+    @property
+    def live(self) -> bool:
+        return self.packet.get('live', False)
+
+    @property
+    def path(self) -> Optional[str]:
+        """What NodeJS knows this track's input by, for cursor updates and finish_input"""
+        return self.ring.path if self.ring else self.file_path
+
+    @property
+    def growing(self) -> bool:
+        """A live file not complete yet. A cache file completed since it was handed over is not live anymore"""
+        return self.live and not (self.complete and self.complete.done())
+
+    def discard(self) -> None:
+        """NodeJS never got it, only clean up what we created"""
+        if self.feed is not None and self.ring is not None: # always together
+            self.ring.unlink()
+
+    def release(self) -> None:
+        if self.feeder:
+            self.feeder.cancel()
+            self.feeder = None
+        if self.ring:
+            self.ring.unlink()
+
+class Session(abc.ABC):
+    """Anything playing a source inside NodeJS: where its audio comes from and how it's fed.
+    Queued sources play right after the current one with no gap: only the next one is prepared
+    (decoded at prefetch priority) and handed to NodeJS ahead of time, the rest wait here.
+    What's kept here is enough to replay the session into a restarted NodeJS if its core crashes:
+    the tracks, the position, whether it's paused and its local volume. A 'reconnect' event tells how it went"""
+    _recover_priority : int = 1 # replayed after sessions of a lower priority, see NodeWorker.on_recover
+    def __init__(self, cache:Optional[PcmCache] = None):
+        self.cache : Optional[PcmCache] = cache # decoded PCM shared between sessions, decoded straight into a ring without it
+        self.chat_id : int = 0
+        self.bitrate : int = 48000
+        self.track : Optional[Track] = None # playing
+        self.upcoming : Optional[Track] = None # already in NodeJS, plays when the current track ends
+        self.queue : List[Tuple[Source, bool]] = [] # after upcoming, prepared once they're next
+        self._queue_lock : asyncio.Lock = asyncio.Lock()
+        self._position : Tuple[float, bool, float] = (0.0, False, 0.0) # seconds, moving, loop time, like JSC.position
+        self.paused : bool = False
+        self.local_volume : float = 1.0
+        self._replaying : bool = False
+        self.sid : str = str(uuid4())
+
+    @property
+    def ring(self) -> Optional[PcmRingBuffer]:
+        return self.track.ring if self.track else None
+
+    @property
+    def file_path(self) -> Optional[str]:
+        return self.track.file_path if self.track else None
+
+    @property
+    def live(self) -> bool:
+        return self.track.live if self.track else False
+
+    @property
+    def queued(self) -> List[Source]:
+        """Sources waiting to play, in order"""
+        upcoming = [self.upcoming.source] if self.upcoming and self.upcoming.source is not None else []
+        return upcoming + [ source for source, _ in self.queue ]
+
+    @property
+    def position(self) -> float:
+        """Seconds into the current track, extrapolated from the latest of what NodeJS reports every second
+        and our own last seek or track change: no round trip"""
+        seconds, playing, at = self._position
+        report = JSC.position(self.sid)
+        if report and report[2] > at:
+            seconds, playing, at = report
+        if playing:
+            seconds += asyncio.get_event_loop().time() - at
+        return seconds
+
+    def _set_position(self, seconds:float, playing:bool = True) -> None:
+        self._position = (seconds, playing, asyncio.get_event_loop().time())
+
+    @property
+    def state(self) -> Optional[str]:
+        return JSC.state(self.sid)
+
+    def on(self, event:str) -> Callable:
+        return JSC.on(self.sid, event)
+
+    async def _stream_action(self, action:str, extra:Optional[dict] = None, replay:bool = False) -> dict:
+        return await JSC.send(self.sid, { # merge the 2 dictionaries, in py 3.9+ extra | {'action':...}
+            **( extra or {} ),
+            **{
+                'action': action,
+                'chat_id': self.chat_id,
+            }
+        }, replay=replay)
+
+    def _listen(self) -> None:
+        self.on('ring_read')(self._on_ring_read)
+        self.on('underrun')(self._on_underrun)
+        self.on('track_changed')(self._on_track_changed)
+        JSC.on_recover(self.sid, self._recover_priority)(self._recover)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Audio health, as NodeJS reports it every second at no cost: buffer_ms buffered ahead of playback,
+        counters of frames_sent, late_frames (sent after their due time), underruns and starved_frames
+        (frames missing during underruns), since_last_frame_ms, join_ms, report_age_ms since that report,
+        and ipc_rtt, a histogram of command round trips. Empty until the first report"""
+        return JSC.metrics(self.sid)
+
+    async def stats(self) -> Dict[str, int]:
+        """Bytes allocated for this session's audio cache in NodeJS (cache_bytes) and how many are filled (cache_fill)"""
+        res = await self._stream_action('stats')
+        return {k: res[k] for k in ('cache_bytes', 'cache_fill') if k in res}
+
+    async def pause_stream(self) -> None:
+        await self._stream_action('pause')
+        self.paused = True
+        self._set_position(self.position, False)
+
+    async def resume_stream(self) -> None:
+        await self._stream_action('resume')
+        self.paused = False
+        self._set_position(self.position, True)
+
+    async def set_local_volume(self, volume:float, ramp:float = 0.05) -> None:
+        """Scale the audio right before it's sent, 1.0 leaves it untouched. Changes ramp over ramp seconds so they
+        don't click, and cost no request to Telegram. On a call playing a broadcast only that call is affected,
+        on the broadcast itself every call playing it is"""
+        await self._stream_action('volume', {'volume': volume, 'ramp_ms': int(ramp * 1000)})
+        self.local_volume = volume
+
+    async def _prepare_source(self, source:Source, live:bool = False, priority:int = PLAYING, start:float = 0.0) -> Track:
+        track = await self._describe_source(source, live, priority, start)
+        track.source = source
+        return track
+
+    async def _describe_source(self, source:Source, live:bool, priority:int, start:float) -> Track:
+        """Describe source to NodeJS. Async iterables get a ring of their own, to be fed in background"""
+        if isinstance(source, str) and needs_decoding(source):
+            if live:
+                raise ValueError("Only raw PCM files can be live")
+            if '://' not in source and not os.path.isfile(source):
+                raise ValueError("Invalid file provided")
+            if self.cache:
+                path, complete = await self.cache.open(source, self.bitrate, 1, priority)
+                if complete.done():
+                    return Track({'file_path': path, 'live': False})
+                return Track({'file_path': path, 'live': True}, complete=complete) # follow it as it grows
+            # decoded straight into a ring, nothing touches the disk
+            skip_bytes = 0
+            if start:
+                index = await SEEK_INDEX.get(source)
+                if index:
+                    indexed, skip_bytes = index.lookup(start)
+                    start -= indexed
+            source = DECODERS.decode(source, self.bitrate, priority, start=start, skip_bytes=skip_bytes)
+        if isinstance(source, str):
+            if not os.path.isfile(source):
+                raise ValueError("Invalid file provided")
+            return Track({'file_path': source, 'live': live})
+        if live:
+            raise ValueError("Only file paths can be live, rings end with finish_input()")
+        if isinstance(source, PcmRingBuffer):
+            ring, feed = source, None
+        elif hasattr(source, '__aiter__'):
+            ring, feed = PcmRingBuffer(), source
+        else:
+            raise TypeError(f"Unsupported source type {type(source).__name__}")
+        return Track({'ring': {'path': ring.path, 'capacity': ring.capacity}}, ring, feed)
+
+    async def _start(self, track:Track) -> None:
+        """NodeJS has the track, start feeding its ring and end it once its cache file is complete"""
+        if track.complete is not None:
+            asyncio.get_event_loop().create_task(self._finish_when(track, track.complete))
+        ring = track.ring
+        if ring is None:
+            return
+        if track.feed is not None:
+            track.feeder = asyncio.get_event_loop().create_task(self._feed(ring, track.feed))
+        await ring.attach(lambda cursor, eof: self._ring_write(ring.path, cursor, eof))
+
+    async def _finish_when(self, track:Track, complete:asyncio.Future) -> None:
+        try:
+            await complete
+        except Exception: # decode failed, logged by the cache: what was decoded plays, then the track ends
+            pass
+        if track is self.track or track is self.upcoming: # unless it was dropped meanwhile
+            await self._stream_action('finish_input', {'path': track.path})
+
+    async def _swap_source(self, track:Track, start:float = 0.0) -> None:
+        """Once NodeJS switched source, release the previous track and start the new one"""
+        if self.track:
+            self.track.release()
+        self.track = track
+        self._set_position(start)
+        await self._start(track)
+
+    def _drop_tracks(self) -> None:
+        self.queue.clear()
+        for track in (self.track, self.upcoming):
+            if track:
+                track.release()
+        self.track = self.upcoming = None
+
+    async def _feed(self, ring:PcmRingBuffer, source:AsyncIterable[bytes]) -> None:
+        try:
+            async for chunk in source:
+                await ring.write(chunk)
+        finally:
+            if hasattr(source, 'aclose'): # a decoder holds a pool slot until closed
+                await source.aclose()
+            if not ring.eof:
+                await ring.close()
+
+    async def _ring_write(self, path:str, cursor:int, eof:bool) -> None:
+        if JSC.recovering(self.sid) and not self._replaying:
+            return # the replay hands the ring over with its latest cursor
+        try:
+            await self._stream_action('ring_write', {'path': path, 'cursor': cursor, 'eof': eof}, self._replaying)
+        except CoreDied: # same, the feeder must go on
+            pass
+
+    async def _on_ring_read(self, packet:dict) -> None:
+        for track in (self.track, self.upcoming):
+            if track and track.ring and packet.get('path') == track.ring.path:
+                track.ring.consumed(packet['cursor'])
+
+    async def _on_underrun(self, packet:dict) -> None:
+        if self.ring:
+            self.ring.underruns += 1
+
+    async def _on_track_changed(self, packet:dict) -> None:
+        if not self.upcoming or packet.get('track') != self.upcoming.id:
+            return # the echo of change_stream, that track is already current
+        if self.track:
+            self.track.release()
+        self.track, self.upcoming = self.upcoming, None
+        self._set_position(0.0)
+        # preparing the next one may wait for a decoder, later events of this session must not
+        asyncio.get_event_loop().create_task(self._prefetch_next())
+
+    async def _prefetch_next(self) -> None:
+        """_send_next with nobody to raise to: queued sources that can't be played are logged and skipped"""
+        while self.queue:
+            try:
+                return await self._send_next()
+            except Exception:
+                logger.exception("Could not queue the next source of session '%s', skipping it", self.sid)
+
+    @abc.abstractmethod
+    async def _replay(self, packet:dict) -> None:
+        """Start this session again in a restarted NodeJS, playing packet"""
+
+    async def _resume_track(self, track:Track, seconds:float) -> Tuple[Track, dict]:
+        """What a restarted NodeJS needs to go on with track from seconds in. Files are opened again at the
+        matching offset, decoders start again from there (a new track) and other rings go on from where the
+        dead core had read them: what it had buffered and not played yet is lost"""
+        if track.file_path:
+            return track, {**track.packet, 'live': track.growing, 'offset': self._byte_offset(seconds), 'start': seconds}
+        if track.ring and isinstance(track.source, str):
+            priority = PLAYING if track is self.track else PREFETCH
+            resumed = await self._prepare_source(track.source, priority=priority, start=seconds)
+            return resumed, {**resumed.packet, 'start': seconds}
+        if track.ring:
+            return track, {**track.packet, 'offset': track.ring.read_cursor, 'start': seconds}
+        return track, track.packet # a broadcast
+
+    async def _replay_track(self, track:Track, seconds:float, send:Callable[[Track, dict], Awaitable]) -> Track:
+        resumed, packet = await self._resume_track(track, seconds)
+        try:
+            await send(resumed, packet)
+        except Exception:
+            if resumed is not track:
+                resumed.discard()
+            raise
+        if resumed is not track:
+            track.release()
+            await self._start(resumed)
+        elif track.ring:
+            await self._ring_write(track.ring.path, track.ring.write_cursor, track.ring.eof)
+        return resumed
+
+    async def _recover(self) -> None:
+        """Replay this session into its restarted NodeJS from its last known state"""
+        if not self.track:
+            raise InvalidState("Nothing was playing yet")
+        seconds = self.position
+        crashed_at = JSC.worker(self.sid).crashed_at
+        if not self.paused and crashed_at is not None: # nothing was played since the crash
+            seconds = max(0.0, seconds - (asyncio.get_event_loop().time() - crashed_at))
+        self._replaying = True
+        try:
+            self.track = await self._replay_track(self.track, seconds, lambda _, packet: self._replay(packet))
+            if self.upcoming:
+                self.upcoming = await self._replay_track(self.upcoming, 0.0, lambda track, packet:
+                    self._stream_action('enqueue', {**packet, 'track': track.id}, replay=True))
+            if self.paused:
+                await self._stream_action('pause', replay=True)
+            if self.local_volume != 1.0:
+                await self._stream_action('volume', {'volume': self.local_volume, 'ramp_ms': 0}, replay=True)
+        finally:
+            self._replaying = False
+        self._set_position(seconds, not self.paused)
+
+    def _byte_offset(self, seconds:float) -> int:
+        """Offset of the whole 10ms frame at seconds into raw PCM"""
+        return round(seconds * 100) * (self.bitrate * 2 // 100)
+
+    def _check_own_stream(self) -> None:
+        """Raise when this session plays something it doesn't control"""
+
+    async def finish_input(self) -> None:
+        """Signal that the current input is complete: a live file was fully written, or nothing more
+        will be written into the ring. Playback ends as soon as what's left is played.
+        Async iterables don't need this, their ring is closed once they are exhausted"""
+        track = self.track
+        if not track:
+            return
+        if track.ring:
+            if not track.feeder and not track.ring.eof:
+                await track.ring.close()
+        elif track.live:
+            await self._stream_action('finish_input', {'path': track.path})
+
+    async def change_stream(self, source:Source, live:bool = False):
+        """Replace the current source, the queue is kept and plays after it"""
+        self._check_own_stream()
+        track = await self._prepare_source(source, live)
+        try:
+            await self._stream_action('change_stream', {**track.packet, 'track': track.id})
+        except Exception:
+            track.discard()
+            raise
+        await self._swap_source(track)
+
+    async def seek(self, seconds:float) -> None:
+        """Jump to seconds into the current track. Raw PCM and cached files are read from the matching byte
+        offset on, compressed files are decoded again from there: elementary streams (mp3, aac...) from the
+        offset found in their seek index, other formats through their container's own index.
+        Rings and async iterables can't seek"""
+        self._check_own_stream()
+        track = self.track
+        if not track or not isinstance(track.source, str):
+            raise InvalidState("Only files and urls can seek")
+        seconds = max(0.0, round(seconds, 2)) # whole 10ms frames
+        if track.file_path:
+            # same track, a new reader at a frame aligned offset
+            await self._stream_action('change_stream', {
+                **track.packet,
+                'live': track.growing,
+                'offset': self._byte_offset(seconds),
+                'start': seconds,
+                'track': track.id,
+            })
+            self._set_position(seconds)
+            return
+        seeked = await self._prepare_source(track.source, priority=PLAYING, start=seconds)
+        try:
+            await self._stream_action('change_stream', {**seeked.packet, 'start': seconds, 'track': seeked.id})
+        except Exception:
+            seeked.discard()
+            raise
+        await self._swap_source(seeked, seconds)
+
+    async def enqueue(self, source:Source, live:bool = False) -> None:
+        """Play source right after the current one and everything queued before it, without any gap.
+        Starts right away when nothing is playing. A queued live file or ring is ended by whoever writes
+        it (PcmRingBuffer.close() for a ring of your own), finish_input() only applies to the current one"""
+        self._check_own_stream()
+        if not isinstance(source, str) and live:
+            raise ValueError("Only file paths can be live, rings end with finish_input()")
+        self.queue.append((source, live))
+        await self._send_next()
+
+    async def _send_next(self) -> None:
+        """Hand the head of the queue to NodeJS, so it can read it ahead of the end of the current track"""
+        async with self._queue_lock:
+            if self.upcoming or not self.queue:
+                return
+            source, live = self.queue.pop(0)
+            track = await self._prepare_source(source, live, PREFETCH)
+            # NodeJS starts it right away if nothing is playing, telling us before it acks
+            self.upcoming = track
+            try:
+                await self._stream_action('enqueue', {**track.packet, 'track': track.id})
+            except Exception:
+                if self.upcoming is track:
+                    self.upcoming = None
+                track.discard()
+                raise
+            await self._start(track)
+
+    async def skip(self) -> bool:
+        """Jump to the next queued source right away, False when there's none"""
+        self._check_own_stream()
+        res = await self._stream_action('skip')
+        return res['result'] == 'SKIPPED'
+
+    async def clear_queue(self) -> None:
+        """Forget every queued source, the current one plays to its end"""
+        self._check_own_stream()
+        async with self._queue_lock:
+            self.queue.clear()
+            await self._stream_action('queue_clear')
+            if self.upcoming:
+                self.upcoming.release()
+                self.upcoming = None
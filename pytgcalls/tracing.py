@@ -0,0 +1,73 @@
+import time
+
+from typing import Any, Dict, Optional
+
+from .callback_executor import LatencyHistogram
+
+class Tracer:
+    """Span hooks, called around IPC commands ('ipc', from send to ack), routed updates ('dispatch'),
+    peer cache warm up ('build_cache'), joins ('join') and their MTProto request ('join_rpc').
+    start returns a token handed back to end, with the exception the span ended with if any.
+    Both run inline on the event loop, keep them cheap: sample by returning None from start and
+    ignoring None tokens. Nothing is traced through sys.settrace or sys.setprofile, so sampling
+    profilers keep working alongside"""
+    def start(self, name:str, attrs:Dict[str, Any]) -> Any:
+        return None
+
+    def end(self, token:Any, error:Optional[BaseException]) -> None:
+        pass
+
+class SpanStats(Tracer):
+    """Latency histogram of every span name, cheap enough to leave on in production"""
+    def __init__(self):
+        self.spans : Dict[str, LatencyHistogram] = {}
+        self.errors : Dict[str, int] = {}
+
+    def start(self, name:str, attrs:Dict[str, Any]) -> Any:
+        return name, time.perf_counter()
+
+    def end(self, token:Any, error:Optional[BaseException]) -> None:
+        name, start = token
+        if name not in self.spans:
+            self.spans[name] = LatencyHistogram()
+        self.spans[name].observe(time.perf_counter() - start)
+        if error is not None:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        return { name: {**h.to_dict(), 'errors': self.errors.get(name, 0)} for name, h in self.spans.items() }
+
+# None while tracing is disabled: hot paths check it before building any span attribute
+TRACER : Optional[Tracer] = None
+
+def set_tracer(tracer:Optional[Tracer]) -> None:
+    """Install tracer, None disables tracing"""
+    global TRACER
+    TRACER = tracer
+
+class _Span:
+    def __init__(self, tracer:Tracer, name:str, attrs:Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self) -> '_Span':
+        self.token = self.tracer.start(self.name, self.attrs)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.tracer.end(self.token, exc)
+
+class _NoSpan:
+    def __enter__(self) -> '_NoSpan':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+NO_SPAN = _NoSpan()
+
+def span(name:str, **attrs:Any):
+    """Context manager tracing a block, for paths that aren't hot: the same no-op object when disabled"""
+    tracer = TRACER
+    return _Span(tracer, name, attrs) if tracer is not None else NO_SPAN
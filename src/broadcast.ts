@@ -0,0 +1,188 @@
+import { EventEmitter } from 'events';
+import { RTCAudioData, RTCAudioSource } from 'wrtc';
+import { Stream } from './stream';
+import { Gain } from './gain';
+import { FrameCounters } from './metrics';
+import type { Source } from './rtc-connection';
+
+// One subscriber of a broadcast: the audio source of its own peer connection,
+// with its own pause and volume. Pausing drops frames, the broadcast goes on.
+export class Subscription extends EventEmitter {
+    public paused: boolean = false;
+    public stopped: boolean = false;
+    private readonly gain = new Gain();
+    private readonly counters = new FrameCounters();
+    private frame?: RTCAudioData;
+
+    constructor(
+        readonly broadcast: Broadcast,
+        readonly audioSource: RTCAudioSource
+    ) {
+        super();
+    }
+
+    // Nothing is buffered per subscriber
+    get cacheBytes() {
+        return 0;
+    }
+
+    get cacheFill() {
+        return 0;
+    }
+
+    get position() {
+        return this.broadcast.stream.position;
+    }
+
+    get playing() {
+        return !this.paused && this.broadcast.stream.playing;
+    }
+
+    // Frames this subscriber sent, buffering and underruns of the broadcast
+    metrics() {
+        const stream = this.broadcast.stream;
+        return {
+            ...this.counters.report(stream.bufferMs),
+            underruns: stream.counters.underruns,
+            starved_frames: stream.counters.starvedFrames,
+        };
+    }
+
+    setVolume(volume: number, rampMs: number = 50) {
+        const stream = this.broadcast.stream;
+        this.gain.set(
+            volume,
+            (rampMs * stream.sampleRate * stream.channelCount) / 1000
+        );
+    }
+
+    pause() {
+        if (this.stopped) {
+            throw new Error('Cannot pause when stopped');
+        }
+        this.paused = true;
+        this.emit('pause', this.paused);
+    }
+
+    resume() {
+        if (this.stopped) {
+            throw new Error('Cannot resume when stopped');
+        }
+        this.paused = false;
+        this.emit('resume', this.paused);
+    }
+
+    stop() {
+        this.stopped = true;
+        this.broadcast.unsubscribe(this);
+        this.emit('finish');
+    }
+
+    push(data: RTCAudioData) {
+        if (this.paused) {
+            return;
+        }
+        this.counters.sent(this.broadcast.stream.late);
+        const samples = this.gain.apply(data.samples);
+        if (samples === data.samples) {
+            this.audioSource.onData(data);
+            return;
+        }
+        // the gain reuses its buffer, so does the frame wrapping it
+        if (this.frame === undefined || this.frame.samples !== samples) {
+            this.frame = { ...data, samples };
+        }
+        this.audioSource.onData(this.frame);
+    }
+}
+
+// Reads, buffers and paces a source once, then hands every frame to all of
+// its subscribers. Stands in for the RTCAudioSource of its Stream, so the
+// per-subscriber cost is one onData call per frame.
+export class Broadcast extends EventEmitter implements RTCAudioSource {
+    readonly stream: Stream;
+    file_path: string = '';
+    private subscribers = new Set<Subscription>();
+
+    constructor(
+        readonly sid: string,
+        source: Source,
+        bitrate: number,
+        logMode: number,
+        buffer_lenght: number
+    ) {
+        super();
+        this.setSource(source);
+        this.stream = new Stream(
+            source,
+            16,
+            bitrate,
+            1,
+            logMode,
+            buffer_lenght,
+            undefined,
+            this
+        );
+        this.stream.on('finish', () => {
+            if (this.stream.stopped) {
+                return;
+            }
+            this.subscribers.forEach((sub) => sub.emit('finish'));
+            this.emit('finish');
+        });
+        this.stream.on('track_changed', (track: string) =>
+            this.emit('track_changed', track)
+        );
+        this.stream.on('underrun', () => {
+            this.subscribers.forEach((sub) => sub.emit('underrun'));
+            this.emit('underrun');
+        });
+    }
+
+    get subscriberCount() {
+        return this.subscribers.size;
+    }
+
+    createTrack(): never {
+        throw new Error('A broadcast has no track, subscribe a peer connection');
+    }
+
+    onData(data: RTCAudioData) {
+        this.subscribers.forEach((sub) => sub.push(data));
+    }
+
+    subscribe(audioSource: RTCAudioSource) {
+        const subscription = new Subscription(this, audioSource);
+        this.subscribers.add(subscription);
+        return subscription;
+    }
+
+    unsubscribe(subscription: Subscription) {
+        this.subscribers.delete(subscription);
+    }
+
+    private setSource(source: Source) {
+        this.file_path =
+            typeof source === 'string' ? source : source.path.toString();
+    }
+
+    pause() {
+        this.stream.pause();
+    }
+
+    resume() {
+        this.stream.resume();
+    }
+
+    changeStream(source: Source, track: string = '', start: number = 0) {
+        this.setSource(source);
+        this.stream.setReadable(source, track, start);
+    }
+
+    // Subscribers are left without audio, they are told the stream ended
+    stop() {
+        this.stream.stop();
+        this.subscribers.forEach((sub) => sub.emit('finish'));
+        this.subscribers.clear();
+    }
+}
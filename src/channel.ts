@@ -0,0 +1,187 @@
+import { EventEmitter } from 'events';
+import { Readable, Writable } from 'stream';
+import { encode, decode } from '@msgpack/msgpack';
+
+export type Codec = 'json' | 'msgpack';
+
+export interface Packet {
+    [key: string]: any;
+}
+
+interface PendingRequest {
+    resolve: (data: any) => void;
+    reject: (error: Error) => void;
+}
+
+// Multiplexed stdio channel towards the Python side. Inbound commands are
+// emitted as 'packet' events, outbound packets sent during the same tick
+// are coalesced into a single write. Requests towards Python are
+// correlated with their response by pid.
+export class Channel extends EventEmitter {
+    private pending: Buffer = Buffer.alloc(0);
+    private outbox: Buffer[] = [];
+    private flushScheduled = false;
+    private packetCount = 0;
+    private requests = new Map<number, PendingRequest>();
+
+    constructor(
+        readonly codec: Codec = 'json',
+        private readonly input: Readable = process.stdin,
+        private readonly output: Writable = process.stdout
+    ) {
+        super();
+    }
+
+    static codecFromArgv(argv: string[] = process.argv): Codec {
+        for (const arg of argv) {
+            if (arg.startsWith('--codec=')) {
+                const codec = arg.split('=')[1];
+                if (codec === 'json' || codec === 'msgpack') {
+                    return codec;
+                }
+                throw new Error('Unknown wire format: ' + codec);
+            }
+        }
+        return 'json';
+    }
+
+    start() {
+        this.input.on('data', (chunk: Buffer) => this.receive(chunk));
+        this.input.on('end', () => {
+            for (const pending of this.requests.values()) {
+                pending.reject(new Error('Channel closed'));
+            }
+            this.requests.clear();
+            this.emit('close');
+        });
+    }
+
+    ack(command: Packet, data: Packet = {}) {
+        this.send({ ...data, _: 'ack', sid: command.sid, pid: command.pid });
+    }
+
+    status(sid: string, status: string, data: Packet = {}) {
+        this.send({ ...data, _: 'status', sid, pid: this.packetCount++, status });
+    }
+
+    event(sid: string, event: string, data: Packet = {}) {
+        this.send({ ...data, _: 'event', sid, pid: this.packetCount++, event });
+    }
+
+    request(
+        sid: string,
+        request: string,
+        data: Packet,
+        timeoutMs: number = 30000
+    ): Promise<any> {
+        const pid = this.packetCount++;
+        return new Promise((resolve, reject) => {
+            const timer = setTimeout(() => {
+                this.requests.delete(pid);
+                reject(new Error('Request timed out: ' + request));
+            }, timeoutMs);
+            this.requests.set(pid, {
+                resolve: (data: any) => {
+                    clearTimeout(timer);
+                    resolve(data);
+                },
+                reject: (error: Error) => {
+                    clearTimeout(timer);
+                    reject(error);
+                },
+            });
+            this.send({ _: 'request', sid, pid, request, data });
+        });
+    }
+
+    private resolve(packet: Packet) {
+        const pending = this.requests.get(packet.pid);
+        if (pending === undefined) {
+            console.error('UNEXPECTED_RESPONSE ->', packet.pid);
+            return;
+        }
+        this.requests.delete(packet.pid);
+        if (packet.error) {
+            pending.reject(new Error(packet.error));
+        } else {
+            pending.resolve(packet.data);
+        }
+    }
+
+    send(packet: Packet) {
+        this.outbox.push(this.encode(packet));
+        if (!this.flushScheduled) {
+            this.flushScheduled = true;
+            setImmediate(() => this.flush());
+        }
+    }
+
+    private flush() {
+        this.flushScheduled = false;
+        const buf =
+            this.outbox.length === 1
+                ? this.outbox[0]
+                : Buffer.concat(this.outbox);
+        this.outbox = [];
+        this.output.write(buf);
+    }
+
+    private encode(packet: Packet): Buffer {
+        if (this.codec === 'json') {
+            return Buffer.from(JSON.stringify(packet) + '\n');
+        }
+        const body = encode(packet);
+        const frame = Buffer.allocUnsafe(4 + body.length);
+        frame.writeUInt32BE(body.length, 0);
+        frame.set(body, 4);
+        return frame;
+    }
+
+    private receive(chunk: Buffer) {
+        this.pending =
+            this.pending.length > 0
+                ? Buffer.concat([this.pending, chunk])
+                : chunk;
+        let offset = 0;
+        while (offset < this.pending.length) {
+            let start: number;
+            let end: number;
+            if (this.codec === 'json') {
+                end = this.pending.indexOf(10, offset);
+                if (end < 0) {
+                    break;
+                }
+                start = offset;
+                offset = end + 1;
+            } else {
+                if (this.pending.length - offset < 4) {
+                    break;
+                }
+                start = offset + 4;
+                end = start + this.pending.readUInt32BE(offset);
+                if (end > this.pending.length) {
+                    break;
+                }
+                offset = end;
+            }
+            try {
+                const packet = this.decode(this.pending.subarray(start, end));
+                if (packet._ === 'response') {
+                    this.resolve(packet);
+                } else {
+                    this.emit('packet', packet);
+                }
+            } catch (e) {
+                console.error('INVALID_PACKET ->', e);
+            }
+        }
+        this.pending = this.pending.subarray(offset);
+    }
+
+    private decode(frame: Buffer): Packet {
+        if (this.codec === 'json') {
+            return JSON.parse(frame.toString('utf-8'));
+        }
+        return decode(frame) as Packet;
+    }
+}
@@ -1,119 +1,333 @@
-// @ts-ignore
-import { connect } from 'socket.io-client';
-import RTCConnection from './rtc-connection';
-import sendUpdate from './send-update';
+import { createReadStream } from 'fs';
+import RTCConnection, { Source } from './rtc-connection';
+import { Channel, Packet } from './channel';
+import { OfferPool } from './offer-pool';
+import { RingSource } from './ring-source';
+import { LiveFileSource } from './live-file';
+import { Broadcast, Subscription } from './broadcast';
+import { Stream } from './stream';
+import { scheduler } from './scheduler';
+
+// worker wide status, carries the frame clock health to Python
+const STATUS_INTERVAL_MS = 1000;
 
 (async () => {
-    const port = parseInt(process.argv[2].split('=')[1]);
-    const logMode = parseInt(process.argv[3].split('=')[1]);
-    let socket = connect(`ws://localhost:${port}`);
-    console.log('Starting on port: ' + port);
-    socket.on('connect', () =>
-        console.log('\x1b[32m', 'Started NodeJS Core!', '\x1b[0m')
+    const logMode = parseInt(
+        (process.argv.find((arg) => arg.startsWith('--log-mode=')) ?? '=0')
+            .split('=')[1]
     );
+    const channel = new Channel(Channel.codecFromArgv());
+    channel.start();
+    channel.on('close', () => process.exit(0));
+    process.on('SIGINT', () => process.exit(0));
+    console.error('\x1b[32m', 'Started NodeJS Core!', '\x1b[0m');
+
+    const connections = new Map<string, RTCConnection>();
+    // keyed by their own sid, subscribers are pinned to this same worker
+    const broadcasts = new Map<string, Broadcast>();
+    const offers = new OfferPool(OfferPool.sizeFromArgv());
+    // playback position of every session, [seconds, playing], Python
+    // extrapolates between two reports instead of asking
+    const positions = () => {
+        const result: { [sid: string]: [number, boolean] } = {};
+        connections.forEach((connection, sid) => {
+            const stream = connection.stream;
+            result[sid] = [stream.position, stream.playing];
+        });
+        broadcasts.forEach((broadcast, sid) => {
+            const stream = broadcast.stream;
+            result[sid] = [stream.position, stream.playing];
+        });
+        return result;
+    };
+    // audio health of every session, aggregated in the same packet
+    const metrics = () => {
+        const result: { [sid: string]: object } = {};
+        connections.forEach((connection, sid) => {
+            result[sid] = {
+                ...connection.stream.metrics(),
+                join_ms: connection.requestMs + connection.connectMs,
+            };
+        });
+        broadcasts.forEach((broadcast, sid) => {
+            result[sid] = {
+                ...broadcast.stream.metrics(),
+                subscribers: broadcast.subscriberCount,
+            };
+        });
+        return result;
+    };
+    setInterval(
+        () =>
+            channel.status('', 'running', {
+                scheduler: scheduler.stats(),
+                positions: positions(),
+                metrics: metrics(),
+            }),
+        STATUS_INTERVAL_MS
+    ).unref();
+
+    // Rings and live files Python still writes into, by path: with a queue
+    // several of them can be open for the same session
+    const writable = new Map<string, RingSource | LiveFileSource>();
 
-    let connections: Array<RTCConnection> = [];
+    // Raw PCM file path, a file still being written, or the shared memory ring
+    // Python writes into. Files are read from data.offset on, when seeking,
+    // rings from cursor data.offset on, when replayed after a crash
+    const buildSource = (data: Packet): Source => {
+        const offset: number = data['offset'] ?? 0;
+        let source: RingSource | LiveFileSource;
+        if (data['ring']) {
+            source = new RingSource(
+                data['ring']['path'],
+                data['ring']['capacity'],
+                (cursor: number) =>
+                    channel.event(data.sid, 'ring_read', {
+                        cursor,
+                        path: data['ring']['path'],
+                    }),
+                offset
+            );
+        } else if (data['live']) {
+            source = new LiveFileSource(data['file_path'], undefined, offset);
+        } else if (offset > 0) {
+            return createReadStream(data['file_path'], { start: offset });
+        } else {
+            return data['file_path'];
+        }
+        const path = source.path;
+        writable.set(path, source);
+        source.on('close', () => {
+            if (writable.get(path) === source) {
+                writable.delete(path);
+            }
+        });
+        return source;
+    };
 
-    await socket.on('request', async function (data: any) {
-        data = JSON.parse(data);
+    // What a session is doing after its source changed, pausing is kept
+    const streamStatus = (stream: Stream | Subscription): string =>
+        stream.paused ? 'paused' : 'playing';
 
+    // Queues belong to whoever owns a Stream, broadcast subscribers don't
+    const ownStream = (stream: Stream | Subscription): Stream => {
+        if (stream instanceof Subscription) {
+            throw new Error('Broadcast subscribers have no queue of their own');
+        }
+        return stream;
+    };
+
+    channel.on('packet', async function (data: Packet) {
         if (logMode > 0) {
-            console.log('REQUEST: ', data);
+            console.error('REQUEST: ', data);
         }
 
-        if (data['action'] === 'join_call') {
-            if (!connections[data.chat_id]) {
-                connections[data.chat_id] = new RTCConnection(
-                    data.chat_id,
-                    data['file_path'],
-                    port,
+        const connection = connections.get(data.sid);
+        const broadcast = broadcasts.get(data.sid);
+
+        if (data['action'] === 'broadcast') {
+            if (broadcast) {
+                channel.ack(data, { result: 'ALREADY_BROADCASTING' });
+                return;
+            }
+            try {
+                const created = new Broadcast(
+                    data.sid,
+                    buildSource(data),
                     data['bitrate'],
                     logMode,
-                    data['buffer_lenght'],
-                    data['invite_hash']
+                    data['buffer_lenght']
                 );
+                created.stream.setStart(data['start'] ?? 0);
+                created.on('underrun', () =>
+                    channel.event(data.sid, 'underrun', {})
+                );
+                created.on('track_changed', (track: string) =>
+                    channel.event(data.sid, 'track_changed', { track })
+                );
+                created.on('finish', () => {
+                    channel.status(data.sid, 'ended');
+                    channel.event(data.sid, 'ended_stream', {});
+                });
+                broadcasts.set(data.sid, created);
+            } catch (e) {
+                channel.status(data.sid, 'error');
+                channel.ack(data, { result: 'ERROR', error: String(e) });
+                return;
+            }
+            channel.status(data.sid, 'playing');
+            channel.ack(data, { result: 'BROADCASTING' });
+            return;
+        }
 
-                const result = await connections[data.chat_id].joinCall();
-
-                if (result) {
-                    await sendUpdate(port, {
-                        result: 'JOINED_VOICE_CHAT',
-                        chat_id: data.chat_id,
-                    });
-                } else {
-                    delete connections[data.chat_id];
-                    await sendUpdate(port, {
-                        result: 'JOIN_ERROR',
-                        chat_id: data.chat_id,
-                    });
+        if (data['action'] === 'join_call') {
+            if (connection) {
+                channel.ack(data, { result: 'ALREADY_JOINED' });
+                return;
+            }
+            let source: Broadcast | undefined;
+            if (data['broadcast']) {
+                source = broadcasts.get(data['broadcast']);
+                if (!source) {
+                    channel.status(data.sid, 'error');
+                    channel.ack(data, { result: 'NO_SUCH_BROADCAST' });
+                    return;
                 }
+            }
+            channel.status(data.sid, 'joining');
+            // before claiming an offer, a missing ring or file must not cost one
+            let built: Source | Broadcast;
+            try {
+                built = source ?? buildSource(data);
+            } catch (e) {
+                channel.status(data.sid, 'error');
+                channel.ack(data, { result: 'ERROR', error: String(e) });
+                return;
+            }
+            const claimStart = Date.now();
+            let offer, pooled;
+            try {
+                [offer, pooled] = await offers.claim();
+            } catch (e) {
+                channel.status(data.sid, 'error');
+                channel.ack(data, { result: 'JOIN_ERROR', error: String(e) });
+                return;
+            }
+            const offerMs = Date.now() - claimStart;
+            const created = new RTCConnection(
+                data.sid,
+                data.chat_id,
+                built,
+                channel,
+                data['bitrate'],
+                logMode,
+                data['buffer_lenght'],
+                data['invite_hash'],
+                offer
+            );
+            if (created.stream instanceof Stream) {
+                created.stream.setStart(data['start'] ?? 0);
+            }
+            connections.set(data.sid, created);
 
-                if (logMode > 0) {
-                    console.log('UPDATED_CONNECTIONS: ', connections);
-                }
+            const joined = await created.joinCall();
+            const timings = {
+                pooled,
+                offer_ms: offerMs,
+                request_ms: created.requestMs,
+                connect_ms: created.connectMs,
+            };
+            if (joined) {
+                channel.status(data.sid, 'playing');
+                channel.ack(data, { result: 'JOINED_VOICE_CHAT', timings });
+            } else {
+                // start may have given up before its connection or stream
+                // were closed, neither must outlive the failed join
+                created.stop();
+                connections.delete(data.sid);
+                channel.status(data.sid, 'error');
+                channel.ack(data, { result: 'JOIN_ERROR', timings });
             }
-        } else if (data['action'] === 'leave_call') {
-            if (connections[data.chat_id]) {
-                if (data['type'] !== 'kicked_from_group') {
-                    let result = await connections[data.chat_id].leave_call();
-
-                    if (result['result'] === 'OK') {
-                        delete connections[data.chat_id];
-                        await sendUpdate(port, {
-                            result: 'LEFT_VOICE_CHAT',
-                            chat_id: data.chat_id,
-                        });
-                    } else {
-                        if (logMode > 0) {
-                            console.log('ERROR_INTERNAL: ', result);
-                        }
-
-                        delete connections[data.chat_id];
-                        await sendUpdate(port, {
-                            result: 'LEFT_VOICE_CHAT',
-                            error: result['result'],
-                            chat_id: data.chat_id,
-                        });
-                    }
+
+            if (logMode > 0) {
+                console.error('UPDATED_CONNECTIONS: ', connections.size);
+            }
+            return;
+        }
+
+        if (data['action'] === 'prewarm') {
+            offers.resize(data['size']);
+            channel.ack(data, { result: 'OK', available: offers.available });
+            return;
+        }
+
+        const session = connection ?? broadcast;
+        if (!session) {
+            channel.ack(data, { result: 'NOT_IN_CALL' });
+            return;
+        }
+
+        try {
+            if (data['action'] === 'stop_broadcast' && broadcast) {
+                broadcast.stop();
+                broadcasts.delete(data.sid);
+                channel.status(data.sid, 'left');
+                channel.ack(data, { result: 'STOPPED_BROADCAST' });
+            } else if (data['action'] === 'leave_call' && connection) {
+                connection.stop();
+                connections.delete(data.sid);
+                if (data['type'] === 'kicked_from_group') {
+                    channel.status(data.sid, 'kicked');
+                    channel.ack(data, { result: 'KICKED_FROM_GROUP' });
                 } else {
-                    await connections[data.chat_id].stop();
-                    delete connections[data.chat_id];
-                    await sendUpdate(port, {
-                        result: 'KICKED_FROM_GROUP',
-                        chat_id: data.chat_id,
-                    });
+                    channel.status(data.sid, 'left');
+                    channel.ack(data, { result: 'LEFT_VOICE_CHAT' });
                 }
+            } else if (data['action'] === 'pause') {
+                session.pause();
+                channel.status(data.sid, 'paused');
+                channel.ack(data, { result: 'PAUSED_AUDIO_STREAM' });
+            } else if (data['action'] === 'resume') {
+                session.resume();
+                channel.status(data.sid, 'playing');
+                channel.ack(data, { result: 'RESUMED_AUDIO_STREAM' });
+            } else if (data['action'] === 'stats') {
+                channel.ack(data, {
+                    result: 'OK',
+                    cache_bytes: session.stream.cacheBytes,
+                    cache_fill: session.stream.cacheFill,
+                    subscribers: broadcast?.subscriberCount,
+                });
+            } else if (data['action'] === 'ring_write') {
+                const ring = writable.get(data['path']);
+                if (ring instanceof RingSource) {
+                    ring.update(data['cursor'], data['eof']);
+                }
+                channel.ack(data, { result: 'OK' });
+            } else if (data['action'] === 'finish_input') {
+                const live = writable.get(data['path']);
+                if (live instanceof LiveFileSource) {
+                    live.finish();
+                }
+                channel.ack(data, { result: 'OK' });
+            } else if (data['action'] === 'change_stream') {
+                session.changeStream(
+                    buildSource(data),
+                    data['track'],
+                    data['start']
+                );
+                channel.status(data.sid, streamStatus(session.stream));
+                channel.ack(data, { result: 'CHANGED_AUDIO_STREAM' });
+            } else if (data['action'] === 'enqueue') {
+                const stream = ownStream(session.stream);
+                stream.enqueue(buildSource(data), data['track']);
+                channel.status(data.sid, streamStatus(stream));
+                channel.ack(data, { result: 'ENQUEUED' });
+            } else if (data['action'] === 'skip') {
+                const skipped = ownStream(session.stream).skip();
+                channel.ack(data, {
+                    result: skipped ? 'SKIPPED' : 'QUEUE_EMPTY',
+                });
+            } else if (data['action'] === 'queue_clear') {
+                ownStream(session.stream).clearQueue();
+                channel.ack(data, { result: 'OK' });
+            } else if (data['action'] === 'queue') {
+                channel.ack(data, {
+                    result: 'OK',
+                    queue: ownStream(session.stream).queued,
+                });
+            } else if (data['action'] === 'volume') {
+                // a broadcast's own stream scales every subscriber at once
+                session.stream.setVolume(data['volume'], data['ramp_ms']);
+                channel.ack(data, { result: 'OK' });
+            } else {
+                channel.ack(data, { result: 'UNKNOWN_ACTION' });
             }
-        } else if (data['action'] === 'pause') {
-            if (connections[data.chat_id]) {
-                try {
-                    await connections[data.chat_id].pause();
-                    await sendUpdate(port, {
-                        result: 'PAUSED_AUDIO_STREAM',
-                        chat_id: data.chat_id,
-                    });
-                } catch (e) {}
-            }
-        } else if (data['action'] === 'resume') {
-            if (connections[data.chat_id]) {
-                try {
-                    await connections[data.chat_id].resume();
-                    await sendUpdate(port, {
-                        result: 'RESUMED_AUDIO_STREAM',
-                        chat_id: data.chat_id,
-                    });
-                } catch (e) {}
-            }
-        } else if (data['action'] === 'change_stream') {
-            if (connections[data.chat_id]) {
-                try {
-                    await connections[data.chat_id].changeStream(data.file_path);
-                    await sendUpdate(port, {
-                        result: 'CHANGED_AUDIO_STREAM',
-                        chat_id: data.chat_id,
-                    });
-                } catch (e) {}
+        } catch (e) {
+            if (logMode > 0) {
+                console.error('ERROR_INTERNAL: ', e);
             }
+            channel.ack(data, { result: 'ERROR', error: String(e) });
         }
     });
 })();
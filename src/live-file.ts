@@ -0,0 +1,100 @@
+import { open, read, close, watch, FSWatcher } from 'fs';
+import { Readable } from 'stream';
+
+// A raw PCM file that is still being written, like a live ffmpeg output.
+// New bytes are picked up on change notifications instead of polling the
+// file size, and the end of the stream is signalled explicitly by Python
+// with finish(): reads only ever touch the fd, never stat the path.
+export class LiveFileSource extends Readable {
+    private fd?: number;
+    private watcher?: FSWatcher;
+    private readCursor: number;
+    private eof = false;
+    private wanted = 0;
+    private reading = false;
+    private changed = false;
+
+    // start: byte offset to read from, seeks never read what comes before
+    constructor(
+        readonly path: string,
+        readonly chunkSize: number = 64 * 1024,
+        start: number = 0
+    ) {
+        super();
+        this.readCursor = start;
+    }
+
+    finish() {
+        this.eof = true;
+        this.pump();
+    }
+
+    get starved() {
+        return !this.eof && this.wanted > 0 && !this.reading;
+    }
+
+    get bytesRead() {
+        return this.readCursor;
+    }
+
+    _construct(callback: (error?: Error | null) => void) {
+        open(this.path, 'r', (error, fd) => {
+            if (error) {
+                callback(error);
+                return;
+            }
+            this.fd = fd;
+            // coalesced by pump(), a burst of notifications costs one read
+            this.watcher = watch(this.path, () => this.pump());
+            callback();
+        });
+    }
+
+    _read(size: number) {
+        this.wanted = Math.max(size, this.chunkSize);
+        this.pump();
+    }
+
+    _destroy(error: Error | null, callback: (error?: Error | null) => void) {
+        this.watcher?.close();
+        if (this.fd === undefined) {
+            callback(error);
+            return;
+        }
+        close(this.fd, () => callback(error));
+    }
+
+    private pump() {
+        if (this.reading) {
+            // writer may have appended after our read was issued, look again
+            this.changed = true;
+            return;
+        }
+        if (this.wanted === 0 || this.fd === undefined) {
+            return;
+        }
+        this.reading = true;
+        this.changed = false;
+        const chunk = Buffer.allocUnsafe(this.wanted);
+        read(this.fd, chunk, 0, chunk.length, this.readCursor, (error, n) => {
+            this.reading = false;
+            if (error) {
+                this.destroy(error);
+                return;
+            }
+            if (n === 0) {
+                // caught up with the writer: wait for the next notification
+                if (this.eof) {
+                    this.wanted = 0;
+                    this.push(null);
+                } else if (this.changed) {
+                    this.pump();
+                }
+                return;
+            }
+            this.readCursor += n;
+            this.wanted = 0;
+            this.push(chunk.subarray(0, n));
+        });
+    }
+}
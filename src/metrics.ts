@@ -0,0 +1,31 @@
+// Audio health of one session, reported to Python in the worker wide status
+// packet. Counters only grow, Python derives rates from two reports.
+export class FrameCounters {
+    framesSent: number = 0;
+    // sent by a scheduler catching up, after their due time
+    lateFrames: number = 0;
+    underruns: number = 0;
+    // ticks without a frame to send while playing
+    starvedFrames: number = 0;
+    private lastFrameAt: number = 0;
+
+    sent(late: boolean) {
+        this.framesSent += 1;
+        if (late) {
+            this.lateFrames += 1;
+        }
+        this.lastFrameAt = Date.now();
+    }
+
+    report(bufferMs: number) {
+        return {
+            buffer_ms: Math.round(bufferMs),
+            frames_sent: this.framesSent,
+            late_frames: this.lateFrames,
+            underruns: this.underruns,
+            starved_frames: this.starvedFrames,
+            since_last_frame_ms:
+                this.lastFrameAt > 0 ? Date.now() - this.lastFrameAt : null,
+        };
+    }
+}
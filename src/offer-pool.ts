@@ -0,0 +1,95 @@
+import { RTCPeerConnection, RTCAudioSource, nonstandard } from 'wrtc';
+import { parseSdp } from './utils';
+import { Sdp } from './types';
+
+export interface PreparedOffer {
+    connection: RTCPeerConnection;
+    audioSource: RTCAudioSource;
+    sdp: Sdp;
+    createdMs: number;
+}
+
+// Keeps `size` peer connections with their local offer already set, so that
+// joining a call only needs to claim one instead of negotiating from scratch.
+export class OfferPool {
+    private ready: PreparedOffer[] = [];
+    private filling = 0;
+
+    constructor(public size: number = 0) {
+        this.refill();
+    }
+
+    static sizeFromArgv(argv: string[] = process.argv): number {
+        const arg = argv.find((a) => a.startsWith('--prewarm='));
+        return arg ? parseInt(arg.split('=')[1]) || 0 : 0;
+    }
+
+    get available() {
+        return this.ready.length;
+    }
+
+    async create(): Promise<PreparedOffer> {
+        const start = Date.now();
+        const audioSource = new nonstandard.RTCAudioSource();
+        const connection = new RTCPeerConnection();
+        connection.addTrack(audioSource.createTrack());
+
+        const offer = await connection.createOffer({
+            offerToReceiveVideo: false,
+            offerToReceiveAudio: true,
+        });
+        await connection.setLocalDescription(offer);
+
+        if (!offer.sdp) {
+            connection.close();
+            throw new Error('Could not create local offer');
+        }
+
+        return {
+            connection,
+            audioSource,
+            sdp: parseSdp(offer.sdp),
+            createdMs: Date.now() - start,
+        };
+    }
+
+    // Returns a prepared offer and whether it came from the pool
+    async claim(): Promise<[PreparedOffer, boolean]> {
+        const prepared = this.ready.shift();
+        this.refill();
+        if (prepared !== undefined) {
+            return [prepared, true];
+        }
+        return [await this.create(), false];
+    }
+
+    resize(size: number) {
+        this.size = size;
+        while (this.ready.length > size) {
+            this.ready.pop()?.connection.close();
+        }
+        this.refill();
+    }
+
+    private refill() {
+        while (this.ready.length + this.filling < this.size) {
+            this.filling += 1;
+            this.create()
+                .then((prepared) => {
+                    if (this.ready.length < this.size) {
+                        this.ready.push(prepared);
+                    } else {
+                        prepared.connection.close();
+                    }
+                })
+                .catch((e) => console.error('PREWARM_ERROR ->', e))
+                .finally(() => {
+                    this.filling -= 1;
+                });
+        }
+    }
+
+    close() {
+        this.resize(0);
+    }
+}
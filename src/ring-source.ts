@@ -0,0 +1,70 @@
+import { openSync, readSync, closeSync } from 'fs';
+import { Readable } from 'stream';
+
+// Consumer side of a PcmRingBuffer: reads PCM out of the file shared with
+// Python (usually on tmpfs) between its read and write cursors. Python
+// publishes the write cursor, we report back how far we read. A ring handed
+// to a restarted core goes on from the cursor the previous one stopped at.
+export class RingSource extends Readable {
+    private fd: number;
+    private readCursor = 0;
+    private writeCursor = 0;
+    private eof = false;
+    private wanted = 0;
+
+    constructor(
+        readonly path: string,
+        readonly capacity: number,
+        private readonly onConsumed: (cursor: number) => void,
+        start: number = 0
+    ) {
+        super();
+        this.fd = openSync(path, 'r');
+        this.readCursor = this.writeCursor = start;
+    }
+
+    update(writeCursor: number, eof: boolean) {
+        this.writeCursor = Math.max(this.writeCursor, writeCursor);
+        this.eof = this.eof || eof;
+        if (this.wanted > 0) {
+            this.pump();
+        }
+    }
+
+    get starved() {
+        return !this.eof && this.readCursor === this.writeCursor;
+    }
+
+    _read(size: number) {
+        this.wanted = size;
+        this.pump();
+    }
+
+    _destroy(error: Error | null, callback: (error?: Error | null) => void) {
+        closeSync(this.fd);
+        callback(error);
+    }
+
+    private pump() {
+        const available = this.writeCursor - this.readCursor;
+        if (available === 0) {
+            if (this.eof) {
+                this.wanted = 0;
+                this.push(null);
+            }
+            return;
+        }
+        const position = this.readCursor % this.capacity;
+        const length = Math.min(
+            available,
+            this.wanted,
+            this.capacity - position
+        );
+        const chunk = Buffer.allocUnsafe(length);
+        readSync(this.fd, chunk, 0, length, position);
+        this.readCursor += length;
+        this.wanted = 0;
+        this.onConsumed(this.readCursor);
+        this.push(chunk);
+    }
+}
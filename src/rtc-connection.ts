@@ -1,45 +1,67 @@
-// @ts-ignore
-import fetch from 'node-fetch';
-import {Stream, TGCalls} from './tgcalls';
+import { ReadStream } from 'fs';
+import { Stream, TGCalls } from './tgcalls';
+import { Channel } from './channel';
+import { PreparedOffer } from './offer-pool';
+import { RingSource } from './ring-source';
+import { LiveFileSource } from './live-file';
+import { Broadcast, Subscription } from './broadcast';
+
+// a ReadStream is a raw PCM file opened at an offset, to seek
+export type Source = string | RingSource | LiveFileSource | ReadStream;
 
 class RTCConnection {
+    sid: string;
     chat_id: number;
-    file_path: string;
-    port: number;
+    file_path: string = '';
+    channel: Channel;
     bitrate: number;
     logMode: number;
     buffer_lenght: number;
     invite_hash: string;
+    offer: PreparedOffer;
 
     tgcalls: TGCalls<any>;
-    stream: Stream;
+    stream: Stream | Subscription;
+    requestMs: number = 0;
+    connectMs: number = 0;
 
     constructor(
+        sid: string,
         chat_id: number,
-        file_path: string,
-        port: number,
+        source: Source | Broadcast,
+        channel: Channel,
         bitrate: number,
         logMode: number,
         buffer_lenght: number,
-        invite_hash: string
+        invite_hash: string,
+        offer: PreparedOffer
     ) {
+        this.sid = sid;
         this.chat_id = chat_id;
-        this.file_path = file_path;
-        this.port = port;
+        this.channel = channel;
         this.bitrate = bitrate;
         this.logMode = logMode;
         this.buffer_lenght = buffer_lenght;
         this.invite_hash = invite_hash;
+        this.offer = offer;
 
         this.tgcalls = new TGCalls({}, chat_id);
-        this.stream = new Stream(
-            file_path,
-            16,
-            bitrate,
-            1,
-            logMode,
-            buffer_lenght
-        );
+        if (source instanceof Broadcast) {
+            // frames come paced from the broadcast, nothing is read or buffered here
+            this.stream = source.subscribe(offer.audioSource);
+        } else {
+            this.setSource(source);
+            this.stream = new Stream(
+                source,
+                16,
+                bitrate,
+                1,
+                logMode,
+                buffer_lenght,
+                undefined,
+                offer.audioSource
+            );
+        }
 
         this.tgcalls.joinVoiceCall = async (payload: any) => {
             payload = {
@@ -54,44 +76,62 @@ class RTCConnection {
             };
 
             if (logMode > 0) {
-                console.log('callJoinPayload -> ', payload);
+                console.error('callJoinPayload -> ', payload);
             }
 
-            const joinCallResult = await (
-                await fetch(`http://localhost:${this.port}/request_join_call`, {
-                    method: 'POST',
-                    body: JSON.stringify(payload),
-                })
-            ).json();
+            const requestStart = Date.now();
+            const joinCallResult = await this.channel.request(
+                this.sid,
+                'join_call',
+                payload
+            );
+            this.requestMs = Date.now() - requestStart;
 
             if (logMode > 0) {
-                console.log('joinCallRequestResult -> ', joinCallResult);
+                console.error('joinCallRequestResult -> ', joinCallResult);
             }
 
             return joinCallResult;
         };
 
-        this.stream.on('finish', async () => {
-            await fetch(`http://localhost:${this.port}/ended_stream`, {
-                method: 'POST',
-                body: JSON.stringify({
-                    chat_id: chat_id,
-                }),
+        this.stream.on('underrun', () => {
+            this.channel.event(this.sid, 'underrun', {
+                chat_id: chat_id,
+            });
+        });
+
+        this.stream.on('track_changed', (track: string) => {
+            this.channel.event(this.sid, 'track_changed', {
+                chat_id: chat_id,
+                track,
+            });
+        });
+
+        this.stream.on('finish', () => {
+            if (this.stream.stopped) {
+                return;
+            }
+            this.channel.status(this.sid, 'ended');
+            this.channel.event(this.sid, 'ended_stream', {
+                chat_id: chat_id,
             });
         });
     }
 
     async joinCall() {
+        const start = Date.now();
         try {
-            return await this.tgcalls.start(this.stream.createTrack());
+            return await this.tgcalls.start(this.offer);
         } catch (e) {
             this.stream.stop();
 
             if (this.logMode > 0) {
-                console.log('joinCallError ->', e);
+                console.error('joinCallError ->', e);
             }
 
             return false;
+        } finally {
+            this.connectMs = Date.now() - start - this.requestMs;
         }
     }
 
@@ -102,35 +142,25 @@ class RTCConnection {
         } catch (e) {}
     }
 
-    async leave_call() {
-        try {
-            this.stop();
-            return await (
-                await fetch(`http://localhost:${this.port}/request_leave_call`, {
-                    method: 'POST',
-                    body: JSON.stringify({
-                        chat_id: this.chat_id,
-                    }),
-                })
-            ).json();
-        } catch (e) {
-            return {
-                action: 'REQUEST_ERROR',
-                message: e.toString(),
-            };
-        }
-    }
-
     pause() {
         this.stream.pause();
     }
 
-    async resume() {
+    resume() {
         this.stream.resume();
     }
 
-    changeStream(file_path: string) {
-        this.stream.setReadable(file_path);
+    private setSource(source: Source) {
+        this.file_path =
+            typeof source === 'string' ? source : source.path.toString();
+    }
+
+    changeStream(source: Source, track: string = '', start: number = 0) {
+        if (this.stream instanceof Subscription) {
+            throw new Error('Cannot change the stream of a broadcast subscriber');
+        }
+        this.setSource(source);
+        this.stream.setReadable(source, track, start);
     }
 }
 
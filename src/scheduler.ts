@@ -0,0 +1,93 @@
+export interface Tickable {
+    // Called once per frame, must be cheap and never throw. late is set on
+    // the frames caught up after a late wakeup, all but the last one
+    tick(late?: boolean): void;
+}
+
+export const FRAME_MS = 10;
+
+// Single clock for every stream of this process. Deadlines are computed from
+// a monotonic origin, so timer lateness never accumulates into drift: late
+// frames are caught up right away, up to maxCatchUp per wakeup, anything
+// beyond that is skipped so a long stall can't turn into a burst.
+export class FrameScheduler {
+    private streams = new Set<Tickable>();
+    private origin = process.hrtime.bigint();
+    private ticks = 0;
+    private timer?: NodeJS.Timeout;
+
+    lateFrames = 0;
+    skippedFrames = 0;
+    jitterMs = 0;
+    maxJitterMs = 0;
+
+    constructor(readonly maxCatchUp: number = 5) {}
+
+    add(stream: Tickable) {
+        this.streams.add(stream);
+        if (this.timer === undefined) {
+            this.origin = process.hrtime.bigint();
+            this.ticks = 0;
+            this.schedule();
+        }
+    }
+
+    remove(stream: Tickable) {
+        this.streams.delete(stream);
+        if (this.streams.size === 0 && this.timer !== undefined) {
+            clearTimeout(this.timer);
+            this.timer = undefined;
+        }
+    }
+
+    stats() {
+        return {
+            streams: this.streams.size,
+            late_frames: this.lateFrames,
+            skipped_frames: this.skippedFrames,
+            jitter_ms: this.jitterMs,
+            max_jitter_ms: this.maxJitterMs,
+        };
+    }
+
+    private elapsedMs() {
+        return Number(process.hrtime.bigint() - this.origin) / 1e6;
+    }
+
+    private schedule() {
+        const delay = (this.ticks + 1) * FRAME_MS - this.elapsedMs();
+        this.timer = setTimeout(() => this.run(), Math.max(0, delay));
+    }
+
+    private run() {
+        const now = this.elapsedMs();
+        const lateness = now - (this.ticks + 1) * FRAME_MS;
+        // exponentially weighted, like RTP interarrival jitter
+        this.jitterMs += (Math.abs(lateness) - this.jitterMs) / 16;
+        this.maxJitterMs = Math.max(this.maxJitterMs, lateness);
+
+        let due = Math.floor(now / FRAME_MS) - this.ticks;
+        if (due > 1) {
+            this.lateFrames += due - 1;
+        }
+        if (due > this.maxCatchUp) {
+            this.skippedFrames += due - this.maxCatchUp;
+            this.ticks += due - this.maxCatchUp;
+            due = this.maxCatchUp;
+        }
+        for (let i = 0; i < due; i++) {
+            for (const stream of this.streams) {
+                stream.tick(i < due - 1);
+            }
+            this.ticks += 1;
+        }
+
+        if (this.streams.size > 0) {
+            this.schedule();
+        } else {
+            this.timer = undefined;
+        }
+    }
+}
+
+export const scheduler = new FrameScheduler();
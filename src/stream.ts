@@ -1,121 +1,324 @@
-import { createReadStream, statSync } from 'fs';
+import { createReadStream } from 'fs';
 import { EventEmitter } from 'events';
+import { Readable } from 'stream';
 import { RTCAudioSource, nonstandard } from 'wrtc';
+import { AudioRing } from './audio-ring';
+import { scheduler } from './scheduler';
+import { Gain } from './gain';
+import { FrameCounters } from './metrics';
+
+// slack on top of buffer_lenght, a read chunk may land after the threshold
+const RING_HEADROOM = 2 * 64 * 1024;
+// buffering bookkeeping doesn't need to run on every frame
+const HOUSEKEEPING_TICKS = 10;
+
+interface QueuedTrack {
+    id: string;
+    source: string | Readable;
+    // bytes of this track already read before the current track was replaced
+    carry?: Buffer;
+}
+
+interface Boundary {
+    // cache offset of the first byte of the track
+    offset: number;
+    id: string;
+}
 
 export class Stream extends EventEmitter {
     private readonly audioSource: RTCAudioSource;
-    private cache: Buffer;
-    private readable = undefined;
+    private readonly cache: AudioRing;
+    private readonly byteLength: number;
+    private readonly gain = new Gain();
+    private ticks: number = 0;
+    private readable?: Readable = undefined;
+    private upcoming: QueuedTrack[] = [];
+    private boundaries: Boundary[] = [];
+    // cache offset where the playing track begins, and its time at that offset
+    private trackOffset: number = 0;
+    private trackStart: number = 0;
+    private underrun: boolean = false;
+    readonly counters = new FrameCounters();
+    // the frame being sent is late, the scheduler is catching up
+    public late: boolean = false;
     public paused: boolean = false;
     public finished: boolean = true;
     public stopped: boolean = false;
     private finishedLoading = false;
     public file_path: string;
     private bytesLoaded: number = 0;
-    private bytesSpeed: number = 0;
-    private lastLag: number = 0;
-    private equalCount: number = 0;
-    private lastBytesLoaded: number = 0;
-    private finishedBytes: boolean = false;
-    private lastByteCheck: number = 0;
-    private lastByte: number = 0;
     private runningPulse: boolean = false;
 
     constructor(
-        file_path: string,
+        source: string | Readable,
         readonly bitsPerSample: number = 16,
         readonly sampleRate: number = 48000,
         readonly channelCount: number = 1,
         readonly logMode: number = 0,
         readonly buffer_lenght: number = 10,
-        readonly timePulseBuffer: number = buffer_lenght == 4 ? 1.5 : 0
+        readonly timePulseBuffer: number = buffer_lenght == 4 ? 1.5 : 0,
+        audioSource?: RTCAudioSource
     ) {
         super();
 
-        this.audioSource = new nonstandard.RTCAudioSource();
-        this.cache = Buffer.alloc(0);
-        this.file_path = file_path;
-        this.setReadable(file_path);
-        this.processData();
+        this.audioSource = audioSource ?? new nonstandard.RTCAudioSource();
+        this.byteLength =
+            ((this.sampleRate * this.bitsPerSample) / 8 / 100) *
+            this.channelCount;
+        this.cache = new AudioRing(
+            this.byteLength * 100 * this.buffer_lenght + RING_HEADROOM,
+            this.byteLength
+        );
+        this.file_path = typeof source === 'string' ? source : '';
+        this.setReadable(source);
+        scheduler.add(this);
     }
 
-    setReadable(file_path: string) {
-        this.bytesLoaded = 0;
-        this.bytesSpeed = 0;
-        this.lastLag = 0;
-        this.equalCount = 0;
-        this.lastBytesLoaded = 0;
-        this.finishedBytes = false;
-        this.lastByteCheck = 0;
-        this.lastByte = 0;
-        this.file_path = file_path;
-        // @ts-ignore
-        this.readable = createReadStream(file_path);
-
+    // Either a complete raw PCM file path or a readable producing raw PCM, like
+    // a RingSource or a LiveFileSource. Files still being written must come
+    // through a LiveFileSource, a plain path ends at the current end of file.
+    // Replaces the current track, queued tracks play after it. start is the
+    // time in seconds the source begins at, when it was opened at an offset.
+    setReadable(
+        source: string | Readable,
+        id: string = '',
+        start: number = 0
+    ) {
         if (this.stopped) {
             throw new Error('Cannot set readable when stopped');
         }
 
-        this.cache = Buffer.alloc(0);
-
-        if (this.readable !== undefined) {
-            this.finished = false;
-            this.finishedLoading = false;
+        // tracks already read past the current one keep what they buffered
+        const carried: QueuedTrack[] = this.boundaries.map((boundary, i) => {
+            const next = this.boundaries[i + 1];
+            const carry = this.cache.copyFrom(boundary.offset);
+            if (next || this.readable!.readableEnded) {
+                const end = next ? next.offset - boundary.offset : carry.length;
+                return {
+                    id: boundary.id,
+                    source: Readable.from([carry.subarray(0, end)]),
+                };
+            }
+            return { id: boundary.id, source: this.readable!, carry };
+        });
+        if (carried.length > 0) {
+            this.detach();
+        } else if (this.readable !== undefined && this.readable !== source) {
+            this.readable.destroy();
+        }
+        this.upcoming.unshift(...carried);
+        this.boundaries = [];
+        this.cache.clear();
+        this.playFrom(0, start);
+        this.attach(source);
+        if (id) {
+            this.emit('track_changed', id);
+        }
+    }
 
-            // @ts-ignore
-            this.readable.on('data', (data: any) => {
-                this.bytesLoaded += data.length;
-                this.bytesSpeed = data.length;
-                if (!this.needsBuffering()) {
-                    // @ts-ignore
-                    this.readable.pause();
-                    this.runningPulse = false;
+    private attach(source: string | Readable, carry?: Buffer) {
+        this.bytesLoaded = 0;
+        if (typeof source === 'string') {
+            this.file_path = source;
+            this.readable = createReadStream(source);
+        } else {
+            this.file_path = '';
+            this.readable = source;
+        }
+        const readable = this.readable;
+        if (carry && carry.length > 0) {
+            readable.unshift(carry);
+        }
+        this.finished = false;
+        this.finishedLoading = false;
+
+        readable.on('data', (data: Buffer) => {
+            const taken = this.cache.write(data);
+            if (taken < data.length) {
+                // ring is full, hand the rest back until frames are consumed
+                readable.pause();
+                readable.unshift(data.subarray(taken));
+            }
+            this.bytesLoaded += taken;
+            if (!this.needsBuffering()) {
+                readable.pause();
+                this.runningPulse = false;
+                if (this.logMode > 1) {
+                    console.error('ENDED_BUFFERING ->', new Date().getTime());
+                    console.error(
+                        'BYTES_STREAM_CACHE_LENGTH ->',
+                        this.cache.length
+                    );
                     if (this.logMode > 1) {
-                        console.log('ENDED_BUFFERING ->', new Date().getTime());
-                        console.log(
-                            'BYTES_STREAM_CACHE_LENGTH ->',
-                            this.cache.length
-                        );
-                        if (this.logMode > 1) {
-                            console.log('PULSE ->', this.runningPulse);
-                        }
+                        console.error('PULSE ->', this.runningPulse);
                     }
                 }
+            }
 
-                if (this.logMode > 1) {
-                    // @ts-ignore
-                    console.log(
-                        'BYTES_LOADED ->',
-                        this.bytesLoaded,
-                        'OF ->',
-                        Stream.getFilesizeInBytes(this.file_path)
-                    );
+            if (this.logMode > 1) {
+                console.error('BYTES_LOADED ->', this.bytesLoaded);
+            }
+        });
+        readable.on('end', () => {
+            if (this.logMode > 1) {
+                console.error('COMPLETED_BUFFERING ->', new Date().getTime());
+                console.error(
+                    'BYTES_STREAM_CACHE_LENGTH ->',
+                    this.cache.length
+                );
+                console.error('BYTES_LOADED ->', this.bytesLoaded);
+            }
+            this.endLoading();
+        });
+        // a file or ring gone missing ends its track, unhandled it would take
+        // the whole process down. Kept when detached, a carried readable
+        // attached again already has it
+        if (readable.listenerCount('error') === 0) {
+            readable.on('error', (error: Error) => {
+                if (this.logMode > 0) {
+                    console.error('READ_ERROR ->', error);
                 }
-
-                this.cache = Buffer.concat([this.cache, data]);
-            });
-            // @ts-ignore
-            this.readable.on('end', () => {
-                this.finishedLoading = true;
-                if (this.logMode > 1) {
-                    console.log('COMPLETED_BUFFERING ->', new Date().getTime());
-                    console.log(
-                        'BYTES_STREAM_CACHE_LENGTH ->',
-                        this.cache.length
-                    );
-                    console.log(
-                        'BYTES_LOADED ->',
-                        this.bytesLoaded,
-                        'OF ->',
-                        Stream.getFilesizeInBytes(this.file_path)
-                    );
+                if (this.readable === readable) {
+                    this.endLoading();
                 }
             });
         }
     }
 
-    private static getFilesizeInBytes(path: string) {
-        return statSync(path).size;
+    private endLoading() {
+        if (this.upcoming.length > 0) {
+            this.loadNext();
+        } else {
+            this.finishedLoading = true;
+        }
+    }
+
+    // Stop reading the current readable without destroying it
+    private detach() {
+        if (this.readable !== undefined) {
+            this.readable.removeAllListeners('data');
+            this.readable.removeAllListeners('end');
+            this.readable.pause();
+        }
+    }
+
+    // Read the next queued track right behind the current one, its first
+    // sample directly follows the last one of the current track
+    private loadNext() {
+        const next = this.upcoming.shift()!;
+        this.boundaries.push({ offset: this.cache.writeOffset, id: next.id });
+        this.attach(next.source, next.carry);
+    }
+
+    // Queue a track after the current one and whatever is already queued
+    enqueue(source: string | Readable, id: string) {
+        if (this.stopped) {
+            throw new Error('Cannot enqueue when stopped');
+        }
+        if (this.finished) {
+            // nothing left to play behind, it starts right away
+            this.setReadable(source, id);
+            return;
+        }
+        this.upcoming.push({ id, source });
+        if (this.finishedLoading) {
+            this.finishedLoading = false;
+            this.loadNext();
+        }
+    }
+
+    get queued() {
+        return this.boundaries
+            .map((boundary) => boundary.id)
+            .concat(this.upcoming.map((track) => track.id));
+    }
+
+    // Jump to the next track, returns false when there is none
+    skip() {
+        if (this.boundaries.length > 0) {
+            // already buffered: drop the rest of the current track
+            const boundary = this.boundaries.shift()!;
+            this.cache.skipTo(boundary.offset);
+            this.playFrom(boundary.offset);
+            this.emit('track_changed', boundary.id);
+            return true;
+        }
+        const next = this.upcoming.shift();
+        if (next === undefined) {
+            return false;
+        }
+        this.readable?.destroy();
+        this.readable = undefined;
+        this.cache.clear();
+        this.playFrom(0);
+        this.attach(next.source, next.carry);
+        this.emit('track_changed', next.id);
+        return true;
+    }
+
+    // Forget every queued track, the current one plays to its end
+    clearQueue() {
+        this.upcoming.forEach((track) => {
+            if (typeof track.source !== 'string') {
+                track.source.destroy();
+            }
+        });
+        this.upcoming = [];
+        if (this.boundaries.length > 0) {
+            this.cache.truncate(this.boundaries[0].offset);
+            this.boundaries = [];
+            this.readable?.destroy();
+            this.readable = undefined;
+            this.finishedLoading = true;
+        }
+    }
+
+    private playFrom(offset: number, start: number = 0) {
+        this.trackOffset = offset;
+        this.trackStart = start;
+    }
+
+    // Time in seconds the current track begins at, for a source opened at an
+    // offset before the stream existed, like a session replayed after a crash
+    setStart(start: number) {
+        this.trackStart = start;
+    }
+
+    // Audio buffered ahead of playback
+    get bufferMs() {
+        return (this.cache.length / this.byteLength) * 10;
+    }
+
+    metrics() {
+        return this.counters.report(this.bufferMs);
+    }
+
+    // Seconds into the playing track
+    get position() {
+        const played = Math.max(0, this.cache.readOffset - this.trackOffset);
+        return this.trackStart + played / (this.byteLength * 100);
+    }
+
+    // Local software gain, ramped over rampMs, costs no network request
+    setVolume(volume: number, rampMs: number = 50) {
+        this.gain.set(
+            volume,
+            (rampMs * this.sampleRate * this.channelCount) / 1000
+        );
+    }
+
+    // Whether position is moving right now
+    get playing() {
+        return !this.paused && !this.finished && !this.underrun;
+    }
+
+    // Bytes allocated for this stream's cache, fixed for its whole life
+    get cacheBytes() {
+        return this.cache.capacity;
+    }
+
+    get cacheFill() {
+        return this.cache.length;
     }
 
     private needsBuffering(withPulseCheck = true) {
@@ -123,16 +326,8 @@ export class Stream extends EventEmitter {
             return false;
         }
 
-        const byteLength =
-            ((this.sampleRate * this.bitsPerSample) / 8 / 100) *
-            this.channelCount;
-        let result = this.cache.length < byteLength * 100 * this.buffer_lenght;
-        result =
-            result &&
-            (this.bytesLoaded <
-                Stream.getFilesizeInBytes(this.file_path) -
-                    this.bytesSpeed * 2 ||
-                this.finishedBytes);
+        let result =
+            this.cache.length < this.byteLength * 100 * this.buffer_lenght;
 
         if (this.timePulseBuffer > 0 && withPulseCheck) {
             result = result && this.runningPulse;
@@ -146,10 +341,12 @@ export class Stream extends EventEmitter {
             return false;
         }
 
-        const byteLength =
-            ((this.sampleRate * this.bitsPerSample) / 8 / 100) *
-            this.channelCount;
-        return this.cache.length < byteLength * 100;
+        // stall only once not even a frame is left, then resume from a low
+        // water mark of a second: real-time producers keep less than that
+        // buffered and would otherwise flip in and out of underrun
+        return (
+            this.cache.length < this.byteLength * (this.underrun ? 100 : 1)
+        );
     }
 
     pause() {
@@ -176,8 +373,10 @@ export class Stream extends EventEmitter {
     }
 
     stop() {
-        this.finish();
         this.stopped = true;
+        this.clearQueue();
+        scheduler.remove(this);
+        this.finish();
     }
 
     createTrack() {
@@ -188,132 +387,95 @@ export class Stream extends EventEmitter {
         return this.audioSource;
     }
 
-    private processData() {
-        const oldTime = new Date().getTime();
+    // Buffering bookkeeping, runs every HOUSEKEEPING_TICKS frames
+    private housekeeping() {
+        const now = Date.now();
+
+        if (this.needsBuffering(false)) {
+            let checkBuff = true;
+            if (this.timePulseBuffer > 0) {
+                this.runningPulse =
+                    this.cache.length <
+                    this.byteLength * 100 * this.timePulseBuffer;
+                checkBuff = this.runningPulse;
+            }
+            if (this.readable !== undefined && checkBuff) {
+                if (this.logMode > 1) {
+                    console.error('PULSE ->', this.runningPulse);
+                }
+                this.readable.resume();
+                if (this.logMode > 1) {
+                    console.error('BUFFERING -> ', now);
+                }
+            }
+        }
+
+        if (this.logMode > 1 && this.underrun) {
+            console.error('STREAM_LAG -> ', now);
+            console.error('BYTES_STREAM_CACHE_LENGTH ->', this.cache.length);
+            console.error('BYTES_LOADED ->', this.bytesLoaded);
+        }
+    }
 
+    // Called by the shared scheduler once per 10ms frame, late when it's
+    // catching up on frames it could not send on time
+    tick(late: boolean = false) {
         if (this.stopped) {
             return;
         }
+        this.late = late;
 
-        const byteLength =
-            ((this.sampleRate * this.bitsPerSample) / 8 / 100) *
-            this.channelCount;
-
-        if (
-            !(
-                !this.finished &&
-                this.finishedLoading &&
-                this.cache.length < byteLength
-            )
-        ) {
-            if (this.needsBuffering(false)) {
-                let checkBuff = true;
-                if (this.timePulseBuffer > 0) {
-                    this.runningPulse =
-                        this.cache.length <
-                        byteLength * 100 * this.timePulseBuffer;
-                    checkBuff = this.runningPulse;
-                }
-                if (this.readable !== undefined && checkBuff) {
-                    if (this.logMode > 1) {
-                        console.log('PULSE ->', this.runningPulse);
-                    }
-                    // @ts-ignore
-                    this.readable.resume();
-                    if (this.logMode > 1) {
-                        console.log('BUFFERING -> ', new Date().getTime());
-                    }
-                }
+        if (this.finishedLoading && this.cache.length < this.byteLength) {
+            if (!this.finished) {
+                this.finish();
             }
+            return;
+        }
 
-            const checkLag = this.checkLag();
-            let fileSize: number;
-
-            if (oldTime - this.lastByteCheck > 1000) {
-                fileSize = Stream.getFilesizeInBytes(this.file_path);
-                this.lastByte = fileSize;
-                this.lastByteCheck = oldTime;
-            } else {
-                fileSize = this.lastByte;
-            }
+        this.ticks += 1;
+        if (this.ticks % HOUSEKEEPING_TICKS === 0) {
+            this.housekeeping();
+        }
 
-            if (
-                !this.paused &&
-                !this.finished &&
-                (this.cache.length >= byteLength || this.finishedLoading) &&
-                !checkLag
-            ) {
-                const buffer = this.cache.slice(0, byteLength);
-                const samples = new Int16Array(new Uint8Array(buffer).buffer);
-                this.cache = this.cache.slice(byteLength);
-                try {
-                    this.audioSource.onData({
-                        bitsPerSample: this.bitsPerSample,
-                        sampleRate: this.sampleRate,
-                        channelCount: this.channelCount,
-                        numberOfFrames: samples.length,
-                        samples,
-                    });
-                } catch (error) {
-                    this.emit('error', error);
-                }
-            } else if (checkLag) {
-                if (this.logMode > 1) {
-                    console.log('STREAM_LAG -> ', new Date().getTime());
-                    console.log(
-                        'BYTES_STREAM_CACHE_LENGTH ->',
-                        this.cache.length
-                    );
-                    console.log(
-                        'BYTES_LOADED ->',
-                        this.bytesLoaded,
-                        'OF ->',
-                        fileSize
-                    );
-                }
-            }
+        if (this.paused || this.finished) {
+            return;
+        }
 
-            if (!this.finishedLoading) {
-                if (fileSize === this.lastBytesLoaded) {
-                    if (this.equalCount >= 15) {
-                        this.equalCount = 0;
-                        if (this.logMode > 1) {
-                            console.log('NOT_ENOUGH_BYTES ->', oldTime);
-                        }
-                        this.finishedBytes = true;
-                        // @ts-ignore
-                        this.readable.resume();
-                    } else {
-                        if (oldTime - this.lastLag > 1000) {
-                            this.equalCount += 1;
-                            this.lastLag = oldTime;
-                        }
-                    }
-                } else {
-                    this.lastBytesLoaded = fileSize;
-                    this.equalCount = 0;
-                    this.finishedBytes = false;
-                }
+        if (this.checkLag()) {
+            this.counters.starvedFrames += 1;
+            if (!this.underrun) {
+                this.underrun = true;
+                this.counters.underruns += 1;
+                this.emit('underrun');
             }
+            return;
         }
 
-        if (
-            !this.finished &&
-            this.finishedLoading &&
-            this.cache.length < byteLength
+        const frame = this.cache.readFrame();
+        this.underrun = false;
+        // the frame just read holds samples of the next track
+        while (
+            this.boundaries.length > 0 &&
+            this.cache.readOffset > this.boundaries[0].offset
         ) {
-            this.finish();
+            const boundary = this.boundaries.shift()!;
+            this.playFrom(boundary.offset);
+            this.emit('track_changed', boundary.id);
+        }
+        if (frame !== null) {
+            const samples = this.gain.apply(frame);
+            this.counters.sent(late);
+            try {
+                this.audioSource.onData({
+                    bitsPerSample: this.bitsPerSample,
+                    sampleRate: this.sampleRate,
+                    channelCount: this.channelCount,
+                    numberOfFrames: samples.length,
+                    samples,
+                });
+            } catch (error) {
+                this.emit('error', error);
+            }
         }
-
-        const toSubtract = new Date().getTime() - oldTime;
-        setTimeout(
-            () => this.processData(),
-            (this.finished || this.paused || this.checkLag() ? 500 : 10) -
-                toSubtract
-        );
-    }
-
-    sleep(ms: number) {
-        return new Promise((resolve) => setTimeout(resolve, ms));
     }
 }
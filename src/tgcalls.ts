@@ -1,7 +1,6 @@
 import { EventEmitter } from 'events';
-import { RTCPeerConnection } from 'wrtc';
 import { SdpBuilder } from './sdp-builder';
-import { parseSdp } from './utils';
+import { PreparedOffer } from './offer-pool';
 import { JoinVoiceCallCallback } from './types';
 
 export { Stream } from './stream';
@@ -18,7 +17,7 @@ export class TGCalls<T> extends EventEmitter {
         this.#params = params;
     }
 
-    async start(track: MediaStreamTrack): Promise<boolean> {
+    async start(prepared: PreparedOffer): Promise<boolean> {
         if (this.#connection) {
             throw new Error('Connection already started');
         } else if (!this.joinVoiceCall) {
@@ -27,7 +26,7 @@ export class TGCalls<T> extends EventEmitter {
             );
         }
 
-        this.#connection = new RTCPeerConnection();
+        this.#connection = prepared.connection;
         this.#connection.oniceconnectionstatechange = async () => {
             this.emit(
                 'iceConnectionState',
@@ -42,20 +41,7 @@ export class TGCalls<T> extends EventEmitter {
             }
         };
 
-        this.#connection.addTrack(track);
-
-        const offer = await this.#connection.createOffer({
-            offerToReceiveVideo: false,
-            offerToReceiveAudio: true,
-        });
-
-        await this.#connection.setLocalDescription(offer);
-
-        if (!offer.sdp) {
-            return false;
-        }
-
-        const { ufrag, pwd, hash, fingerprint, source } = parseSdp(offer.sdp);
+        const { ufrag, pwd, hash, fingerprint, source } = prepared.sdp;
 
         if (!ufrag || !pwd || !hash || !fingerprint || !source) {
             return false;
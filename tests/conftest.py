@@ -0,0 +1,53 @@
+import os
+import shutil
+import asyncio
+import subprocess
+
+from typing import Any, Awaitable, Callable, List, Optional
+
+import pytest
+
+from pytgcalls import js_core
+from pytgcalls.js_core import JSCore
+
+from benchmarks.fakes import core_command
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIST = os.path.join(ROOT, 'pytgcalls', 'dist')
+
+def needs_core(script:str, wrtc:bool = False) -> pytest.MarkDecorator:
+    """Skips unless the compiled NodeJS core has script (`npm run build`), and wrtc loads when it's needed"""
+    if shutil.which('node') is None or not os.path.isfile(os.path.join(DIST, script)):
+        return pytest.mark.skip(reason="needs the compiled core, run `npm run build`")
+    if wrtc and subprocess.run(['node', '-e', "require('wrtc')"], cwd=ROOT, capture_output=True).returncode != 0:
+        return pytest.mark.skip(reason="needs wrtc, run `npm install`")
+    return pytest.mark.skipif(False, reason='')
+
+def _run(test:Callable[[], Awaitable], command:Optional[List[str]], workers:int = 1) -> None:
+    async def main():
+        try:
+            await test()
+        finally:
+            for worker in js_core.instance().workers:
+                if worker.running:
+                    await worker._stop()
+    js_core._instance = JSCore(workers=workers, command=command)
+    try:
+        asyncio.run(main())
+    finally:
+        js_core._instance = None
+
+@pytest.fixture
+def core() -> Callable[..., None]:
+    """Runs a coroutine function on a fresh loop, against a JSCore of workers fake cores (see benchmarks.fakes),
+    other keyword arguments go to core_command"""
+    def run(test:Callable[[], Awaitable], workers:int = 1, **command:Any) -> None:
+        _run(test, core_command(**{'join_ms': 10, **command}), workers)
+    return run
+
+@pytest.fixture
+def node_core() -> Callable[[Callable[[], Awaitable]], None]:
+    """Like core, against 1 compiled NodeJS core, tests using it need needs_core('index.js', wrtc=True)"""
+    def run(test:Callable[[], Awaitable]) -> None:
+        _run(test, None)
+    return run
@@ -0,0 +1,52 @@
+import os
+import json
+import subprocess
+
+from .conftest import DIST, needs_core
+
+# streams 10s of 16 bit samples counting up through a ring of 1s, written in chunks that aren't whole frames
+# and read a frame at a time, checking every sample and that frames are views over the ring
+PIPE_THROUGH = """
+const { AudioRing } = require(process.argv[1]);
+const frameSize = 960;
+const ring = new AudioRing(96000 - 100, frameSize);
+const total = 960000;
+const input = Buffer.alloc(total);
+for (let i = 0; i < total / 2; i++) {
+    input.writeUInt16LE(i % 65536, i * 2);
+}
+let written = 0, expected = 0, wrong = 0, frames = 0;
+const views = new Set();
+while (expected < total / 2) {
+    while (written < total) {
+        const taken = ring.write(input.subarray(written, written + 4099));
+        if (taken === 0) {
+            break;
+        }
+        written += taken;
+    }
+    let frame;
+    while ((frame = ring.readFrame()) !== null) {
+        views.add(frame);
+        frames += 1;
+        for (const sample of frame) {
+            wrong += sample !== (expected % 65536 << 16 >> 16) ? 1 : 0;
+            expected += 1;
+        }
+    }
+}
+console.log(JSON.stringify({ capacity: ring.capacity, frames, wrong, views: views.size, left: ring.length }));
+"""
+
+@needs_core('audio-ring.js')
+def test_ring_hands_out_every_sample_in_order():
+    res = subprocess.run(
+        ['node', '-e', PIPE_THROUGH, os.path.join(DIST, 'audio-ring.js')], capture_output=True, check=True, timeout=30,
+    )
+    assert json.loads(res.stdout) == {
+        'capacity': 96000, # rounded up to whole frames
+        'frames': 1000,
+        'wrong': 0,
+        'views': 100, # one per frame of the ring, reused: reading allocates nothing
+        'left': 0,
+    }
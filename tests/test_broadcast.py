@@ -0,0 +1,74 @@
+import os
+import json
+import subprocess
+import tempfile
+
+import pytest
+
+from pytgcalls import js_core
+from pytgcalls.broadcast import Broadcast
+from pytgcalls.groupcall import GroupCall
+from pytgcalls.node_worker import InvalidState
+
+from benchmarks.fakes import FakeClient
+
+from .conftest import DIST, needs_core
+from .test_groupcall import CHAT_ID, silence
+
+def test_subscribers_join_the_broadcast_worker(core):
+    async def test():
+        with silence(10) as source:
+            jsc = js_core.instance()
+            await jsc.init('other') # the first worker is busier from now on
+            broadcast = Broadcast(source.name)
+            await broadcast.start()
+            calls = [ GroupCall(FakeClient(), CHAT_ID - i) for i in range(3) ]
+            for call in calls:
+                await call.join_group_call(broadcast)
+            assert all( jsc.worker(call.sid) is jsc.worker(broadcast.sid) for call in calls )
+            assert jsc.worker(broadcast.sid) is not jsc.worker('other')
+
+            await calls[0].pause_stream()
+            await calls[1].leave_group_call()
+            assert not calls[2].paused and calls[2].state == 'playing'
+            with pytest.raises(InvalidState):
+                await calls[2].change_stream(source.name)
+            await calls[0].leave_group_call()
+            await calls[2].leave_group_call()
+            await broadcast.stop()
+            await jsc.clear('other')
+    core(test, workers=2)
+
+# one broadcast of a track holding a single sample value, fanned out to 3 fake audio sources: the first is paused
+# half way, the second at half volume, the third unsubscribes half way
+FAN_OUT = """
+const { Broadcast } = require(process.argv[1]);
+const received = [[], [], []];
+const sink = (i) => ({ createTrack() {}, onData({ samples }) { received[i].push(samples[samples.length - 1]); } });
+const broadcast = new Broadcast('broadcast', process.argv[2], 48000, 0, 10);
+const subs = [0, 1, 2].map((i) => broadcast.subscribe(sink(i)));
+subs[1].setVolume(0.5, 0);
+setTimeout(() => { subs[0].pause(); subs[2].stop(); }, 500);
+broadcast.on('finish', () => {
+    const result = { sent: broadcast.stream.counters.framesSent, subscribers: broadcast.subscriberCount, received };
+    process.stdout.write(JSON.stringify(result) + '\\n', () => process.exit(0));
+});
+"""
+
+@needs_core('broadcast.js', wrtc=True)
+def test_one_stream_feeds_every_subscriber():
+    fd, path = tempfile.mkstemp(prefix='pytgcalls-test-', suffix='.pcm')
+    with os.fdopen(fd, 'wb') as f:
+        f.write((1000).to_bytes(2, 'little') * 48000) # 1s
+    try:
+        res = subprocess.run(
+            ['node', '-e', FAN_OUT, os.path.join(DIST, 'broadcast.js'), path], capture_output=True, check=True, timeout=30,
+        )
+    finally:
+        os.unlink(path)
+    result = json.loads(res.stdout)
+    first, half, gone = result['received']
+    assert result['sent'] == 100 and result['subscribers'] == 2 # read and paced once
+    assert len(half) == 100 and set(half) == {500} # its own volume
+    assert 20 < len(first) < 80 and set(first) == {1000} # paused half way, the others went on
+    assert 20 < len(gone) < 80 and set(gone) == {1000}
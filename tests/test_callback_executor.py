@@ -0,0 +1,80 @@
+import time
+import asyncio
+import logging
+import threading
+
+from typing import Dict, List, Tuple
+
+from pytgcalls.callback_executor import CallbackExecutor
+
+async def drained(executor:CallbackExecutor) -> None:
+    while executor.pending or executor.stats()['workers']:
+        await asyncio.sleep(0.01)
+
+def test_bounded_and_ordered_per_session():
+    async def test():
+        executor = CallbackExecutor(workers=4)
+        seen : Dict[str, List[int]] = {}
+        running, most = 0, 0
+        async def handler(packet:dict) -> None:
+            nonlocal running, most
+            running += 1
+            most = max(most, running)
+            await asyncio.sleep(0.001 * (packet['n'] % 3)) # later events of a session may be quicker
+            seen.setdefault(packet['sid'], []).append(packet['n'])
+            running -= 1
+        for n in range(50):
+            for sid in ('a', 'b', 'c', 'd', 'e', 'f'):
+                executor.submit(sid, 'ended_stream', [handler], {'sid': sid, 'n': n})
+        assert executor.stats()['workers'] == 4 # not a task per callback
+        await drained(executor)
+        assert seen == { sid: list(range(50)) for sid in 'abcdef' }
+        assert most == 4 # sessions ran in parallel, within the bound
+        stats = executor.stats()
+        assert stats['max_pending'] == 300 and stats['queue_delay']['count'] == 300
+        assert [ (name.split(':')[0], h['count']) for name, h in stats['handlers'].items() ] == [('ended_stream', 300)]
+    asyncio.run(test())
+
+def test_errors_and_slow_handlers_are_reported(caplog):
+    async def test():
+        executor = CallbackExecutor(workers=2, slow=0.05)
+        async def failing(packet:dict) -> None:
+            raise ValueError('broken handler')
+        async def slow(packet:dict) -> None:
+            await asyncio.sleep(0.1)
+        after : List[str] = []
+        async def later(packet:dict) -> None:
+            after.append(packet['sid'])
+        executor.submit('a', 'pause', [failing, later], {'sid': 'a'})
+        executor.submit('b', 'pause', [slow, later], {'sid': 'b'})
+        await drained(executor)
+        assert sorted(after) == ['a', 'b'] # a failing handler doesn't skip the others
+        stats = executor.stats()
+        assert stats['errors'] == 1 and stats['slow_calls'] == 1
+    with caplog.at_level(logging.WARNING, logger='pytgcalls.callback_executor'):
+        asyncio.run(test())
+    assert 'broken handler' in caplog.text and 'later events of it waited' in caplog.text
+
+def test_sync_handlers_run_in_threads():
+    async def test():
+        executor = CallbackExecutor(workers=4, threads=4)
+        threads : List[Tuple[str, str]] = []
+        def blocking(packet:dict) -> None:
+            time.sleep(0.1)
+            threads.append((packet['sid'], threading.current_thread().name))
+        ticks = 0
+        async def ticker() -> None:
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+        task = asyncio.get_event_loop().create_task(ticker())
+        start = time.monotonic()
+        for sid in 'abcd':
+            executor.submit(sid, 'kicked', [blocking], {'sid': sid})
+        await drained(executor)
+        task.cancel()
+        assert time.monotonic() - start < 0.3 # in parallel, not 4 x 0.1s
+        assert ticks >= 5 # the loop went on meanwhile
+        assert all( name.startswith('pytgcalls-callback') for _, name in threads )
+    asyncio.run(test())
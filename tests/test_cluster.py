@@ -0,0 +1,46 @@
+import asyncio
+
+from pyrogram.raw.types import InputPeerChannel
+
+from pytgcalls import js_core
+from pytgcalls.cluster import Cluster
+
+from benchmarks.fakes import FakeClient
+
+from .test_groupcall import CHAT_ID, silence
+
+def test_moved_call_keeps_its_state(core):
+    async def test():
+        with silence(10) as source:
+            cluster = Cluster([FakeClient(user_id=1), FakeClient(user_id=2)], move_after=30)
+            join_as = InputPeerChannel(channel_id=1000000002, access_hash=0)
+            await cluster.join_group_call(CHAT_ID, source.name, join_as=join_as)
+            flooded = cluster.placement[CHAT_ID]
+            await cluster.set_local_volume(CHAT_ID, 0.5)
+            await cluster.pause_stream(CHAT_ID)
+            position = cluster.position(CHAT_ID)
+            assert position < 1.0
+
+            flooded.limiter.flood(300)
+            while cluster.placement[CHAT_ID] is flooded or flooded.evacuating:
+                await asyncio.sleep(0.01)
+            call = cluster.calls[CHAT_ID]
+            assert call.paused and call.local_volume == 0.5
+            assert call.join_as is join_as
+            assert abs(cluster.position(CHAT_ID) - position) < 0.05
+            assert not flooded.calls
+            await cluster.leave_group_call(CHAT_ID)
+    core(test)
+
+def test_flooded_join_is_placed_again(core):
+    async def test():
+        with silence(10) as source:
+            first, second = FakeClient(user_id=1), FakeClient(user_id=2)
+            first.floods['JoinGroupCall'] = 60
+            cluster = Cluster([first, second])
+            await cluster.join_group_call(CHAT_ID, source.name)
+            assert cluster.account(CHAT_ID) is second
+            assert not cluster.accounts[0].calls
+            assert list(js_core.instance().workers[0].sessions) == [cluster.calls[CHAT_ID].sid]
+            await cluster.leave_group_call(CHAT_ID)
+    core(test)
@@ -0,0 +1,62 @@
+import asyncio
+
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+
+from pytgcalls import js_core
+from pytgcalls.codec import CodecException, JsonLinesCodec, MsgpackCodec
+from pytgcalls.node_worker import NodeWorker
+
+def test_oversized_line_is_skipped():
+    async def test():
+        codec = JsonLinesCodec()
+        stream = asyncio.StreamReader(limit=64)
+        stream.feed_data(codec.encode({'big': 'x' * 100}) + codec.encode({'ok': 1}))
+        stream.feed_eof()
+        with pytest.raises(CodecException):
+            await codec.read(stream)
+        assert await codec.read(stream) == {'ok': 1}
+        assert await codec.read(stream) is None
+    asyncio.run(test())
+
+def test_msgpack_frames_split_anywhere():
+    pytest.importorskip('msgpack')
+    async def test():
+        codec = MsgpackCodec()
+        packets = [{'sid': 'a', 'pid': 1, 'data': b'\n\x00\xff', 'text': 'été'}, {'sid': 'b', 'pid': 2}]
+        data = b''.join(codec.encode(p) for p in packets)
+        stream = asyncio.StreamReader()
+        for i in range(0, len(data), 3): # the header of a frame and its body come in pieces
+            stream.feed_data(data[i:i + 3])
+        stream.feed_eof()
+        assert await codec.read(stream) == packets[0]
+        assert await codec.read(stream) == packets[1]
+        assert await codec.read(stream) is None
+    asyncio.run(test())
+
+def test_sends_of_one_iteration_are_one_write():
+    async def test():
+        writes : List[bytes] = []
+        async def drain() -> None:
+            pass
+        worker = NodeWorker()
+        worker.proc = SimpleNamespace(stdin=SimpleNamespace(write=writes.append, drain=drain))
+        await asyncio.gather(*(worker._send({'action': 'pause', 'sid': str(i)}) for i in range(50)))
+        assert len(writes) == 1
+        assert writes[0].count(b'\n') == 50
+        await worker._send({'action': 'resume', 'sid': '0'})
+        assert len(writes) == 2
+    asyncio.run(test())
+
+def test_commands_over_msgpack(core):
+    pytest.importorskip('msgpack')
+    async def test():
+        jsc = js_core.instance()
+        jsc.set_codec('msgpack')
+        sid = await jsc.init('session')
+        acks = await asyncio.gather(*(jsc.send(sid, {'action': 'stats'}) for _ in range(20)))
+        assert all('cache_bytes' in ack for ack in acks)
+        await jsc.clear(sid)
+    core(test)
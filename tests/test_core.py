@@ -0,0 +1,32 @@
+import asyncio
+
+from pytgcalls.groupcall import GroupCall
+
+from benchmarks.fakes import FakeClient
+
+from .conftest import needs_core
+from .test_groupcall import CHAT_ID, silence
+
+@needs_core('index.js', wrtc=True)
+def test_join_and_play(node_core):
+    """A join goes through the NodeJS core and back over stdio only: its join_call request reaches the client,
+    then the core plays the file and reports it in its status packets"""
+    async def test():
+        with silence(10) as source:
+            client = FakeClient()
+            call = GroupCall(client, CHAT_ID)
+            await call.join_group_call(source.name)
+            assert call.state == 'playing'
+            assert client.requests['JoinGroupCall'] == 1
+
+            await asyncio.sleep(2.5) # at least 2 status reports
+            assert call.metrics()['frames_sent'] >= 100
+            assert 1.5 < call.position < 3.5
+            await call.pause_stream()
+            await asyncio.sleep(1.2) # a report made since the pause
+            paused_at = call.metrics()['frames_sent']
+            await asyncio.sleep(1.2)
+            assert call.metrics()['frames_sent'] == paused_at
+            await call.leave_group_call()
+            assert client.requests['LeaveGroupCall'] == 1
+    node_core(test)
@@ -0,0 +1,81 @@
+import os
+import sys
+import asyncio
+import tempfile
+
+from typing import Iterator, List
+
+import pytest
+
+from pytgcalls.decoder import PLAYING, PREFETCH, DecoderError, DecoderPool
+
+# stands for ffmpeg: "decodes" its input by copying it out slowly, and reports its cpu time like -benchmark does
+FFMPEG = """#!{python}
+import sys, time
+path = sys.argv[sys.argv.index('-i') + 1]
+try:
+    data = open(path, 'rb').read()
+except OSError as e:
+    sys.stderr.write(f'{{path}}: {{e.strerror}}\\n')
+    sys.exit(1)
+for i in range(0, len(data), 4096):
+    time.sleep(0.01)
+    sys.stdout.buffer.write(data[i:i + 4096])
+    sys.stdout.flush()
+sys.stderr.write('bench: utime=0.010s stime=0.005s rtime=0.100s\\n')
+"""
+
+@pytest.fixture
+def ffmpeg() -> Iterator[str]:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ffmpeg')
+        with open(path, 'w') as f:
+            f.write(FFMPEG.format(python=sys.executable))
+        os.chmod(path, 0o755)
+        yield path
+
+def source(size:int) -> tempfile.NamedTemporaryFile:
+    f = tempfile.NamedTemporaryFile(suffix='.mp3')
+    f.write(os.urandom(size))
+    f.flush()
+    return f
+
+async def read(pool:DecoderPool, path:str, priority:int, order:List[str], name:str) -> bytes:
+    out = b''
+    async for chunk in pool.decode(path, priority=priority):
+        if not out:
+            order.append(name)
+        out += chunk
+    return out
+
+def test_decodes_are_capped_and_playing_goes_first(ffmpeg):
+    async def test():
+        with source(16384) as f:
+            pool = DecoderPool(max_decoders=1, ffmpeg=ffmpeg)
+            order : List[str] = []
+            first = asyncio.get_event_loop().create_task(read(pool, f.name, PLAYING, order, 'first'))
+            await asyncio.sleep(0) # holds the only slot
+            prefetch = asyncio.get_event_loop().create_task(read(pool, f.name, PREFETCH, order, 'prefetch'))
+            await asyncio.sleep(0)
+            playing = asyncio.get_event_loop().create_task(read(pool, f.name, PLAYING, order, 'playing'))
+            await asyncio.sleep(0.02)
+            assert pool.stats()['running'] == 1 and pool.stats()['waiting'] == 2
+            outputs = await asyncio.gather(first, prefetch, playing)
+            assert order == ['first', 'playing', 'prefetch']
+            f.seek(0)
+            assert outputs == [f.read()] * 3 # streamed whole
+            stats = pool.stats()
+            assert stats['running'] == 0 and stats['decodes'] == 3 and stats['failures'] == 0
+            assert abs(stats['cpu_seconds'] - 0.045) < 1e-9
+            assert stats['queue_wait_max'] > 0.04 # the last one waited for 2 decodes of 4 chunks
+    asyncio.run(test())
+
+def test_failed_decode_frees_its_slot(ffmpeg):
+    async def test():
+        pool = DecoderPool(max_decoders=1, ffmpeg=ffmpeg)
+        with pytest.raises(DecoderError, match='No such file'):
+            await read(pool, '/nonexistent/missing.mp3', PLAYING, [], 'missing')
+        assert pool.stats()['failures'] == 1 and pool.running == 0
+        with source(4096) as f:
+            assert len(await read(pool, f.name, PLAYING, [], 'next')) == 4096
+    asyncio.run(test())
@@ -0,0 +1,48 @@
+import asyncio
+
+from pyrogram.raw.types import GroupCallDiscarded, UpdateGroupCall
+
+from pytgcalls.dispatcher import MAX_CHANNEL_ID, UpdateDispatcher
+from pytgcalls.groupcall import GroupCall
+
+from benchmarks.fakes import FakeClient
+
+from .test_groupcall import CHAT_ID, silence
+
+class RecordingCall(GroupCall):
+    closed : bool = False
+
+    async def _on_closed(self) -> None:
+        self.closed = True
+
+def test_updates_reach_only_their_call():
+    async def test():
+        client = FakeClient()
+        calls = [ GroupCall(client, CHAT_ID - i) for i in range(3) ]
+        await asyncio.gather(*(call.initialized.wait() for call in calls))
+        assert len(client.handlers) == 1 # one dispatcher for the client, not a handler per call
+        await client.emit(client.group_call_update(CHAT_ID - 1, version=7))
+        assert [ call.call.access_hash for call in calls ] == [0, 7, 0]
+        await client.emit(client.group_call_update(CHAT_ID - 10, version=8)) # nobody's chat
+        assert [ call.call.access_hash for call in calls ] == [0, 7, 0]
+    asyncio.run(test())
+
+def test_left_call_is_unregistered(core):
+    async def test():
+        with silence(10) as source:
+            client = FakeClient()
+            call = GroupCall(client, CHAT_ID)
+            await call.join_group_call(source.name)
+            await call.leave_group_call()
+            dispatcher = UpdateDispatcher.for_client(client)
+            assert CHAT_ID not in dispatcher.calls
+            # a later call in the same chat isn't dropped by the former one leaving again
+            later = RecordingCall(client, CHAT_ID)
+            dispatcher.unregister(call)
+            assert dispatcher.calls[CHAT_ID] is later
+            await client.emit(UpdateGroupCall(
+                chat_id=MAX_CHANNEL_ID - CHAT_ID, call=GroupCallDiscarded(id=1, access_hash=1, duration=1),
+            ))
+            assert later.closed
+            await later.initialized.wait()
+    core(test)
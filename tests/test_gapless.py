@@ -0,0 +1,65 @@
+import os
+import json
+import asyncio
+import tempfile
+
+from .conftest import DIST, needs_core
+
+BYTES_PER_SEC = 48000 * 2 # 48kHz 16 bit mono
+
+# plays first then the enqueued second through a fake audio source, every track holds a single sample value so
+# each frame is known to come from one of them. Reports the ticks without a frame between the two
+PLAYER = """
+const { Stream } = require(process.argv[1]);
+const [first, second] = process.argv.slice(2);
+let firstFrames = 0, secondFrames = 0, other = 0, starvedAtSwitch = -1, silent = -1;
+const audioSource = {
+    createTrack() {},
+    onData({ samples }) {
+        if (samples[0] === 1000 && samples[samples.length - 1] === 1000 && secondFrames === 0) {
+            firstFrames += 1;
+            starvedAtSwitch = stream.counters.starvedFrames;
+        } else if (samples[0] === 2000 && samples[samples.length - 1] === 2000 && firstFrames > 0) {
+            if (secondFrames === 0) {
+                silent = stream.counters.starvedFrames - starvedAtSwitch;
+            }
+            secondFrames += 1;
+        } else {
+            other += 1;
+        }
+    },
+};
+const stream = new Stream(first, 16, 48000, 1, 0, 10, 0, audioSource);
+stream.enqueue(second, 'second');
+stream.on('finish', () => {
+    const result = { firstFrames, secondFrames, other, silent };
+    process.stdout.write(JSON.stringify(result) + '\\n', () => process.exit(0));
+});
+"""
+
+def write_track(value:int, seconds:float) -> str:
+    fd, path = tempfile.mkstemp(prefix='pytgcalls-test-', suffix='.pcm')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(value.to_bytes(2, 'little', signed=True) * int(BYTES_PER_SEC * seconds / 2))
+    return path
+
+@needs_core('stream.js', wrtc=True)
+def test_no_silence_between_queued_tracks():
+    """The first frame of an enqueued track is sent on the tick right after the last frame of the playing one"""
+    async def test():
+        first, second = write_track(1000, 1.0), write_track(2000, 1.0) # whole frames, none mixes both tracks
+        proc = await asyncio.create_subprocess_exec(
+            'node', '-e', PLAYER, os.path.join(DIST, 'stream.js'), first, second,
+            stdout=asyncio.subprocess.PIPE,
+        )
+        assert proc.stdout is not None # piped
+        try:
+            line = await asyncio.wait_for(proc.stdout.readline(), 30)
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+            await proc.wait()
+            os.unlink(first)
+            os.unlink(second)
+        assert json.loads(line) == {'firstFrames': 100, 'secondFrames': 100, 'other': 0, 'silent': 0}
+    asyncio.run(test())
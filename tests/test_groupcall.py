@@ -0,0 +1,50 @@
+import tempfile
+
+import pytest
+
+from pytgcalls import PyTgCalls, js_core
+from pytgcalls.groupcall import GroupCall, JoinError
+
+from benchmarks.fakes import FakeClient
+
+CHAT_ID = -1001000000001
+
+def silence(seconds:int) -> tempfile.NamedTemporaryFile:
+    source = tempfile.NamedTemporaryFile(suffix='.raw')
+    source.write(bytes(48000 * 2 * seconds))
+    source.flush()
+    return source
+
+def test_position_after_join(core):
+    async def test():
+        with silence(10) as source:
+            call = GroupCall(FakeClient(), CHAT_ID)
+            await call.join_group_call(source.name)
+            assert 0.0 <= call.position < 0.5
+            await call.leave_group_call()
+    core(test)
+
+def test_position_after_join_from_start(core):
+    async def test():
+        with silence(10) as source:
+            call = GroupCall(FakeClient(), CHAT_ID)
+            await call.join_group_call(source.name, start=3.0)
+            assert 3.0 <= call.position < 3.5
+            await call.pause_stream()
+            assert 3.0 <= call.position < 3.5
+            await call.leave_group_call()
+    core(test)
+
+def test_failed_join_leaves_nothing(core):
+    async def test():
+        with silence(10) as source:
+            client = FakeClient()
+            client.floods['JoinGroupCall'] = 60
+            pytgcalls = PyTgCalls(client)
+            with pytest.raises(JoinError):
+                await pytgcalls.join_group_call(CHAT_ID, source.name)
+            assert pytgcalls.calls == {}
+            worker = js_core.instance().workers[0]
+            assert worker.sessions == {}
+            assert not worker.running
+    core(test)
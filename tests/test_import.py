@@ -0,0 +1,41 @@
+import sys
+import json
+import subprocess
+
+# imports the package in a fresh interpreter and reports what it started meanwhile
+PROBE = """
+import sys, json, asyncio, threading
+import pyrogram # sets up an event loop on its own
+loop = asyncio.get_event_loop()
+spawned = []
+sys.addaudithook(lambda event, args: event in ('subprocess.Popen', 'os.posix_spawn', 'os.fork', 'os.exec') and spawned.append(event))
+import pytgcalls
+from pytgcalls import js_core
+print(json.dumps({
+    'spawned': len(spawned),
+    'core': js_core._instance is not None,
+    'tasks': len(asyncio.all_tasks(loop)),
+    'callbacks': len(loop._ready) + len(loop._scheduled),
+    'threads': threading.active_count(),
+}))
+"""
+
+def probe() -> dict:
+    proc = subprocess.run(
+        [sys.executable, '-c', PROBE], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+    )
+    assert proc.returncode == 0, proc.stderr
+    return json.loads(proc.stdout.splitlines()[-1])
+
+def test_import_starts_nothing():
+    started = probe()
+    assert started['spawned'] == 0
+    assert not started['core']
+    assert started['tasks'] == 0
+    assert started['callbacks'] == 0
+    assert started['threads'] == 1
+
+def test_public_names():
+    import pytgcalls
+    for name in pytgcalls.__all__:
+        assert getattr(pytgcalls, name) is not None
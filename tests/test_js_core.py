@@ -0,0 +1,20 @@
+from pytgcalls import js_core
+
+def test_sessions_spread_and_stay_pinned(core):
+    async def test():
+        jsc = js_core.instance()
+        sids = [ await jsc.init(f'session{i}') for i in range(4) ]
+        first, second = jsc.workers
+        assert [ jsc.worker(sid) for sid in sids ] == [first, second, first, second]
+        assert first.running and second.running and first.proc.pid != second.proc.pid
+        for sid in sids: # every command goes to the worker the session is pinned to
+            assert 'cache_bytes' in await jsc.send(sid, {'action': 'stats'})
+            assert sid in jsc.worker(sid).rtt
+
+        await jsc.clear(sids[0])
+        assert await jsc.init('session4') and jsc.worker('session4') is first # the least loaded again
+        assert jsc.worker(sids[2]) is first and jsc.worker(sids[3]) is second
+        for sid in sids[1:] + ['session4']:
+            await jsc.clear(sid)
+        assert not first.running and not second.running # an empty worker stops
+    core(test, workers=2)
@@ -0,0 +1,80 @@
+import os
+import json
+import time
+import base64
+import asyncio
+import tempfile
+
+from typing import List
+
+from benchmarks.ipc_codec import percentile
+
+from .conftest import DIST, needs_core
+
+BYTES_PER_SEC = 48000 * 2 # 48kHz 16 bit mono
+CHUNK_MS = 20
+
+# reads a file still being written like a live ffmpeg output, finish() once a line comes on stdin
+READER = """
+const { LiveFileSource } = require(process.argv[1]);
+const source = new LiveFileSource(process.argv[2]);
+source.on('data', (chunk) => process.stdout.write(JSON.stringify({ data: chunk.toString('base64') }) + '\\n'));
+source.on('end', () => process.stdout.write(JSON.stringify({ end: true }) + '\\n', () => process.exit(0)));
+process.stdin.on('data', () => source.finish());
+setImmediate(() => process.stdout.write(JSON.stringify({ ready: true }) + '\\n'));
+"""
+
+@needs_core('live-file.js')
+def test_growing_file_is_read_as_written():
+    """A file written at real time pace is read whole and in order, each chunk picked up quickly, and it ends as
+    soon as the end of input is signalled instead of once it stopped growing for a while"""
+    async def test():
+        fd, path = tempfile.mkstemp(prefix='pytgcalls-test-', suffix='.pcm')
+        os.close(fd)
+        proc = await asyncio.create_subprocess_exec(
+            'node', '-e', READER, os.path.join(DIST, 'live-file.js'), path,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+        )
+        assert proc.stdin is not None and proc.stdout is not None # both piped
+        chunks = [ bytes([i]) * (BYTES_PER_SEC * CHUNK_MS // 1000) for i in range(50) ] # 1s, every chunk distinct
+        written : List[float] = [] # when each chunk became available
+        pickups : List[float] = []
+        received = bytearray()
+        end = 0.0
+
+        async def reader() -> None:
+            nonlocal end
+            async for line in proc.stdout:
+                now = time.perf_counter()
+                packet = json.loads(line)
+                if packet.get('end'):
+                    end = now
+                    return
+                received.extend(base64.b64decode(packet['data']))
+                # every chunk completed by this read waited since it was written
+                done = len(received) // len(chunks[0])
+                while len(pickups) < min(done, len(written)):
+                    pickups.append(now - written[len(pickups)])
+
+        try:
+            await proc.stdout.readline() # don't count NodeJS startup
+            task = asyncio.get_event_loop().create_task(reader())
+            with open(path, 'ab', buffering=0) as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    written.append(time.perf_counter())
+                    await asyncio.sleep(CHUNK_MS / 1000)
+            finished = time.perf_counter()
+            proc.stdin.write(b'finish\n')
+            await proc.stdin.drain()
+            await asyncio.wait_for(task, 10)
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+            await proc.wait()
+            os.unlink(path)
+        assert bytes(received) == b''.join(chunks)
+        assert len(pickups) == len(chunks)
+        assert percentile(pickups, 0.99) < 0.1
+        assert end - finished < 0.5
+    asyncio.run(test())
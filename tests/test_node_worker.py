@@ -0,0 +1,78 @@
+import time
+import asyncio
+import logging
+
+from typing import List
+
+import pytest
+
+from pytgcalls import js_core
+from pytgcalls.node_worker import CoreDied, RequestTimeout
+
+def test_unsent_response_is_logged(core, caplog):
+    async def test():
+        jsc = js_core.instance()
+        sid = await jsc.init('session')
+        async def handler(data:dict) -> object:
+            return object() # can't be encoded
+        jsc.handle(sid, 'join_call')(handler)
+        await jsc.worker(sid)._handle_request({'request': 'join_call', 'data': {}}, sid, 1)
+        assert 'cache_bytes' in await jsc.send(sid, {'action': 'stats'}) # the worker goes on
+        await jsc.clear(sid)
+    with caplog.at_level(logging.ERROR, logger='pytgcalls.node_worker'):
+        core(test)
+    assert "Could not answer request 'join_call'" in caplog.text
+
+def test_timed_out_and_cancelled_commands_leave_nothing(core):
+    async def test():
+        jsc = js_core.instance()
+        sid = await jsc.init('session')
+        worker = jsc.worker(sid)
+        with pytest.raises(RequestTimeout):
+            await jsc.send(sid, {'action': 'stats'}, timeout=0.1)
+        task = asyncio.get_event_loop().create_task(jsc.send(sid, {'action': 'stats'}))
+        await asyncio.sleep(0.1)
+        assert len(worker.waiting) == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert 'cache_bytes' in await jsc.send(sid, {'action': 'stats'})
+        assert not worker.waiting
+        await jsc.clear(sid)
+    core(test, ack_ms=300)
+
+def test_commands_fail_fast_when_the_core_dies(core):
+    async def test():
+        jsc = js_core.instance()
+        sid = await jsc.init('session')
+        start = time.monotonic()
+        results = await asyncio.gather(
+            jsc.send(sid, {'action': 'stats'}), jsc.send(sid, {'action': 'stats'}), return_exceptions=True,
+        )
+        assert all(isinstance(r, CoreDied) for r in results)
+        assert time.monotonic() - start < 1.0 # long before the 30s deadline and the 5s ack
+        worker = jsc.worker(sid)
+        assert not worker.waiting
+        await worker.wait_recovered() # restarted, with nothing to replay the session with
+        assert jsc.state(sid) == 'lost'
+        await jsc.clear(sid)
+    core(test, ack_ms=5000, crash_after=1)
+
+def test_inflight_commands_are_capped(core):
+    async def test():
+        jsc = js_core.instance()
+        jsc.max_inflight_session = 2
+        sid = await jsc.init('session')
+        worker = jsc.worker(sid)
+        inflight : List[int] = []
+        async def sample() -> None:
+            while True:
+                inflight.append(len(worker.waiting))
+                await asyncio.sleep(0.01)
+        sampler = asyncio.get_event_loop().create_task(sample())
+        acks = await asyncio.gather(*(jsc.send(sid, {'action': 'stats'}) for _ in range(6)))
+        sampler.cancel()
+        assert len(acks) == 6
+        assert max(inflight) == 2 # the others waited for a slot
+        await jsc.clear(sid)
+    core(test, ack_ms=100)
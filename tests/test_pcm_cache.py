@@ -0,0 +1,127 @@
+import os
+import fcntl
+import asyncio
+import tempfile
+
+import pytest
+
+from pytgcalls.decoder import DecoderError
+from pytgcalls.pcm_cache import PcmCache
+
+class Decoders:
+    """Stands for the ffmpeg pool, fails the next fail decodes after writing a chunk"""
+    def __init__(self, fail:int = 0):
+        self.fail = fail
+        self.decodes = 0
+
+    async def decode(self, source, sample_rate, priority, channels):
+        self.decodes += 1
+        yield bytes(960)
+        await asyncio.sleep(0)
+        if self.fail:
+            self.fail -= 1
+            raise DecoderError("ffmpeg exited with 1")
+        yield bytes(960)
+
+def test_failed_decode_is_not_cached():
+    async def test():
+        with tempfile.TemporaryDirectory() as directory, tempfile.NamedTemporaryFile(suffix='.mp3') as source:
+            source.write(b'not really mp3')
+            source.flush()
+            decoders = Decoders(fail=1)
+            cache = PcmCache(directory, decoders=decoders)
+            part, complete = await cache.open(source.name)
+            with pytest.raises(DecoderError):
+                await complete
+            assert not os.path.exists(part)
+            assert cache.lookup(await cache.key(source.name)) is None
+
+            path, complete = await cache.open(source.name)
+            await complete
+            assert decoders.decodes == 2
+            assert os.path.getsize(cache.lookup(await cache.key(source.name))) == 1920
+    asyncio.run(test())
+
+def test_eviction_keeps_lock_files():
+    async def test():
+        with tempfile.TemporaryDirectory() as directory:
+            cache = PcmCache(directory, max_bytes=1920, decoders=Decoders())
+            keys = []
+            for i in range(2):
+                with tempfile.NamedTemporaryFile(suffix='.mp3') as source:
+                    source.write(b'song %d' % i)
+                    source.flush()
+                    keys.append(await cache.key(source.name))
+                    _, complete = await cache.open(source.name)
+                    await complete
+            assert cache.evictions == 1
+            assert cache.lookup(keys[0]) is None
+            for key in keys:
+                assert os.path.exists(cache._path(key) + '.lock')
+    asyncio.run(test())
+
+def test_same_content_is_decoded_once():
+    async def test():
+        with tempfile.TemporaryDirectory() as directory, \
+                tempfile.NamedTemporaryFile(suffix='.mp3') as first, tempfile.NamedTemporaryFile(suffix='.ogg') as copy:
+            for source in (first, copy):
+                source.write(b'the same song')
+                source.flush()
+            decoders = Decoders()
+            cache = PcmCache(directory, decoders=decoders)
+            opened = await asyncio.gather(*(cache.open(source.name) for source in (first, copy, first, copy)))
+            key = await cache.key(first.name)
+            assert key == await cache.key(copy.name)
+            assert all( path.startswith(cache._path(key)) for path, _ in opened ) # the entry, or its part file
+            await asyncio.gather(*(complete for _, complete in opened))
+            assert decoders.decodes == 1
+            path, complete = await cache.open(copy.name)
+            assert complete.done() and os.path.getsize(path) == 1920
+            _, complete = await cache.open(first.name, sample_rate=44100) # another entry of the same content
+            await complete
+            assert decoders.decodes == 2
+            stats = cache.stats()
+            # the others shared the first decode, or found it done depending on how long hashing took
+            assert stats['misses'] == 2 and stats['coalesced'] + stats['hits'] == 4
+    asyncio.run(test())
+
+def test_least_recently_used_is_evicted():
+    async def test():
+        with tempfile.TemporaryDirectory() as directory:
+            cache = PcmCache(directory, max_bytes=2 * 1920, decoders=Decoders())
+            keys = []
+            for i in range(3):
+                with tempfile.NamedTemporaryFile(suffix='.mp3') as source:
+                    source.write(b'song %d' % i)
+                    source.flush()
+                    keys.append(await cache.key(source.name))
+                    _, complete = await cache.open(source.name)
+                    await complete
+                await asyncio.sleep(0.01)
+                if i == 1:
+                    assert cache.lookup(keys[0]) # played again, now more recent than the second
+            assert cache.lookup(keys[1]) is None
+            assert cache.lookup(keys[0]) and cache.lookup(keys[2])
+            assert cache.stats()['bytes'] == 2 * 1920
+    asyncio.run(test())
+
+def test_entry_decoded_by_another_process_is_waited_for():
+    async def test():
+        with tempfile.TemporaryDirectory() as directory, tempfile.NamedTemporaryFile(suffix='.mp3') as source:
+            source.write(b'song')
+            source.flush()
+            decoders = Decoders()
+            cache = PcmCache(directory, decoders=decoders)
+            key = await cache.key(source.name)
+            lock = os.open(cache._path(key) + '.lock', os.O_RDONLY | os.O_CREAT) # its own open file, like another process
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            opening = asyncio.get_event_loop().create_task(cache.open(source.name))
+            await asyncio.sleep(0.1)
+            assert not opening.done()
+            with open(cache._path(key), 'wb') as entry:
+                entry.write(bytes(1920))
+            os.close(lock)
+            path, complete = await asyncio.wait_for(opening, 5)
+            assert path == cache._path(key) and complete.done()
+            assert decoders.decodes == 0 and cache.hits == 1
+    asyncio.run(test())
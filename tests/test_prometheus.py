@@ -0,0 +1,19 @@
+import asyncio
+
+import pytest
+
+from pytgcalls import prometheus
+
+def test_metrics_are_served_locally():
+    aiohttp = pytest.importorskip('aiohttp')
+    async def test():
+        runner = await prometheus.serve(lambda: 'pytgcalls_up 1\n', port=0)
+        try:
+            host, port = runner.addresses[0]
+            assert host == '127.0.0.1'
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f'http://{host}:{port}/metrics') as response:
+                    assert await response.text() == 'pytgcalls_up 1\n'
+        finally:
+            await runner.cleanup()
+    asyncio.run(test())
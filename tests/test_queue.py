@@ -0,0 +1,30 @@
+import asyncio
+import logging
+
+from pytgcalls.groupcall import GroupCall
+
+from benchmarks.fakes import FakeClient
+
+from .test_groupcall import CHAT_ID, silence
+
+def test_unplayable_queued_source_is_skipped(core, caplog):
+    async def test():
+        with silence(1) as first, silence(1) as second, silence(1) as third:
+            call = GroupCall(FakeClient(), CHAT_ID)
+            await call.join_group_call(first.name)
+            await call.enqueue(second.name)
+            await call.enqueue('/nonexistent/missing.raw')
+            await call.enqueue(third.name)
+            assert call.queued == [second.name, '/nonexistent/missing.raw', third.name]
+
+            await call._on_track_changed({'track': call.upcoming.id}) # as NodeJS sends it when second starts
+            for _ in range(100):
+                if call.upcoming:
+                    break
+                await asyncio.sleep(0.01)
+            assert call.track.source == second.name
+            assert call.queued == [third.name]
+            await call.leave_group_call()
+    with caplog.at_level(logging.ERROR, logger='pytgcalls.session'):
+        core(test)
+    assert 'skipping it' in caplog.text
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from pytgcalls import js_core
+from pytgcalls.groupcall import GroupCall
+from pytgcalls.node_worker import CoreDied
+
+from benchmarks.fakes import FakeClient
+
+from .test_groupcall import CHAT_ID, silence
+
+def test_sessions_are_replayed_after_a_crash(core):
+    async def test():
+        with silence(10) as source:
+            reconnected = {}
+            def listen(call:GroupCall) -> None:
+                reconnected[call.sid] = asyncio.get_event_loop().create_future()
+                async def on_reconnect(packet:dict) -> None:
+                    reconnected[call.sid].set_result(packet)
+                call.on('reconnect')(on_reconnect)
+
+            playing = GroupCall(FakeClient(), CHAT_ID)
+            await playing.join_group_call(source.name, start=2.0) # first command
+            listen(playing)
+            starting = GroupCall(FakeClient(), CHAT_ID - 1) # placed, not joined yet
+            await js_core.instance().init(starting.sid)
+            starting._listen()
+            listen(starting)
+
+            await asyncio.sleep(0.3)
+            assert 'cache_bytes' in await playing.stats() # second command
+            before = playing.position
+            killed = asyncio.get_event_loop().time()
+            with pytest.raises(CoreDied):
+                await playing.stats() # third command, the core dies on it
+            events = await asyncio.wait_for(asyncio.gather(*reconnected.values()), 10)
+            elapsed = asyncio.get_event_loop().time() - killed
+
+            assert events[0]['recovered'] and playing.state == 'playing'
+            assert before - 0.05 <= playing.position <= before + elapsed + 0.05
+            assert not events[1]['recovered'] and starting.state == 'lost'
+            await playing.leave_group_call()
+            await js_core.instance().clear(starting.sid)
+    core(test, crash_after=2) # a restarted core dies after 2 commands too
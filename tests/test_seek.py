@@ -0,0 +1,74 @@
+import os
+import sys
+import asyncio
+import tempfile
+
+from typing import Iterator
+
+import pytest
+
+from pytgcalls.groupcall import GroupCall
+from pytgcalls.seek_index import SeekIndexCache
+
+from benchmarks.fakes import FakeClient
+
+from .test_groupcall import CHAT_ID, silence
+
+# stands for ffprobe listing the packets of a 2 hour mp3, 1152 samples at 44.1kHz and 417 bytes each.
+# Every run is counted in the file next to it
+FFPROBE = """#!{python}
+import os, sys
+with open(os.path.join(os.path.dirname(sys.argv[0]), 'runs'), 'a') as f:
+    f.write('run\\n')
+print('N/A,N/A')
+out = []
+for i in range(int(7200 / 0.026122)):
+    out.append(f'{{i * 0.026122:.6f}},{{i * 417}}')
+print('\\n'.join(out))
+"""
+
+@pytest.fixture
+def ffprobe() -> Iterator[str]:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'ffprobe')
+        with open(path, 'w') as f:
+            f.write(FFPROBE.format(python=sys.executable))
+        os.chmod(path, 0o755)
+        yield path
+
+def runs(ffprobe:str) -> int:
+    with open(os.path.join(os.path.dirname(ffprobe), 'runs')) as f:
+        return len(f.readlines())
+
+def test_index_is_built_once_and_thinned(ffprobe):
+    async def test():
+        with tempfile.TemporaryDirectory() as directory, tempfile.NamedTemporaryFile(suffix='.mp3') as source:
+            cache = SeekIndexCache(directory, ffprobe=ffprobe)
+            first, second = await asyncio.gather(cache.get(source.name), cache.get(source.name))
+            assert first is second and runs(ffprobe) == 1 # built once for both
+            gaps = [ b - a for a, b in zip(first.times, first.times[1:]) ]
+            assert 1.0 <= min(gaps) and max(gaps) < 1.0 + 0.026122 # the first packet a second or more later
+            seconds, offset = first.lookup(5400.5) # minute 90
+            assert 5400.5 - 1.03 < seconds <= 5400.5
+            assert offset == round(seconds / 0.026122) * 417
+            assert first.lookup(-1) == (0.0, 0)
+
+            elsewhere = SeekIndexCache(directory, ffprobe=ffprobe) # like another process, or after a restart
+            assert (await elsewhere.get(source.name)).lookup(5400.5) == (seconds, offset)
+            assert runs(ffprobe) == 1 # loaded from disk
+
+            assert await cache.get(source.name.replace('.mp3', '.ogg')) is None # ffmpeg seeks in containers itself
+    asyncio.run(test())
+
+def test_raw_file_seeks_to_its_frame(core):
+    async def test():
+        with silence(120) as source:
+            call = GroupCall(FakeClient(), CHAT_ID)
+            await call.join_group_call(source.name)
+            await call.seek(90.004) # rounded to its 10ms frame
+            assert 90.0 <= call.position < 90.5
+            assert call._byte_offset(90.0) == 90 * 96000
+            await asyncio.sleep(1.1) # a report of the core since
+            assert 91.0 <= call.position < 91.5
+            await call.leave_group_call()
+    core(test)
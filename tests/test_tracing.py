@@ -0,0 +1,61 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytest
+
+from pytgcalls import tracing
+from pytgcalls.groupcall import GroupCall, JoinError
+
+from benchmarks.fakes import FakeClient
+
+from .test_groupcall import CHAT_ID, silence
+
+class Recorder(tracing.Tracer):
+    def __init__(self):
+        self.spans : List[Tuple[str, Dict[str, Any], Optional[BaseException]]] = []
+
+    def start(self, name:str, attrs:Dict[str, Any]) -> Any:
+        return name, attrs
+
+    def end(self, token:Any, error:Optional[BaseException]) -> None:
+        self.spans.append((*token, error))
+
+@pytest.fixture
+def recorder():
+    tracer = Recorder()
+    tracing.set_tracer(tracer)
+    try:
+        yield tracer
+    finally:
+        tracing.set_tracer(None)
+
+def test_join_commands_and_updates_are_traced(core, recorder):
+    async def test():
+        with silence(10) as source:
+            client = FakeClient()
+            call = GroupCall(client, CHAT_ID)
+            await call.join_group_call(source.name)
+            await call.pause_stream()
+            await client.emit(client.group_call_update(CHAT_ID))
+            await call.leave_group_call()
+    core(test)
+    names = [ name for name, _, _ in recorder.spans ]
+    assert names.index('build_cache') < names.index('join_rpc') < names.index('join') # nested in join
+    ipc = [ attrs['action'] for name, attrs, _ in recorder.spans if name == 'ipc' ]
+    assert ipc == ['join_call', 'pause', 'leave_call']
+    assert ('dispatch', {'update': 'UpdateGroupCall'}, None) in recorder.spans
+    assert all( error is None for _, _, error in recorder.spans )
+
+def test_failed_join_ends_its_spans_with_the_error(core, recorder):
+    async def test():
+        with silence(10) as source:
+            client = FakeClient()
+            client.floods['JoinGroupCall'] = 5
+            with pytest.raises(JoinError):
+                await GroupCall(client, CHAT_ID).join_group_call(source.name)
+    core(test)
+    errors = { name: type(error).__name__ for name, _, error in recorder.spans if error is not None }
+    assert errors == {'join_rpc': 'FloodWait', 'join': 'JoinError'}
+
+def test_disabled_tracing_costs_no_span():
+    assert tracing.TRACER is None
+    assert tracing.span('join', chat_id=CHAT_ID) is tracing.NO_SPAN # the same object every time, nothing built
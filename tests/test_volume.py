@@ -0,0 +1,74 @@
+import os
+import json
+import asyncio
+import subprocess
+
+from pytgcalls.groupcall import GroupCall, VOLUME_DEBOUNCE, VOLUME_MAX_DELAY
+
+from benchmarks.fakes import FakeClient
+
+from .conftest import DIST, needs_core
+from .test_groupcall import CHAT_ID
+
+def test_rapid_volume_changes_send_the_latest_once():
+    async def test():
+        client = FakeClient()
+        call = GroupCall(client, CHAT_ID)
+        await call.initialized.wait()
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        await asyncio.gather(*(call.set_volume(volume) for volume in range(50, 70)))
+        assert client.requests['EditGroupCallParticipant'] == 1
+        assert call._volume_applied == 69
+        assert loop.time() - start >= VOLUME_DEBOUNCE
+    asyncio.run(test())
+
+def test_slider_sends_at_most_every_max_delay():
+    async def test():
+        client = FakeClient()
+        call = GroupCall(client, CHAT_ID)
+        await call.initialized.wait()
+        sent = []
+        for volume in range(25): # dragged for 2.5s, never still for VOLUME_DEBOUNCE
+            sent.append(asyncio.get_event_loop().create_task(call.set_volume(volume)))
+            await asyncio.sleep(0.1)
+        await asyncio.gather(*sent)
+        assert client.requests['EditGroupCallParticipant'] <= 2.5 / VOLUME_MAX_DELAY + 1
+        assert call._volume_applied == 24
+    asyncio.run(test())
+
+def test_flooded_volume_change_is_retried():
+    async def test():
+        client = FakeClient()
+        client.floods['EditGroupCallParticipant'] = 1
+        call = GroupCall(client, CHAT_ID)
+        await call.initialized.wait()
+        await call.set_volume(80)
+        assert client.requests['EditGroupCallParticipant'] == 2 # once the flood wait was over
+        assert call._volume_applied == 80
+    asyncio.run(test())
+
+# a constant frame through a gain lowered to half over 480 samples, then raised to saturation at once
+RAMP = """
+const { Gain } = require(process.argv[1]);
+const gain = new Gain();
+const frame = new Int16Array(960).fill(10000);
+const unity = gain.apply(frame) === frame;
+gain.set(0.5, 480);
+const ramped = Array.from(gain.apply(frame));
+const steps = ramped.slice(1).map((sample, i) => ramped[i] - sample);
+gain.set(4, 0);
+const loud = Array.from(gain.apply(frame));
+console.log(JSON.stringify({ unity, first: ramped[0], last: ramped[959], maxStep: Math.max(...steps),
+    minStep: Math.min(...steps), loud: [Math.min(...loud), Math.max(...loud)], input: frame[0] }));
+"""
+
+@needs_core('gain.js')
+def test_gain_ramps_without_clicks():
+    res = subprocess.run(['node', '-e', RAMP, os.path.join(DIST, 'gain.js')], capture_output=True, check=True, timeout=30)
+    result = json.loads(res.stdout)
+    assert result['unity'] # passed through untouched
+    assert result['first'] > 9900 and result['last'] == 5000 # ramped down, sample by sample
+    assert 0 <= result['minStep'] and result['maxStep'] <= 11
+    assert result['loud'] == [32767, 32767] # saturated instead of wrapping around
+    assert result['input'] == 10000 # the frame handed in may be shared, it's never scaled in place